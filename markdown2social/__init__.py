@@ -12,9 +12,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import logging
 import os
 import sys
+import thread
 
 # Program name to use for log messages.
 PROGRAM_NAME = os.path.basename(sys.argv[0])
@@ -26,6 +26,8 @@ def _build_logger():
     Returns:
         Logger.  The logger instance to use for the application.
     """
+    import logging  # Deferred to keep the startup of the program fast.
+
     handler = logging.StreamHandler()
 
     formatter = logging.Formatter(PROGRAM_NAME + ': %(levelname)s: %(message)s')
@@ -37,5 +39,69 @@ def _build_logger():
     return logger
 
 
-# Global logger instance for the application.
-LOGGER = _build_logger()
+# Logger.  Global logger instance for the application, built on first use by
+# get_logger().
+_logger = None
+
+# thread.LockType.  Protects the construction of _logger so that threads
+# racing to log their first message do not attach duplicate handlers.
+_logger_lock = thread.allocate_lock()
+
+
+def get_logger():
+    """Returns the global logger for the program, building it if necessary.
+
+    Returns:
+        Logger.  The logger instance to use for the application.
+    """
+    global _logger  # pylint: disable=global-statement
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                _logger = _build_logger()
+    return _logger
+
+
+class _LoggerProxy(object):
+    """Stands for the global logger until it is built by get_logger().
+
+    Python 2 modules cannot compute their attributes on demand, so the LOGGER
+    attribute is an instance of this class that forwards every attribute
+    access to the real logger.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_logger(), name)
+
+    def __setattr__(self, name, value):
+        setattr(get_logger(), name, value)
+
+    def __repr__(self):
+        return repr(get_logger())
+
+
+def error_message(error):
+    """Describes an exception for an error report.
+
+    On Python 2, str() fails on exceptions with non-ASCII unicode messages and
+    unicode() fails on exceptions with non-ASCII byte messages, such as an
+    IOError about a file with a non-ASCII name.
+
+    Args:
+        error: Exception.  The exception to describe.
+
+    Returns:
+        str.  The UTF-8 encoded message of the exception, or the name of its
+        class if the message is empty.
+    """
+    try:
+        message = str(error)
+    except UnicodeError:
+        message = unicode(error).encode('utf-8')
+    return message or error.__class__.__name__
+
+
+# _LoggerProxy.  Global logger instance for the application.  Kept for
+# compatibility with code written before get_logger(), which new code should
+# call instead.
+LOGGER = _LoggerProxy()
@@ -15,18 +15,337 @@
 
 """Entry point to the markdown2social command-line utility."""
 
-import codecs
-import fileinput
-import frontmatter
 import optparse
 import os
 import sys
 
 import markdown2social
-from markdown2social import config
-from markdown2social import converter
+from markdown2social import fileio
 from markdown2social import package
 
+# The modules that pull in python-markdown, the YAML parser and the networking
+# and multiprocessing machinery are imported lazily by the functions that need
+# them so that --help, --version, usage errors and conversions delegated to a
+# server do not pay for loading them.
+
+
+# str.  Environment variable that, if set, points to the socket of a running
+# server to which to delegate conversions.
+_SOCKET_ENV_VAR = 'MARKDOWN2SOCIAL_SOCKET'
+
+
+# str.  Configuration file to load when --config_file is not given.
+_DEFAULT_CONFIG_FILE = '~/.config/markdown2social.conf'
+
+
+def _config_file(options):
+    """Gets the path to the configuration file.
+
+    Args:
+        options: optparse.Values.  The parsed command-line options.
+
+    Returns:
+        str.  The file given by --config_file or the default one.
+    """
+    return options.config_file or _DEFAULT_CONFIG_FILE
+
+
+def _load_config(prog_name, options):
+    """Loads the configuration file given on the command line.
+
+    Args:
+        prog_name: str.  Name of the program for error messages.
+        options: optparse.Values.  The parsed command-line options.
+
+    Returns:
+        config._Config.  The loaded configuration, or None if it could not be
+        loaded, in which case an error has already been reported.
+    """
+    from markdown2social import config
+
+    try:
+        return config.load_config(os.path.expanduser(_config_file(options)),
+                                  instrument=options.rule_stats)
+    except config.Error as e:
+        sys.stderr.write('%s: error: Failed to load %s: %s' % (
+            prog_name, _config_file(options), e))
+        return None
+
+
+# str.  Output format generated when --formats is not given.
+_DEFAULT_FORMAT = 'gplus'
+
+# tuple(str).  Names of the supported output formats.  Kept in sync with
+# converter.output_formats() by a test so that parsing the command line does
+# not need to import the converter.
+_OUTPUT_FORMATS = ('gplus', 'plain')
+
+# str.  Name of the default parsing pipeline.
+_DEFAULT_PIPELINE = 'full'
+
+# tuple(str).  Names of the supported parsing pipelines.  Kept in sync with
+# converter.pipelines() by a test for the same reason as _OUTPUT_FORMATS.
+_PIPELINES = ('full', 'lean')
+
+# tuple(tuple(str, tuple(str))).  Options that cannot be combined, as pairs of
+# an option and the options that cannot be given along with it.  Options are
+# named by their destination, which matches their long name.
+_EXCLUSIVE_OPTIONS = (
+    ('formats', ('batch', 'tree', 'serve', 'watch', 'socket')),
+    ('fast_path', ('batch', 'tree', 'serve', 'watch', 'socket')),
+    ('pipeline', ('batch', 'tree', 'serve', 'watch', 'socket')),
+    ('rule_stats', ('batch', 'tree', 'serve', 'watch', 'socket',
+                    'block_cache')),
+    ('batch', ('output_file', 'socket', 'profile', 'stats', 'block_cache')),
+    ('tree', ('output_file', 'batch', 'serve', 'socket', 'watch', 'profile',
+              'stats', 'block_cache')),
+    ('serve', ('output_file', 'batch', 'socket', 'watch')),
+    ('watch', ('output_file', 'batch', 'socket', 'profile', 'stats',
+               'block_cache')),
+    ('socket', ('config_file', 'profile', 'stats')),
+    ('cache_dir', ('no_cache',)),
+    ('block_cache', ('stats',)),
+)
+
+
+def _parse_and_convert(raw_input, replacements, formats, stats=None,
+                       block_cache=None, fast_path=False,
+                       pipeline=_DEFAULT_PIPELINE):
+    """Converts a raw document locally.
+
+    Args:
+        raw_input: unicode.  The document to convert, including its Front
+            Matter.
+        replacements: replacement.ReplacementSet.  The replacements to apply.
+        formats: list(str).  Names of the output formats to generate.
+        stats: converter.Stats.  If not None, the statistics to update.
+        block_cache: blockcache.BlockCache.  If not None, the cache of
+            formatted blocks to use.
+        fast_path: bool.  Whether to parse the document with the fast parser
+            when possible.
+        pipeline: str.  Name of the parsing pipeline to use.
+
+    Returns:
+        dict(str, unicode).  The converted document keyed by format.
+    """
+    from markdown2social import converter
+    from markdown2social import front_matter
+
+    metadata, content = front_matter.parse(raw_input,
+                                           keys=converter.METADATA_KEYS)
+    gplus_converter = converter.Converter(replacements=replacements,
+                                          block_cache=block_cache,
+                                          fast_path=fast_path,
+                                          pipeline=pipeline)
+    return gplus_converter.convert_formats(metadata, content, formats,
+                                           stats=stats)
+
+
+def _write_stats(output, stats):
+    """Writes the statistics of a conversion in human-readable form.
+
+    Args:
+        output: file.  Stream to write the statistics to.
+        stats: converter.Stats.  The statistics to write.
+    """
+    for stage in stats.STAGES:
+        output.write('time.%s: %.2f ms\n' % (stage, stats.times[stage] * 1e3))
+    for tag, count in sorted(stats.elements.iteritems()):
+        output.write('elements.%s: %d\n' % (tag, count))
+    output.write('replacement_hits: %d\n' % stats.replacement_hits)
+    output.write('entities: %d\n' % stats.entities)
+
+
+def _write_rule_stats(output, replacements):
+    """Writes the measurements of each replacement rule, costliest first.
+
+    Args:
+        output: file.  Stream to write the report to.
+        replacements: replacement.ReplacementSet.  The instrumented
+            replacements, or None if there are none.
+    """
+    output.write('%10s %8s %8s  %s\n' % ('time (ms)', 'matches', 'nodes',
+                                         'rule'))
+    if replacements is None:
+        return
+    for rule in sorted(replacements.rule_stats,
+                       key=lambda rule: (-rule.time, rule.index)):
+        output.write('%10.2f %8d %8d  %d: %s -> %s\n' % (
+            rule.time * 1e3, rule.matches, rule.nodes, rule.index,
+            rule.regex, rule.subst))
+
+
+def _cache_dir(options):
+    """Gets the directory of the cache of converted documents.
+
+    Args:
+        options: optparse.Values.  The parsed command-line options.
+
+    Returns:
+        str.  The directory given by --cache_dir or the default one.
+    """
+    if options.cache_dir:
+        return os.path.expanduser(options.cache_dir)
+
+    from markdown2social import doccache
+
+    return doccache.default_cache_dir()
+
+
+def _main_batch(prog_name, options, args, cfg):
+    """Implements the batch mode of the program.
+
+    Args:
+        prog_name: str.  Name of the program for error messages.
+        options: optparse.Values.  The parsed command-line options.
+        args: list(str).  The input files to convert.
+        cfg: config._Config.  The loaded configuration.
+
+    Returns:
+        int.  The exit code of the program.
+    """
+    import multiprocessing
+
+    from markdown2social import batch
+
+    output_dir = options.output_dir or '.'
+    jobs = options.jobs or multiprocessing.cpu_count()
+
+    try:
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        failures = batch.convert_files(
+            args, output_dir, replacements=cfg.replacements, jobs=jobs,
+            cache_dir=None if options.no_cache else _cache_dir(options))
+    except (batch.Error, OSError) as e:
+        sys.stderr.write('%s: error: %s\n' % (prog_name, e))
+        return 1
+
+    for input_path, error in failures:
+        sys.stderr.write('%s: error: Failed to convert %s: %s\n' % (
+            prog_name, input_path, error))
+    return 1 if failures else 0
+
+
+def _main_tree(prog_name, options, cfg):
+    """Implements the tree mode of the program.
+
+    Args:
+        prog_name: str.  Name of the program for error messages.
+        options: optparse.Values.  The parsed command-line options.
+        cfg: config._Config.  The loaded configuration.
+
+    Returns:
+        int.  The exit code of the program.
+    """
+    import multiprocessing
+
+    from markdown2social import tree
+
+    try:
+        result = tree.build(
+            options.tree, options.output_dir, replacements=cfg.replacements,
+            jobs=options.jobs or multiprocessing.cpu_count(),
+            cache_dir=None if options.no_cache else _cache_dir(options))
+    except (tree.Error, IOError, OSError) as e:
+        sys.stderr.write('%s: error: %s\n' % (prog_name, e))
+        return 1
+
+    for relpath, error in result.failures:
+        sys.stderr.write('%s: error: Failed to convert %s: %s\n' % (
+            prog_name, relpath, error))
+    return 1 if result.failures else 0
+
+
+def _main_serve(prog_name, options):
+    """Implements the server mode of the program.
+
+    Args:
+        prog_name: str.  Name of the program for error messages.
+        options: optparse.Values.  The parsed command-line options.
+
+    Returns:
+        int.  The exit code of the program.
+    """
+    import socket
+
+    from markdown2social import config
+    from markdown2social import server
+
+    try:
+        daemon = server.Server(options.serve,
+                               os.path.expanduser(_config_file(options)))
+    except config.Error as e:
+        sys.stderr.write('%s: error: Failed to load %s: %s' % (
+            prog_name, _config_file(options), e))
+        return 1
+    except (server.Error, socket.error) as e:
+        sys.stderr.write('%s: error: Cannot listen on %s: %s\n' % (
+            prog_name, options.serve, e))
+        return 1
+
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+    return 0
+
+
+def _main_watch(prog_name, args, cfg):
+    """Implements the watch mode of the program.
+
+    Args:
+        prog_name: str.  Name of the program for error messages.
+        args: list(str).  The input/output pairs given on the command line.
+        cfg: config._Config.  The loaded configuration.
+
+    Returns:
+        int.  The exit code of the program.
+    """
+    from markdown2social import watch
+
+    pairs = [arg.split(':', 1) for arg in args]
+    watcher = watch.Watcher(pairs, replacements=cfg.replacements)
+    try:
+        results = watcher.update()
+        while True:
+            for input_path, error in results:
+                if error is None:
+                    sys.stderr.write('%s: Converted %s\n' % (prog_name,
+                                                             input_path))
+                else:
+                    sys.stderr.write('%s: error: Failed to convert %s: %s\n' %
+                                     (prog_name, input_path, error))
+            sys.stderr.flush()
+            results = watcher.wait(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+def _check_exclusive_options(parser, options):
+    """Rejects the combinations of options listed in _EXCLUSIVE_OPTIONS.
+
+    An option counts as given if its value differs from its default.
+
+    Args:
+        parser: optparse.OptionParser.  The parser of the command line.
+        options: optparse.Values.  The parsed command-line options.
+    """
+    def given(name):
+        return getattr(options, name) != parser.defaults[name]
+
+    for name, others in _EXCLUSIVE_OPTIONS:
+        if given(name):
+            for other in others:
+                if given(other):
+                    parser.error('--%s cannot be used with --%s' % (name,
+                                                                    other))
+
 
 def main(args=None):
     """Program entry point.
@@ -46,41 +365,303 @@ def main(args=None):
                      'files are provided as arguments or if a lone "-" is '
                      'given, the Markdown content is read from stdin.  If no '
                      'output file is specified via --output_file, the output '
-                     'is written to stdout.'),
+                     'is written to stdout.  In --batch mode, each input file '
+                     'is converted into its own output file.  In --tree '
+                     'mode, a directory of documents is mirrored into '
+                     '--output_dir, skipping unchanged documents.  In --serve '
+                     'mode, %prog stays in the background and converts '
+                     'documents on behalf of other invocations that use '
+                     '--socket.  In --watch mode, the arguments are '
+                     'input:output pairs and each output file is rewritten '
+                     'whenever its input file changes.'),
         version='%prog ' + package.VERSION)
     parser.add_option('-c', '--config_file', dest='config_file',
-                      default='~/.config/markdown2social.conf',
-                      help='Configuration file to use')
+                      default=None,
+                      help='Configuration file to use; defaults to %s' %
+                      _DEFAULT_CONFIG_FILE)
     parser.add_option('-o', '--output_file', dest='output_file', default=None,
                       help='File to write the output to; use stdout if empty')
+    parser.add_option('--formats', dest='formats', default=_DEFAULT_FORMAT,
+                      metavar='FORMAT1,..,FORMATN',
+                      help='Comma-separated list of output formats to '
+                      'generate from a single parse; one of %s.  With more '
+                      'than one format, the output of each is written to '
+                      'OUTPUT_FILE.FORMAT' % ', '.join(_OUTPUT_FORMATS))
+    parser.add_option('--batch', dest='batch', action='store_true',
+                      default=False,
+                      help='Convert each input file into its own output file')
+    parser.add_option('--output_dir', dest='output_dir', default=None,
+                      help='Directory to write the output files to in batch '
+                      'and tree modes; use the current directory if empty '
+                      'in batch mode')
+    parser.add_option('-j', '--jobs', dest='jobs', type='int', default=None,
+                      help='Number of files to convert in parallel in batch '
+                      'and tree modes; use the number of CPUs if empty')
+    parser.add_option('--tree', dest='tree', default=None, metavar='DIR',
+                      help='Mirror the Markdown documents in the given '
+                      'directory into --output_dir, converting only those '
+                      'that changed since the previous run')
+    parser.add_option('--serve', dest='serve', default=None, metavar='SOCKET',
+                      help='Run as a server listening on the given socket')
+    parser.add_option('--socket', dest='socket', default=None,
+                      help='Delegate the conversion to the server listening '
+                      'on the given socket; defaults to $' + _SOCKET_ENV_VAR)
+    parser.add_option('--watch', dest='watch', action='store_true',
+                      default=False,
+                      help='Keep running and reconvert the input:output pairs '
+                      'given as arguments whenever the inputs change')
+    parser.add_option('--profile', dest='profile', default=None,
+                      metavar='FILE',
+                      help='Profile the conversion, write the statistics to '
+                      'the given file and print a summary to stderr')
+    parser.add_option('--stats', dest='stats', action='store_true',
+                      default=False,
+                      help='Print timings and counters of the conversion to '
+                      'stderr')
+    parser.add_option('--rule_stats', dest='rule_stats', action='store_true',
+                      default=False,
+                      help='Print the number of matches and the time spent '
+                      'in each replacement rule to stderr, costliest first')
+    parser.add_option('--block_cache', dest='block_cache', default=None,
+                      metavar='FILE',
+                      help='Reuse the formatting of unchanged paragraphs '
+                      'across runs by caching them in the given file')
+    parser.add_option('--fast_path', dest='fast_path', action='store_true',
+                      default=False,
+                      help='Parse documents that only use the subset of '
+                      'Markdown that the converter supports with a faster '
+                      'parser')
+    parser.add_option('--pipeline', dest='pipeline',
+                      default=_DEFAULT_PIPELINE, metavar='NAME',
+                      help='Parsing pipeline to use: %s; lean is faster but '
+                      'only recognizes the Markdown syntax that the output '
+                      'formats support' % ', '.join(_PIPELINES))
+    parser.add_option('--cache_dir', dest='cache_dir', default=None,
+                      metavar='DIR',
+                      help='Directory of the cache of converted documents; '
+                      'defaults to $XDG_CACHE_HOME/markdown2social')
+    parser.add_option('--no_cache', dest='no_cache', action='store_true',
+                      default=False,
+                      help='Do not use the cache of converted documents')
 
     options, args = parser.parse_args(args)
 
+    formats = options.formats.split(',')
+    for output_format in formats:
+        if output_format not in _OUTPUT_FORMATS:
+            parser.error('Unknown output format %s' % output_format)
+    if len(set(formats)) != len(formats):
+        parser.error('--formats cannot list the same format twice')
+    if len(formats) > 1 and not options.output_file:
+        parser.error('--formats with more than one format requires '
+                     '--output_file')
+    if options.pipeline not in _PIPELINES:
+        parser.error('Unknown pipeline %s' % options.pipeline)
+    _check_exclusive_options(parser, options)
+
+    if options.batch:
+        if not args or '-' in args:
+            parser.error('--batch requires one or more input files')
+    if options.tree:
+        if args:
+            parser.error('--tree does not take input files')
+        if not options.output_dir:
+            parser.error('--tree requires --output_dir')
+    if options.batch or options.tree:
+        if options.jobs is not None and options.jobs < 1:
+            parser.error('--jobs must be a positive number')
+    elif options.output_dir or options.jobs is not None:
+        parser.error('--output_dir and --jobs require --batch or --tree')
+    if options.serve:
+        if args:
+            parser.error('--serve does not take input files')
+        return _main_serve(parser.get_prog_name(), options)
+    if options.watch:
+        if not args:
+            parser.error('--watch requires one or more input:output pairs')
+        for arg in args:
+            input_path, _, output_path = arg.partition(':')
+            if not input_path or not output_path or input_path == '-':
+                parser.error('Invalid input:output pair %s' % arg)
+        cfg = _load_config(parser.get_prog_name(), options)
+        if cfg is None:
+            return 1
+        return _main_watch(parser.get_prog_name(), args, cfg)
+    if options.batch:
+        cfg = _load_config(parser.get_prog_name(), options)
+        if cfg is None:
+            return 1
+        return _main_batch(parser.get_prog_name(), options, args, cfg)
+    if options.tree:
+        cfg = _load_config(parser.get_prog_name(), options)
+        if cfg is None:
+            return 1
+        return _main_tree(parser.get_prog_name(), options, cfg)
+
+    socket_path = options.socket or os.environ.get(_SOCKET_ENV_VAR)
+    # The server only generates the default format with the default pipeline
+    # and its own configuration, so we skip it otherwise; an explicit --socket
+    # has already been rejected above.
+    delegate = (socket_path and formats == [_DEFAULT_FORMAT] and
+                options.pipeline == _DEFAULT_PIPELINE and
+                options.config_file is None and
+                not (options.profile or options.stats or options.rule_stats))
+
     cfg = None
-    try:
-        cfg = config.load_config(os.path.expanduser(options.config_file))
-    except config.Error as e:
-        sys.stderr.write('%s: error: Failed to load %s: %s' % (
-            parser.get_prog_name(), options.config_file, e))
-        return 1
-    assert cfg is not None
+    if not delegate:
+        # Report a bad configuration before consuming the input.
+        cfg = _load_config(parser.get_prog_name(), options)
+        if cfg is None:
+            return 1
 
-    raw_input = ''
     try:
-        for line in fileinput.input(args):
-            raw_input += codecs.decode(line, 'utf-8')
-    except IOError, e:
+        raw_input = fileio.read_inputs(args)
+    except IOError as e:
         sys.stderr.write('%s: error: %s\n' % (parser.get_prog_name(), e))
         return 1
 
-    metadata, content = frontmatter.parse(raw_input)
-    gplus = converter.convert(metadata, content, replacements=cfg.replacements)
+    outputs = None
+    streamed = False
+    if delegate:
+        import socket
+
+        from markdown2social import client
+
+        try:
+            outputs = {_DEFAULT_FORMAT: client.convert_remote(socket_path,
+                                                              raw_input)}
+        except socket.error as e:
+            if options.socket:
+                sys.stderr.write('%s: error: Cannot contact server at %s: '
+                                 '%s\n' % (parser.get_prog_name(),
+                                           socket_path, e))
+                return 1
+            # The server was picked up from the environment, so it is fine to
+            # silently fall back to a local conversion if it is not running.
+        except client.Error as e:
+            sys.stderr.write('%s: error: %s\n' % (parser.get_prog_name(), e))
+            return 1
+
+    if outputs is None:
+        if cfg is None:
+            cfg = _load_config(parser.get_prog_name(), options)
+            if cfg is None:
+                return 1
+
+        outputs = {}
+        document_cache = None
+        if not (options.no_cache or options.stats or options.rule_stats or
+                options.profile):
+            from markdown2social import doccache
+
+            document_cache = doccache.DocumentCache(_cache_dir(options))
+            cache_keys = {}
+            for output_format in formats:
+                cache_keys[output_format] = document_cache.key(
+                    raw_input, cfg.replacements, output_format=output_format,
+                    pipeline=options.pipeline)
+                cached = document_cache.get(cache_keys[output_format])
+                if cached is not None:
+                    outputs[output_format] = cached
+
+        missing = [output_format for output_format in formats
+                   if output_format not in outputs]
+        if missing:
+            # Whether the conversion logged warnings, in which case its output
+            # is not cached so that the warnings are repeated on the next run.
+            warned = False
+            stats = None
+            if options.stats:
+                from markdown2social import converter
+
+                stats = converter.Stats()
+
+            block_cache = None
+            if options.block_cache:
+                from markdown2social import blockcache
+
+                block_cache = blockcache.BlockCache(
+                    os.path.expanduser(options.block_cache))
+
+            if options.profile:
+                from markdown2social import profiling
+
+                try:
+                    converted = profiling.profile(
+                        options.profile, sys.stderr, _parse_and_convert,
+                        raw_input, cfg.replacements, missing, stats=stats,
+                        block_cache=block_cache, fast_path=options.fast_path,
+                        pipeline=options.pipeline)
+                except IOError as e:
+                    sys.stderr.write('%s: error: Cannot write profile: %s\n' % (
+                        parser.get_prog_name(), e))
+                    return 1
+            else:
+                from markdown2social import converter
+                from markdown2social import front_matter
+
+                metadata, content = front_matter.parse(
+                    raw_input, keys=converter.METADATA_KEYS)
+                del raw_input  # Release the raw document before the conversion.
+                gplus_converter = converter.Converter(
+                    replacements=cfg.replacements, output_format=formats[0],
+                    block_cache=block_cache, fast_path=options.fast_path,
+                    pipeline=options.pipeline)
+                if len(formats) == 1 and stats is None:
+                    # Write out each paragraph as soon as it is ready instead
+                    # of holding the whole post in memory.
+                    fragments = gplus_converter.iter_convert(metadata, content)
+                    del content
+                    if document_cache is not None:
+                        fragments = document_cache.put_fragments(
+                            cache_keys[formats[0]], fragments)
+                    if options.output_file:
+                        # Keep the previous output if the conversion fails.
+                        fileio.replace_file_fragments(options.output_file,
+                                                      fragments)
+                    else:
+                        fileio.write_fragments(sys.stdout, fragments)
+                    streamed = True
+                else:
+                    from markdown2social import doccache
+
+                    with doccache.WarningMonitor() as monitor:
+                        converted = gplus_converter.convert_formats(
+                            metadata, content, missing, stats=stats)
+                    warned = monitor.warned
+            if not streamed:
+                outputs.update(converted)
+
+            if stats is not None:
+                _write_stats(sys.stderr, stats)
+            if options.rule_stats:
+                _write_rule_stats(sys.stderr, cfg.replacements)
+            if document_cache is not None:
+                if not (streamed or warned):
+                    for output_format in missing:
+                        document_cache.put(cache_keys[output_format],
+                                           outputs[output_format])
+                document_cache.trim()
+            if block_cache is not None:
+                try:
+                    block_cache.save()
+                except (IOError, OSError) as e:
+                    # The cache is only an optimization, so failing to update it
+                    # must not fail the conversion.
+                    markdown2social.get_logger().warning(
+                        'Cannot save block cache %s: %s', options.block_cache,
+                        e)
 
-    if options.output_file:
-        with codecs.open(options.output_file, 'w', 'utf-8') as output:
-            output.write(gplus)
-    else:
-        sys.stdout.write(codecs.encode(gplus, 'utf-8'))
+    if not streamed:
+        if len(formats) > 1:
+            for output_format in formats:
+                fileio.write_file(
+                    '%s.%s' % (options.output_file, output_format),
+                    outputs[output_format])
+        elif options.output_file:
+            fileio.write_file(options.output_file, outputs[formats[0]])
+        else:
+            fileio.write_stream(sys.stdout, outputs[formats[0]])
 
     return 0
 
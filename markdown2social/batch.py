@@ -0,0 +1,196 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Conversion of multiple documents into separate output files."""
+
+import multiprocessing
+import os
+
+import markdown2social
+from markdown2social import converter
+from markdown2social import doccache
+from markdown2social import fileio
+from markdown2social import front_matter
+
+
+# str.  Extension given to the files generated in batch mode.
+OUTPUT_EXTENSION = '.gplus'
+
+
+class Error(Exception):
+    """Base class for exceptions raised by this module."""
+
+
+class DuplicateOutputError(Error):
+    """Error when two input files would be written to the same output file."""
+
+
+# converter.Converter.  Converter used by the current worker process.  Set up
+# once per process by _init_worker() so that the cost of constructing the
+# converter is not paid for every file.
+_worker_converter = None
+
+# doccache.DocumentCache.  Cache of converted documents used by the current
+# worker process, or None.
+_worker_cache = None
+
+
+def output_path_for(input_path, output_dir):
+    """Computes the path to the output file for a given input file.
+
+    Args:
+        input_path: str.  Path to the Markdown document.
+        output_dir: str.  Directory in which to place the output file.
+
+    Returns:
+        str.  Path to the output file.
+    """
+    basename = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, basename + OUTPUT_EXTENSION)
+
+
+def _init_worker(replacements, cache_dir):
+    """Initializes a worker process.
+
+    Args:
+        replacements: collection(tuple(str, str)).  Replacements to configure
+            the converter of this worker with.
+        cache_dir: str.  Directory of the cache of converted documents, or
+            None to not use a cache.
+    """
+    global _worker_converter, _worker_cache  # pylint: disable=global-statement
+    _worker_converter = converter.Converter(replacements=replacements)
+    if cache_dir is None:
+        _worker_cache = None
+    else:
+        _worker_cache = doccache.DocumentCache(cache_dir)
+
+
+def _convert_file(job):
+    """Converts a single file in a worker process.
+
+    Args:
+        job: tuple(str, str).  The path to the input file and the path to the
+            output file.
+
+    Returns:
+        str.  An error message describing why the conversion failed, or None
+        if it succeeded.
+    """
+    input_path, output_path = job
+    try:
+        raw_input = fileio.read_file(input_path)
+        gplus = None
+        if _worker_cache is not None:
+            key = _worker_cache.key(raw_input, _worker_converter.replacements)
+            gplus = _worker_cache.get(key)
+        if gplus is None:
+            metadata, content = front_matter.parse(
+                raw_input, keys=converter.METADATA_KEYS)
+            with doccache.WarningMonitor() as monitor:
+                gplus = _worker_converter.convert(metadata, content)
+            if _worker_cache is not None and not monitor.warned:
+                _worker_cache.put(key, gplus)
+        fileio.write_file(output_path, gplus)
+    except Exception as e:  # pylint: disable=broad-except
+        # A single bad file must not abort the conversion of the rest of the
+        # batch, so report any failure to the caller instead of propagating.
+        return markdown2social.error_message(e)
+    return None
+
+
+def convert_pairs(pairs, replacements=None, jobs=1, cache_dir=None):
+    """Converts a collection of files into the given output files.
+
+    Args:
+        pairs: list(tuple(str, str)).  The paths to the Markdown documents to
+            convert and the paths to the files to write their conversions to.
+            The directories of the output files must exist.
+        replacements: collection(tuple(str, str)).  List of pairs representing
+            a regular expression to match text and its corresponding
+            replacement.  The replacement can use backreferences.
+        jobs: int.  Number of worker processes to use.  If 1, the conversion
+            happens in the current process.
+        cache_dir: str.  Directory of the cache of converted documents to
+            use, or None to convert every file.
+
+    Returns:
+        list(str).  The result of the conversion of each pair, in the same
+        order as they were given in pairs: None if the conversion succeeded
+        or the reason for the failure otherwise.
+    """
+    if jobs == 1 or len(pairs) <= 1:
+        _init_worker(replacements, cache_dir)
+        results = [_convert_file(job) for job in pairs]
+    else:
+        pool = multiprocessing.Pool(min(jobs, len(pairs)),
+                                    initializer=_init_worker,
+                                    initargs=(replacements, cache_dir))
+        try:
+            # map() returns the results in the order of the input regardless
+            # of the order in which the workers complete them.
+            results = pool.map(_convert_file, pairs, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    if cache_dir is not None:
+        doccache.DocumentCache(cache_dir).trim()
+
+    return results
+
+
+def convert_files(input_paths, output_dir, replacements=None, jobs=1,
+                  cache_dir=None):
+    """Converts a collection of files, each into its own output file.
+
+    The output files are placed in output_dir and are named after the input
+    files, with their extension replaced by OUTPUT_EXTENSION.
+
+    Args:
+        input_paths: list(str).  Paths to the Markdown documents to convert.
+        output_dir: str.  Directory in which to place the output files.  Must
+            exist.
+        replacements: collection(tuple(str, str)).  List of pairs representing
+            a regular expression to match text and its corresponding
+            replacement.  The replacement can use backreferences.
+        jobs: int.  Number of worker processes to use.  If 1, the conversion
+            happens in the current process.
+        cache_dir: str.  Directory of the cache of converted documents to
+            use, or None to convert every file.
+
+    Returns:
+        list(tuple(str, str)).  The input files that could not be converted
+        along with the reason for the failure, in the same order as they were
+        given in input_paths.
+
+    Raises:
+        DuplicateOutputError: If two input files map to the same output file.
+    """
+    work = []
+    sources = {}
+    for input_path in input_paths:
+        output_path = output_path_for(input_path, output_dir)
+        if output_path in sources:
+            raise DuplicateOutputError(
+                'Both %s and %s would be written to %s' % (
+                    sources[output_path], input_path, output_path))
+        sources[output_path] = input_path
+        work.append((input_path, output_path))
+
+    results = convert_pairs(work, replacements=replacements, jobs=jobs,
+                            cache_dir=cache_dir)
+    return [(input_path, error)
+            for (input_path, unused_output_path), error in zip(work, results)
+            if error is not None]
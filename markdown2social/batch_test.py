@@ -0,0 +1,152 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import codecs
+import os
+import shutil
+import tempfile
+import unittest
+
+from markdown2social import batch
+
+
+class OutputPathForTest(unittest.TestCase):
+    """Unit tests for the output_path_for function."""
+
+    def test_replaces_extension(self):
+        self.assertEquals('out/post.gplus',
+                          batch.output_path_for('in/post.md', 'out'))
+
+    def test_no_extension(self):
+        self.assertEquals('out/post.gplus',
+                          batch.output_path_for('post', 'out'))
+
+
+class ConvertFilesTest(unittest.TestCase):
+    """Unit tests for the convert_files function."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.tempdir, 'input')
+        self.output_dir = os.path.join(self.tempdir, 'output')
+        os.mkdir(self.input_dir)
+        os.mkdir(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _write_input(self, name, contents):
+        """Creates an input file.
+
+        Args:
+            name: str.  Basename of the file to create.
+            contents: unicode.  Contents of the file.
+
+        Returns:
+            str.  Path to the created file.
+        """
+        path = os.path.join(self.input_dir, name)
+        with codecs.open(path, 'w', 'utf-8') as output:
+            output.write(contents)
+        return path
+
+    def _read_output(self, name):
+        """Reads an output file.
+
+        Args:
+            name: str.  Basename of the file to read.
+
+        Returns:
+            unicode.  Contents of the file.
+        """
+        path = os.path.join(self.output_dir, name)
+        with codecs.open(path, 'r', 'utf-8') as input_file:
+            return input_file.read()
+
+    def _test_convert(self, jobs):
+        """Converts a few files and checks the results.
+
+        Args:
+            jobs: int.  Number of worker processes to use.
+        """
+        inputs = []
+        for i in xrange(5):
+            inputs.append(self._write_input(
+                'post%d.md' % i,
+                u'# Post %d\n\nfoo %s\n' % (i, unichr(0x2014))))
+
+        failures = batch.convert_files(inputs, self.output_dir,
+                                       replacements=[('foo', 'bar')],
+                                       jobs=jobs)
+        self.assertEquals([], failures)
+
+        for i in xrange(5):
+            self.assertEquals(u'*Post %d*\n\nbar %s\n' % (i, unichr(0x2014)),
+                              self._read_output('post%d.gplus' % i))
+
+    def test_serial(self):
+        self._test_convert(1)
+
+    def test_parallel(self):
+        self._test_convert(3)
+
+    def test_bad_file_does_not_abort_batch(self):
+        first = self._write_input('first.md', 'First')
+        missing = os.path.join(self.input_dir, 'missing.md')
+        last = self._write_input('last.md', 'Last')
+
+        failures = batch.convert_files([first, missing, last], self.output_dir,
+                                       jobs=2)
+        self.assertEquals(1, len(failures))
+        self.assertEquals(missing, failures[0][0])
+        self.assertIn('missing.md', failures[0][1])
+
+        self.assertEquals('First\n', self._read_output('first.gplus'))
+        self.assertEquals('Last\n', self._read_output('last.gplus'))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.output_dir, 'missing.gplus')))
+
+    def test_bad_file_with_non_ascii_name(self):
+        missing = os.path.join(self.input_dir, 'caf\xc3\xa9.md')
+        failures = batch.convert_files([missing], self.output_dir)
+        self.assertEquals(1, len(failures))
+        self.assertEquals(missing, failures[0][0])
+        self.assertIn('No such file', failures[0][1])
+
+    def test_failures_in_input_order(self):
+        inputs = [os.path.join(self.input_dir, 'missing%d.md' % i)
+                  for i in xrange(4)]
+        failures = batch.convert_files(inputs, self.output_dir, jobs=4)
+        self.assertEquals(inputs, [input_path for input_path, _ in failures])
+
+    def test_convert_pairs(self):
+        good = self._write_input('good.md', 'Good')
+        missing = os.path.join(self.input_dir, 'missing.md')
+        pairs = [(good, os.path.join(self.output_dir, 'a.txt')),
+                 (missing, os.path.join(self.output_dir, 'b.txt'))]
+        results = batch.convert_pairs(pairs, jobs=2)
+        self.assertEquals(None, results[0])
+        self.assertIn('missing.md', results[1])
+        self.assertEquals('Good\n', self._read_output('a.txt'))
+
+    def test_duplicate_output(self):
+        first = self._write_input('post.md', 'First')
+        second = self._write_input('post.markdown', 'Second')
+        self.assertRaises(batch.DuplicateOutputError, batch.convert_files,
+                          [first, second], self.output_dir)
+        self.assertEquals([], os.listdir(self.output_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
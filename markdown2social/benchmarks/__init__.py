@@ -0,0 +1,49 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Performance benchmarks for markdown2social.
+
+The modules in this package are not tests: they are meant to be run by hand,
+e.g. via "python -m markdown2social.benchmarks.converter_bench", to measure
+the cost of specific operations and to compare them across changes.
+
+The runner module is the entry point to measure the overall throughput of the
+converter over the synthetic corpora defined in the corpus module, and can
+save its results in JSON form to compare releases.
+"""
+
+import time
+
+
+def measure(func, iterations, repeat=3):
+    """Measures the per-iteration cost of a function.
+
+    Args:
+        func: callable().  The function to benchmark.  Takes no arguments.
+        iterations: int.  Number of times to call the function per repetition.
+        repeat: int.  Number of repetitions; the fastest one is reported to
+            minimize the noise caused by other activity on the machine.
+
+    Returns:
+        float.  The cost in seconds of a single call to func.
+    """
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        for _ in xrange(iterations):
+            func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / iterations
@@ -0,0 +1,58 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark for the per-document cost of converter.convert()."""
+
+import sys
+
+from markdown2social import benchmarks
+from markdown2social import converter
+
+
+# Short post representative of the bulk of the documents we convert.
+_SHORT_POST = u'''Some text with *emphasis*, a [link](http://example.com/) and
+a bit of `code` in it.
+
+* First item.
+* Second item.
+'''
+
+# Replacements representative of a typical configuration file.
+_REPLACEMENTS = [
+    (r'(\A|\s)(magic/[0-9_-]+)', r'\1http://\2'),
+    (r'^anchored', r'replaced'),
+]
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    metadata = {'title': 'The title'}
+    iterations = 500
+
+    one_off = benchmarks.measure(
+        lambda: converter.convert(metadata, _SHORT_POST,
+                                  replacements=_REPLACEMENTS),
+        iterations)
+
+    reused = converter.Converter(replacements=_REPLACEMENTS)
+    amortized = benchmarks.measure(
+        lambda: reused.convert(metadata, _SHORT_POST), iterations)
+
+    sys.stdout.write('convert():           %8.1f us/doc\n' % (one_off * 1e6))
+    sys.stdout.write('Converter.convert(): %8.1f us/doc\n' % (amortized * 1e6))
+    sys.stdout.write('speedup:             %8.1fx\n' % (one_off / amortized))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Generator of synthetic corpora for the benchmarks.
+
+Every corpus is generated from a fixed seed so that the same scale always
+yields the same documents, which is what makes the results comparable across
+runs and releases.
+"""
+
+import collections
+import random
+
+
+# Representation of a corpus.
+#
+# name: str.  Short identifier of the corpus.
+# description: str.  One-line description of what the corpus exercises.
+# documents: list(unicode).  Raw documents, including their Front Matter.
+# replacements: list(tuple(str, str)).  Replacements to convert the documents
+#     with, or None.
+Corpus = collections.namedtuple(
+    'Corpus', ['name', 'description', 'documents', 'replacements'])
+
+
+# list(unicode).  Vocabulary used to build sentences.
+_WORDS = [
+    u'actually', u'build', u'code', u'daemon', u'editor', u'file', u'git',
+    u'header', u'input', u'kernel', u'lists', u'markdown', u'network',
+    u'output', u'parser', u'quite', u'release', u'social', u'text', u'unicode',
+    u'version', u'website', u'yaml', u'zero', u'caf\xe9', u'na\xefve',
+]
+
+# list(unicode).  Entities used in entity-dense text.
+_ENTITIES = [u'&mdash;', u'&amp;', u'&lt;', u'&gt;', u'&quot;', u'&#x2014;',
+             u'&#169;', u'&hellip;', u'&nbsp;']
+
+
+def _sentence(rng, words=12):
+    """Generates a sentence with some inline markup.
+
+    Args:
+        rng: random.Random.  Source of randomness.
+        words: int.  Number of words in the sentence.
+
+    Returns:
+        unicode.  The generated sentence.
+    """
+    parts = []
+    for _ in xrange(words):
+        word = rng.choice(_WORDS)
+        markup = rng.random()
+        if markup < 0.05:
+            word = u'*%s*' % word
+        elif markup < 0.08:
+            word = u'**%s**' % word
+        elif markup < 0.10:
+            word = u'`%s`' % word
+        elif markup < 0.12:
+            word = u'[%s](http://example.com/%s)' % (word, rng.randint(0, 999))
+        parts.append(word)
+    return u' '.join(parts).capitalize() + u'.'
+
+
+def _paragraph(rng, sentences=5):
+    """Generates a paragraph wrapped at a reasonable width.
+
+    Args:
+        rng: random.Random.  Source of randomness.
+        sentences: int.  Number of sentences in the paragraph.
+
+    Returns:
+        unicode.  The generated paragraph, without a trailing newline.
+    """
+    text = u' '.join(_sentence(rng) for _ in xrange(sentences))
+    lines = []
+    line = []
+    width = 0
+    for word in text.split(u' '):
+        if width + len(word) > 72 and line:
+            lines.append(u' '.join(line))
+            line = []
+            width = 0
+        line.append(word)
+        width += len(word) + 1
+    lines.append(u' '.join(line))
+    return u'\n'.join(lines)
+
+
+def _front_matter(title):
+    """Generates a YAML Front Matter block.
+
+    Args:
+        title: unicode.  Title of the post.
+
+    Returns:
+        unicode.  The Front Matter block, including its delimiters.
+    """
+    return u'---\ntitle: %s\n---\n' % title
+
+
+def _sized_documents(rng, size, make_document):
+    """Generates documents until they reach a total size.
+
+    Args:
+        rng: random.Random.  Source of randomness.
+        size: int.  Approximate total size of the documents in characters.
+        make_document: callable(random.Random, int) -> unicode.  Generator of
+            a single document given its index.
+
+    Returns:
+        list(unicode).  The generated documents.
+    """
+    documents = []
+    total = 0
+    while total < size:
+        document = make_document(rng, len(documents))
+        documents.append(document)
+        total += len(document)
+    return documents
+
+
+def long_posts(scale=1.0):
+    """Generates long posts with sections, lists and inline markup."""
+    def make_document(rng, index):
+        chunks = [_front_matter(u'Long post %d' % index)]
+        for section in xrange(8):
+            chunks.append(u'## Section %d\n' % section)
+            for _ in xrange(3):
+                chunks.append(_paragraph(rng) + u'\n')
+            chunks.append(u''.join(u'* %s\n' % _sentence(rng, 6)
+                                   for _ in xrange(4)))
+        return u'\n'.join(chunks)
+
+    rng = random.Random(1)
+    return Corpus('long_posts', 'Long posts with sections and lists',
+                  _sized_documents(rng, int(200000 * scale), make_document),
+                  None)
+
+
+def nested_lists(scale=1.0):
+    """Generates documents made of deeply nested mixed lists."""
+    def make_document(rng, index):
+        lines = [_front_matter(u'Lists %d' % index)]
+        for _ in xrange(10):
+            depth = 0
+            for _ in xrange(40):
+                depth = max(0, min(15, depth + rng.choice([-1, 0, 1, 1])))
+                bullet = u'1.' if rng.random() < 0.3 else u'*'
+                lines.append(u'%s%s %s' % (u'    ' * depth, bullet,
+                                           _sentence(rng, 5)))
+            lines.append(u'')
+        return u'\n'.join(lines)
+
+    rng = random.Random(2)
+    return Corpus('nested_lists', 'Lists nested up to 16 levels deep',
+                  _sized_documents(rng, int(100000 * scale), make_document),
+                  None)
+
+
+def entity_dense(scale=1.0):
+    """Generates text in which almost every word is next to an entity."""
+    def make_document(rng, index):
+        paragraphs = [_front_matter(u'Entities %d' % index)]
+        for _ in xrange(20):
+            words = []
+            for _ in xrange(60):
+                words.append(rng.choice(_WORDS) + rng.choice(_ENTITIES))
+            paragraphs.append(u' '.join(words) + u'\n')
+        return u'\n'.join(paragraphs)
+
+    rng = random.Random(3)
+    return Corpus('entity_dense', 'Text with an entity after every word',
+                  _sized_documents(rng, int(100000 * scale), make_document),
+                  None)
+
+
+def code_blocks(scale=1.0):
+    """Generates documents with huge code blocks.
+
+    The parser does not enable the fenced code extension, so the blocks are
+    indented, which is the only code block syntax the converter supports.
+    """
+    def make_document(rng, index):
+        chunks = [_front_matter(u'Code %d' % index), _paragraph(rng) + u'\n']
+        for _ in xrange(2):
+            lines = []
+            for line in xrange(1000):
+                lines.append(u'    %sdef f%d(x): return x * %d  # *%s*' % (
+                    u'    ' * rng.randint(0, 3), line, line,
+                    rng.choice(_WORDS)))
+            chunks.append(u'\n'.join(lines) + u'\n')
+            chunks.append(_paragraph(rng) + u'\n')
+        return u'\n'.join(chunks)
+
+    rng = random.Random(4)
+    return Corpus('code_blocks', 'Code blocks with thousands of lines',
+                  _sized_documents(rng, int(200000 * scale), make_document),
+                  None)
+
+
+def link_heavy(scale=1.0):
+    """Generates paragraphs made almost exclusively of links."""
+    def make_document(rng, index):
+        paragraphs = [_front_matter(u'Links %d' % index)]
+        references = []
+        for paragraph in xrange(20):
+            links = []
+            for link in xrange(30):
+                word = rng.choice(_WORDS)
+                if rng.random() < 0.5:
+                    links.append(u'[%s](http://example.com/%d/%d)' % (
+                        word, paragraph, link))
+                else:
+                    name = u'ref%d_%d' % (paragraph, link)
+                    links.append(u'[%s][%s]' % (word, name))
+                    references.append(u'[%s]: http://example.org/%s' % (
+                        name, name))
+            paragraphs.append(u' '.join(links) + u'\n')
+        paragraphs.append(u'\n'.join(references) + u'\n')
+        return u'\n'.join(paragraphs)
+
+    rng = random.Random(5)
+    return Corpus('link_heavy', 'Paragraphs made of inline and reference links',
+                  _sized_documents(rng, int(100000 * scale), make_document),
+                  None)
+
+
+def large_config(scale=1.0):
+    """Generates long posts to convert with thousands of replacements."""
+    rng = random.Random(6)
+    replacements = []
+    for i in xrange(int(2000 * scale)):
+        if i % 10 == 0:
+            replacements.append((r'\bissue/%d\b' % i,
+                                 r'http://example.com/issues/%d' % i))
+        else:
+            replacements.append(('term%04d' % i, 'Term %d' % i))
+    words = [u'term%04d' % i for i in xrange(len(replacements))]
+
+    def make_document(rng, index):
+        chunks = [_front_matter(u'Configured post %d' % index)]
+        for _ in xrange(20):
+            sentence = _sentence(rng, 10)
+            sentence += u' ' + u' '.join(rng.choice(words) for _ in xrange(4))
+            chunks.append(sentence + u' issue/%d.\n' % (
+                rng.randint(0, len(replacements) // 10) * 10))
+        return u'\n'.join(chunks)
+
+    return Corpus('large_config', 'Posts converted with thousands of rules',
+                  _sized_documents(rng, int(100000 * scale), make_document),
+                  replacements)
+
+
+# dict(str, callable(float) -> Corpus).  All known corpora by name.
+CORPORA = collections.OrderedDict([
+    ('long_posts', long_posts),
+    ('nested_lists', nested_lists),
+    ('entity_dense', entity_dense),
+    ('code_blocks', code_blocks),
+    ('link_heavy', link_heavy),
+    ('large_config', large_config),
+])
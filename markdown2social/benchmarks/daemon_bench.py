@@ -0,0 +1,91 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark comparing cold CLI runs against round-trips to a daemon."""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from markdown2social import client
+
+
+# unicode.  Document to convert, representative of a short post.
+_DOCUMENT = u'''---
+title: A short post
+---
+Some text with *emphasis*, a [link](http://example.com/) and a bit of
+`code` in it.
+'''
+
+# int.  Number of times to run each of the CLI-based measurements.
+_CLI_RUNS = 10
+
+# int.  Number of round-trips to measure against the daemon.
+_ROUND_TRIPS = 200
+
+
+def _time_cli(args):
+    """Measures the average wall time of a CLI invocation.
+
+    Args:
+        args: list(str).  Arguments to pass to the program.
+
+    Returns:
+        float.  The average wall time in seconds.
+    """
+    command = [sys.executable, '-m', 'markdown2social',
+               '--config_file=/dev/null', '--no_cache'] + args
+    start = time.time()
+    for _ in xrange(_CLI_RUNS):
+        process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE)
+        process.communicate(_DOCUMENT.encode('utf-8'))
+        assert process.returncode == 0
+    return (time.time() - start) / _CLI_RUNS
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    tempdir = tempfile.mkdtemp()
+    socket_path = os.path.join(tempdir, 'socket')
+    daemon = subprocess.Popen([sys.executable, '-m', 'markdown2social',
+                               '--config_file=/dev/null',
+                               '--serve=%s' % socket_path])
+    try:
+        while not os.path.exists(socket_path):
+            time.sleep(0.01)
+
+        cold = _time_cli([])
+        delegated = _time_cli(['--socket=%s' % socket_path])
+
+        start = time.time()
+        for _ in xrange(_ROUND_TRIPS):
+            client.convert_remote(socket_path, _DOCUMENT)
+        round_trip = (time.time() - start) / _ROUND_TRIPS
+    finally:
+        daemon.terminate()
+        daemon.wait()
+        shutil.rmtree(tempdir)
+
+    sys.stdout.write('cold CLI run:          %8.2f ms\n' % (cold * 1e3))
+    sys.stdout.write('CLI run with --socket: %8.2f ms\n' % (delegated * 1e3))
+    sys.stdout.write('daemon round-trip:     %8.2f ms\n' % (round_trip * 1e3))
+
+
+if __name__ == '__main__':
+    main()
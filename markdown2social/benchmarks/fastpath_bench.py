@@ -0,0 +1,82 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark for the fast parser over the synthetic corpora.
+
+Converts every corpus with and without the fast path, checks that both
+produce the same posts, and reports how many documents took the fast path
+and the resulting speedup.  Usage:
+
+    python -m markdown2social.benchmarks.fastpath_bench [scale]
+"""
+
+import sys
+
+import frontmatter
+
+from markdown2social import benchmarks
+from markdown2social import converter
+from markdown2social import fastpath
+from markdown2social.benchmarks import corpus
+
+
+def _convert_all(gplus_converter, documents):
+    """Converts a set of documents.
+
+    Args:
+        gplus_converter: converter.Converter.  The converter to use.
+        documents: list(tuple(dict, unicode)).  The documents to convert.
+
+    Returns:
+        list(unicode).  The converted documents.
+    """
+    return [gplus_converter.convert(metadata, content)
+            for metadata, content in documents]
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+
+    sys.stdout.write('%-14s %6s %12s %12s %8s\n' % (
+        'corpus', 'hits', 'slow (ms)', 'fast (ms)', 'speedup'))
+    for generator in corpus.CORPORA.values():
+        bench_corpus = generator(scale)
+        documents = [frontmatter.parse(document)
+                     for document in bench_corpus.documents]
+        allow_entities = not bench_corpus.replacements
+        hits = sum(1 for _, content in documents
+                   if fastpath.parse(content, allow_entities) is not None)
+
+        slow_converter = converter.Converter(
+            replacements=bench_corpus.replacements)
+        fast_converter = converter.Converter(
+            replacements=bench_corpus.replacements, fast_path=True)
+        if (_convert_all(slow_converter, documents) !=
+                _convert_all(fast_converter, documents)):
+            sys.stderr.write('Outputs of corpus %s differ\n' %
+                             bench_corpus.name)
+            sys.exit(1)
+
+        slow = benchmarks.measure(
+            lambda: _convert_all(slow_converter, documents), 1, repeat=5)
+        fast = benchmarks.measure(
+            lambda: _convert_all(fast_converter, documents), 1, repeat=5)
+        sys.stdout.write('%-14s %2d/%-3d %12.1f %12.1f %7.1fx\n' % (
+            bench_corpus.name, hits, len(documents), slow * 1e3, fast * 1e3,
+            slow / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark for the Front Matter reader.
+
+Compares frontmatter.parse() with front_matter.parse(), both loading the whole
+YAML block and loading only the keys used by the converter, over documents
+with Front Matter blocks of increasing size.  Usage:
+
+    python -m markdown2social.benchmarks.front_matter_bench
+"""
+
+import random
+import sys
+
+import frontmatter
+
+from markdown2social import benchmarks
+from markdown2social import converter
+from markdown2social import front_matter
+from markdown2social.benchmarks import corpus
+
+
+def _title_only(unused_rng):
+    """Generates the Front Matter of the synthetic corpora."""
+    return [u'title: A post about markdown2social']
+
+
+def _jekyll(rng):
+    """Generates the Front Matter of a typical Jekyll post."""
+    return [
+        u'layout: post',
+        u'title: "Converting posts: a journey"',
+        u'date: 2016-01-22 10:00:00 -0500',
+        u'categories: [markdown, social]',
+        u'tags:',
+    ] + [u'- tag%d' % rng.randint(0, 999) for _ in xrange(8)] + [
+        u'excerpt: >',
+        u'  A short summary of the post that spans',
+        u'  a couple of lines.',
+        u'comments: true',
+    ]
+
+
+def _large(rng):
+    """Generates a large Front Matter block with nested data."""
+    lines = [u'title: A post with lots of metadata', u'tags:']
+    lines.extend(u'- tag%d' % rng.randint(0, 999) for _ in xrange(300))
+    lines.append(u'description: |')
+    lines.extend(u'  Line %d of a long description.' % i for i in xrange(200))
+    lines.append(u'links:')
+    for i in xrange(100):
+        lines.extend([u'  - url: http://example.com/%d' % i,
+                      u'    name: "Link %d"' % i,
+                      u'    weight: %d' % i])
+    return lines
+
+
+# list(tuple(str, callable(random.Random) -> list(unicode))).  Names of the
+# benchmarked cases and the generators of the lines of their Front Matter.
+_CASES = [
+    ('title only', _title_only),
+    ('jekyll', _jekyll),
+    ('large', _large),
+]
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    sys.stdout.write('%-12s %8s %14s %14s %14s %8s\n' % (
+        'case', 'fm (KB)', 'fm.parse (us)', 'full (us)', 'keys (us)',
+        'speedup'))
+    rng = random.Random(0)
+    # Use a regular post as the content to account for the cost of splitting
+    # it from the Front Matter.
+    _, content = frontmatter.parse(corpus.long_posts().documents[0])
+    for name, generator in _CASES:
+        block = u'\n'.join(generator(rng))
+        document = u'---\n%s\n---\n\n%s\n' % (block, content)
+
+        expected = frontmatter.parse(document)
+        if front_matter.parse(document) != expected:
+            sys.stderr.write('Results of case %s differ\n' % name)
+            sys.exit(1)
+        metadata, _ = front_matter.parse(document,
+                                         keys=converter.METADATA_KEYS)
+        if metadata.get('title') != expected[0].get('title'):
+            sys.stderr.write('Titles of case %s differ\n' % name)
+            sys.exit(1)
+
+        iterations = max(1, 20000 / len(document))
+        baseline = benchmarks.measure(
+            lambda: frontmatter.parse(document), iterations, repeat=5)
+        full = benchmarks.measure(
+            lambda: front_matter.parse(document), iterations, repeat=5)
+        keys = benchmarks.measure(
+            lambda: front_matter.parse(document,
+                                       keys=converter.METADATA_KEYS),
+            iterations, repeat=5)
+        sys.stdout.write('%-12s %8.1f %14.1f %14.1f %14.1f %7.1fx\n' % (
+            name, len(block) / 1024.0, baseline * 1e6, full * 1e6, keys * 1e6,
+            baseline / keys))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark for the conversion of a very large document via the CLI.
+
+Reports the wall time of a markdown2social process converting a synthetic
+document of a given size and how much its peak resident set size grew during
+the conversion.  Usage:
+
+    python -m markdown2social.benchmarks.large_input_bench [size_in_mb]
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+# int.  Default size of the synthetic document, in megabytes.
+_DEFAULT_SIZE_MB = 200
+
+# str.  Block of Markdown text repeated to build the synthetic document.
+_BLOCK = '''## A section
+
+Some text with *emphasis*, **bold text**, a [link](http://example.com/) and
+a bit of `code` that spans&mdash;with entities&mdash;a couple of lines.
+
+* First item.
+* Second item.
+
+'''
+
+# str.  Program run by the child interpreter.  Takes the path to the file that
+# receives the results as its first argument and the arguments to pass to the
+# program as the rest.  The libraries used by the conversion are loaded before
+# taking the initial measurement so that only the conversion is accounted for.
+_CHILD = r'''
+import json
+import os
+import resource
+import sys
+import time
+
+import frontmatter
+import markdown
+import yaml
+
+from markdown2social import __main__
+from markdown2social import converter
+from markdown2social import front_matter
+
+results_path = sys.argv[1]
+devnull = open(os.devnull, 'w')
+sys.stdout = sys.stderr = devnull
+# ru_maxrss is reported in kilobytes on Linux.
+initial_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+start = time.time()
+exit_code = __main__.main(sys.argv[2:])
+elapsed = time.time() - start
+peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+with open(results_path, 'w') as output:
+    json.dump({
+        'exit_code': exit_code,
+        'elapsed': elapsed,
+        'initial_rss': initial_rss,
+        'peak_rss': peak_rss,
+    }, output)
+'''
+
+
+def write_document(path, size):
+    """Writes a synthetic Markdown document.
+
+    Args:
+        path: str.  Path to the file to create.
+        size: int.  Approximate size of the document in bytes.
+    """
+    with open(path, 'wb') as output:
+        written = 0
+        while written < size:
+            output.write(_BLOCK)
+            written += len(_BLOCK)
+
+
+def measure(input_path, args=None):
+    """Converts a document in a fresh interpreter and records its memory use.
+
+    Args:
+        input_path: str.  Path to the document to convert.
+        args: list(str).  Additional arguments to pass to the program.
+
+    Returns:
+        dict.  The results of the run, with the following keys: exit_code, the
+        exit code of the program; elapsed, the wall time in seconds taken by
+        the conversion; initial_rss, the peak resident set size in bytes
+        before the conversion; and peak_rss, the peak resident set size in
+        bytes after the conversion.
+    """
+    handle, results_path = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        subprocess.check_call(
+            [sys.executable, '-c', _CHILD, results_path,
+             '--config_file=/dev/null', '--no_cache',
+             '--output_file=%s' % os.devnull] + (args or []) + [input_path],
+            env=env)
+        with open(results_path) as input_file:
+            return json.load(input_file)
+    finally:
+        os.unlink(results_path)
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else _DEFAULT_SIZE_MB
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        input_path = os.path.join(tempdir, 'input.md')
+        write_document(input_path, size_mb * 1024 * 1024)
+        results = measure(input_path)
+    finally:
+        shutil.rmtree(tempdir)
+
+    elapsed = results['elapsed']
+    growth = results['peak_rss'] - results['initial_rss']
+    sys.stdout.write('input size: %8d MB\n' % size_mb)
+    sys.stdout.write('wall time:  %8.1f s\n' % elapsed)
+    sys.stdout.write('peak RSS:   %8.1f MB\n' % (
+        results['peak_rss'] / 1024.0 / 1024.0))
+    sys.stdout.write('RSS growth: %8.1f MB (%.1fx the input)\n' % (
+        growth / 1024.0 / 1024.0, float(growth) / (size_mb * 1024 * 1024)))
+    sys.stdout.write('throughput: %8.2f MB/s\n' % (size_mb / elapsed))
+
+
+if __name__ == '__main__':
+    main()
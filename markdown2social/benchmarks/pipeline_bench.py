@@ -0,0 +1,83 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark for the parsing pipelines over the synthetic corpora.
+
+Converts every corpus with each pipeline and reports the cost of the lean
+pipeline relative to the full one, both on its own and behind the fast path.
+The corpora only use the syntax that the lean pipeline supports, so all the
+pipelines must produce the same posts.  Usage:
+
+    python -m markdown2social.benchmarks.pipeline_bench [scale]
+"""
+
+import sys
+
+import frontmatter
+
+from markdown2social import benchmarks
+from markdown2social import converter
+from markdown2social.benchmarks import corpus
+
+
+def _convert_all(gplus_converter, documents):
+    """Converts a set of documents.
+
+    Args:
+        gplus_converter: converter.Converter.  The converter to use.
+        documents: list(tuple(dict, unicode)).  The documents to convert.
+
+    Returns:
+        list(unicode).  The converted documents.
+    """
+    return [gplus_converter.convert(metadata, content)
+            for metadata, content in documents]
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+
+    sys.stdout.write('%-14s %12s %12s %8s %12s %12s %8s\n' % (
+        'corpus', 'full (ms)', 'lean (ms)', 'speedup', 'fast (ms)',
+        'fast+lean', 'speedup'))
+    for generator in corpus.CORPORA.values():
+        bench_corpus = generator(scale)
+        documents = [frontmatter.parse(document)
+                     for document in bench_corpus.documents]
+
+        times = []
+        outputs = []
+        for fast_path in (False, True):
+            for pipeline in ('full', 'lean'):
+                gplus_converter = converter.Converter(
+                    replacements=bench_corpus.replacements,
+                    fast_path=fast_path, pipeline=pipeline)
+                outputs.append(_convert_all(gplus_converter, documents))
+                times.append(benchmarks.measure(
+                    lambda: _convert_all(gplus_converter, documents), 1,
+                    repeat=5))
+        if any(output != outputs[0] for output in outputs[1:]):
+            sys.stderr.write('Outputs of corpus %s differ\n' %
+                             bench_corpus.name)
+            sys.exit(1)
+
+        full, lean, fast, fast_lean = times
+        sys.stdout.write('%-14s %12.1f %12.1f %7.1fx %12.1f %12.1f %7.1fx\n' % (
+            bench_corpus.name, full * 1e3, lean * 1e3, full / lean,
+            fast * 1e3, fast_lean * 1e3, fast / fast_lean))
+
+
+if __name__ == '__main__':
+    main()
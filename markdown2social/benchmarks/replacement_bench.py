@@ -0,0 +1,89 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark for the application of large sets of replacement rules."""
+
+import re
+import sys
+import time
+
+from markdown2social import benchmarks
+from markdown2social import replacement
+
+
+# list(int).  Number of rules to benchmark with.
+_RULE_COUNTS = [10, 100, 1000, 5000]
+
+# list(unicode).  Text nodes representative of those found in a post.
+_TEXT_NODES = [
+    u'Some text mentioning product0042 and product1234 in passing,',
+    u'followed by a reference to magic/1234 and ',
+    u'a longer sentence that does not mention anything of interest at all.',
+    u'product4999',
+]
+
+
+def _make_rules(count):
+    """Generates a replacements configuration.
+
+    Args:
+        count: int.  Number of rules to generate.  A handful of them are regular
+            expressions and the rest are literal strings, which is what large
+            configurations look like in practice.
+
+    Returns:
+        list(tuple(str, str)).  The generated rules.
+    """
+    rules = []
+    for i in xrange(min(5, count)):
+        rules.append((r'(\A|\s)(magic%d/[0-9_-]+)' % i, r'\1http://\2'))
+    for i in xrange(len(rules), count):
+        rules.append(('product%04d' % i, 'Product %d' % i))
+    return rules
+
+
+def _apply_sequentially(compiled_rules):
+    """Applies each rule on its own to all the text nodes."""
+    for text in _TEXT_NODES:
+        for pattern, subst in compiled_rules:
+            text = pattern.sub(subst, text)
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    sys.stdout.write('%6s %12s %14s %14s %8s\n' % (
+        'rules', 'build (ms)', 'seq (us/node)', 'set (us/node)', 'speedup'))
+    for count in _RULE_COUNTS:
+        rules = _make_rules(count)
+        compiled_rules = [(re.compile(regex), subst) for regex, subst in rules]
+
+        start = time.time()
+        replacements = replacement.ReplacementSet(rules)
+        build = time.time() - start
+
+        iterations = max(1, 2000 / count)
+        sequential = benchmarks.measure(
+            lambda: _apply_sequentially(compiled_rules), iterations)
+        combined = benchmarks.measure(
+            lambda: [replacements.apply(text) for text in _TEXT_NODES],
+            iterations)
+
+        nodes = len(_TEXT_NODES)
+        sys.stdout.write('%6d %12.1f %14.1f %14.1f %7.1fx\n' % (
+            count, build * 1e3, sequential / nodes * 1e6,
+            combined / nodes * 1e6, sequential / combined))
+
+
+if __name__ == '__main__':
+    main()
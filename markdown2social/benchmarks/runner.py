@@ -0,0 +1,244 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Throughput benchmark over the synthetic corpora.
+
+Converts every document of every corpus and reports the throughput in
+documents and megabytes per second, together with the time spent in each
+stage of the conversion.  Usage:
+
+    python -m markdown2social.benchmarks.runner [--scale=N] [--json=FILE]
+        [corpus1 .. corpusN]
+
+The JSON output is meant to be stored and compared across releases.
+"""
+
+import codecs
+import json
+import optparse
+import platform
+import sys
+import time
+
+import frontmatter
+
+from markdown2social import converter
+from markdown2social import package
+from markdown2social.benchmarks import corpus
+
+
+# list(str).  Names of the measured stages, in the order in which they run.
+#
+# front_matter: parsing of the YAML Front Matter.
+# preprocess: python-markdown preprocessors, which work on the raw lines.
+# parse: python-markdown block parser, which builds the element tree.
+# treeprocess: python-markdown tree processors, including inline patterns.
+# format: walk of the element tree to generate the post, which includes the
+#     application of the replacements.
+# postprocess: python-markdown postprocessors, which restore stashed HTML.
+# other: everything else, including the expansion of entities.
+STAGES = ['front_matter', 'preprocess', 'parse', 'treeprocess', 'format',
+          'postprocess', 'other']
+
+
+class _StageTimer(object):
+    """Accumulates the time spent in the stages of a Converter.
+
+    The timer instruments the parser of the converter in place by wrapping
+    the entry points of each of its stages.
+    """
+
+    def __init__(self, gplus_converter):
+        """Constructor.
+
+        Args:
+            gplus_converter: converter.Converter.  The converter to instrument.
+        """
+        self.times = dict((stage, 0.0) for stage in STAGES)
+
+        parser = gplus_converter._markdown  # pylint: disable=protected-access
+        for processor in parser.preprocessors.values():
+            processor.run = self._wrap('preprocess', processor.run)
+        parser.parser.parseDocument = self._wrap('parse',
+                                                 parser.parser.parseDocument)
+        for processor in parser.treeprocessors.values():
+            processor.run = self._wrap('treeprocess', processor.run)
+        # pylint: disable=protected-access
+        parser._format_document = self._wrap('format',
+                                             parser._format_document)
+        for processor in parser.postprocessors.values():
+            processor.run = self._wrap('postprocess', processor.run)
+
+    def _wrap(self, stage, func):
+        """Wraps a function to account its time to a stage.
+
+        Args:
+            stage: str.  Name of the stage.
+            func: callable.  The function to wrap.
+
+        Returns:
+            callable.  The wrapped function.
+        """
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[stage] += time.time() - start
+        return wrapper
+
+
+def run_corpus(bench_corpus, repeat=3):
+    """Converts all the documents of a corpus and measures the cost.
+
+    Args:
+        bench_corpus: corpus.Corpus.  The corpus to convert.
+        repeat: int.  Number of times to convert the corpus; the fastest run
+            is reported to minimize the noise caused by other activity on the
+            machine.
+
+    Returns:
+        dict.  The results of the fastest run, with the following keys:
+        corpus, the name of the corpus; documents, the number of documents;
+        bytes, the size of the documents encoded in UTF-8; seconds, the total
+        time; docs_per_sec and mb_per_sec, the throughput; and stages, a
+        mapping of the names in STAGES to the seconds spent in each of them.
+    """
+    size = sum(len(codecs.encode(document, 'utf-8'))
+               for document in bench_corpus.documents)
+
+    best = None
+    for _ in xrange(repeat):
+        gplus_converter = converter.Converter(
+            replacements=bench_corpus.replacements)
+        timer = _StageTimer(gplus_converter)
+
+        start = time.time()
+        for document in bench_corpus.documents:
+            front_matter_start = time.time()
+            metadata, content = frontmatter.parse(document)
+            timer.times['front_matter'] += time.time() - front_matter_start
+            gplus_converter.convert(metadata, content)
+        elapsed = time.time() - start
+
+        if best is None or elapsed < best[0]:
+            best = (elapsed, timer.times)
+
+    elapsed, stages = best
+    stages['other'] = max(0.0, elapsed - sum(stages.values()))
+    return {
+        'corpus': bench_corpus.name,
+        'documents': len(bench_corpus.documents),
+        'bytes': size,
+        'seconds': elapsed,
+        'docs_per_sec': len(bench_corpus.documents) / elapsed,
+        'mb_per_sec': size / elapsed / (1024 * 1024),
+        'stages': stages,
+    }
+
+
+def run(names=None, scale=1.0, repeat=3):
+    """Runs the benchmark over a set of corpora.
+
+    Args:
+        names: list(str).  Names of the corpora to run, or None for all.
+        scale: float.  Multiplier for the size of the corpora.
+        repeat: int.  Number of times to convert each corpus.
+
+    Returns:
+        dict.  The results, with details about the environment in which they
+        were collected and a list of the results of run_corpus() for each
+        corpus under the results key.
+
+    Raises:
+        KeyError: If any of the names does not match a known corpus.
+    """
+    if names is None:
+        names = corpus.CORPORA.keys()
+    generators = [corpus.CORPORA[name] for name in names]
+
+    return {
+        'version': package.VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': scale,
+        'results': [run_corpus(generator(scale), repeat=repeat)
+                    for generator in generators],
+    }
+
+
+def _write_table(output, results):
+    """Writes the results of run() in human-readable form.
+
+    Args:
+        output: file.  Stream to write the table to.
+        results: dict.  The results returned by run().
+    """
+    output.write('%-14s %6s %9s %9s  %s\n' % (
+        'corpus', 'docs', 'docs/s', 'MB/s', 'time per stage (%)'))
+    for result in results['results']:
+        stages = ' '.join(
+            '%s=%.0f' % (stage, result['stages'][stage] * 100.0 /
+                         result['seconds'])
+            for stage in STAGES)
+        output.write('%-14s %6d %9.1f %9.3f  %s\n' % (
+            result['corpus'], result['documents'], result['docs_per_sec'],
+            result['mb_per_sec'], stages))
+
+
+def main(args=None):
+    """Program entry point.
+
+    Args:
+        args: list(str).  Optional list of arguments passed to the program.  If
+        not provided, the arguments are read from sys.argv.
+
+    Returns:
+        int.  The exit code of the program.
+    """
+    parser = optparse.OptionParser(
+        usage='%prog [options] [corpus1 .. [corpusN]]',
+        description='Known corpora: %s.' % ', '.join(corpus.CORPORA.keys()))
+    parser.add_option('--scale', dest='scale', type='float', default=1.0,
+                      help='Multiplier for the size of the corpora')
+    parser.add_option('--repeat', dest='repeat', type='int', default=3,
+                      help='Number of times to convert each corpus')
+    parser.add_option('--json', dest='json', default=None, metavar='FILE',
+                      help='File to write the results to in JSON form; use '
+                      '"-" for stdout')
+    options, args = parser.parse_args(args)
+
+    for name in args:
+        if name not in corpus.CORPORA:
+            parser.error('Unknown corpus %s' % name)
+    if options.scale <= 0 or options.repeat < 1:
+        parser.error('--scale and --repeat must be positive numbers')
+
+    results = run(names=args or None, scale=options.scale,
+                  repeat=options.repeat)
+
+    if options.json == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        _write_table(sys.stdout, results)
+        if options.json:
+            with open(options.json, 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+                output.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import StringIO
+import sys
+import tempfile
+import unittest
+
+from markdown2social import package
+from markdown2social.benchmarks import corpus
+from markdown2social.benchmarks import runner
+
+
+class CorpusTest(unittest.TestCase):
+    """Unit tests for the corpus module."""
+
+    def test_deterministic(self):
+        for generator in corpus.CORPORA.values():
+            self.assertEquals(generator(0.05), generator(0.05))
+
+    def test_scale(self):
+        for generator in corpus.CORPORA.values():
+            small = sum(len(document) for document in generator(0.1).documents)
+            large = sum(len(document) for document in generator(0.5).documents)
+            self.assertLessEqual(small, large)
+
+    def test_names(self):
+        for name, generator in corpus.CORPORA.items():
+            self.assertEquals(name, generator(0.01).name)
+
+
+class RunnerTest(unittest.TestCase):
+    """Unit tests for the runner module."""
+
+    def test_run(self):
+        results = runner.run(scale=0.01, repeat=1)
+        self.assertEquals(package.VERSION, results['version'])
+        self.assertEquals(corpus.CORPORA.keys(),
+                          [result['corpus'] for result in results['results']])
+        for result in results['results']:
+            self.assertLess(0, result['documents'])
+            self.assertLess(0, result['bytes'])
+            self.assertLess(0, result['docs_per_sec'])
+            self.assertLess(0, result['mb_per_sec'])
+            self.assertEquals(sorted(runner.STAGES),
+                              sorted(result['stages'].keys()))
+            self.assertAlmostEquals(result['seconds'],
+                                    sum(result['stages'].values()))
+
+    def test_main_json(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        old_stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            self.assertEquals(0, runner.main(['--scale=0.01', '--repeat=1',
+                                              '--json=%s' % path,
+                                              'entity_dense']))
+            self.assertIn('entity_dense', sys.stdout.getvalue())
+            with open(path) as input_file:
+                results = json.load(input_file)
+        finally:
+            sys.stdout = old_stdout
+            os.unlink(path)
+        self.assertEquals(['entity_dense'],
+                          [result['corpus'] for result in results['results']])
+
+    def test_main_unknown_corpus(self):
+        old_stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            self.assertRaises(SystemExit, runner.main, ['foo'])
+        finally:
+            sys.stderr = old_stderr
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark of the import cost of the command-line program.
+
+Each measurement runs the program in a fresh interpreter with __import__
+wrapped so that the cumulative cost of loading every module and the set of
+modules that end up loaded can be recorded, much like the -X importtime flag
+of newer Python versions does.  The program must not spend more than
+IMPORT_BUDGET in imports when it does not convert anything locally; this is
+checked here instead of in the tests because timings depend on the load of
+the machine.  Usage:
+
+    python -m markdown2social.benchmarks.startup_bench
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+# str.  Program run by the child interpreter.  Takes the path to the file that
+# receives the results as its first argument and the arguments to pass to the
+# program as the rest.
+_CHILD = r'''
+import __builtin__
+import json
+import os
+import sys
+import time
+
+results_path = sys.argv[1]
+initial_modules = set(sys.modules)
+timings = {}
+total = [0.0]
+nesting = [0]
+
+real_import = __builtin__.__import__
+def timed_import(name, *args, **kwargs):
+    first_load = name not in sys.modules
+    nesting[0] += 1
+    start = time.time()
+    try:
+        return real_import(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        nesting[0] -= 1
+        if nesting[0] == 0:
+            total[0] += elapsed
+        if first_load and name in sys.modules:
+            timings[name] = timings.get(name, 0.0) + elapsed
+__builtin__.__import__ = timed_import
+
+devnull = open(os.devnull, 'w')
+sys.stdout = sys.stderr = devnull
+start = time.time()
+try:
+    from markdown2social import __main__
+    exit_code = __main__.main(sys.argv[2:])
+except SystemExit as e:
+    exit_code = e.code
+elapsed = time.time() - start
+__builtin__.__import__ = real_import
+
+with open(results_path, 'w') as output:
+    json.dump({
+        'exit_code': exit_code,
+        'elapsed': elapsed,
+        'import_time': total[0],
+        'imports': timings,
+        'modules': sorted(name for name, module in sys.modules.items()
+                          if name not in initial_modules and module),
+    }, output)
+'''
+
+
+# float.  Maximum time in seconds that the imports of a run that does not
+# convert anything locally may take.  Loading the heavy modules takes several
+# times longer than this.
+IMPORT_BUDGET = 0.05
+
+# int.  Number of times to run each scenario, keeping the fastest run.
+_RUNS = 3
+
+
+def measure(args, stdin=''):
+    """Runs the program in a fresh interpreter and records its imports.
+
+    Args:
+        args: list(str).  Arguments to pass to the program.
+        stdin: str.  Contents to feed to the program via stdin.
+
+    Returns:
+        dict.  The results of the run, with the following keys:
+        exit_code, the exit code of the program; elapsed, the wall time in
+        seconds taken by the program including its own imports; import_time,
+        the total time in seconds spent in imports; imports, a mapping of the
+        names of the modules loaded during the run to the cumulative cost in
+        seconds of loading them, including their own imports; and modules, the
+        sorted names of all the modules loaded during the run.
+    """
+    handle, results_path = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        process = subprocess.Popen(
+            [sys.executable, '-c', _CHILD, results_path] + args,
+            stdin=subprocess.PIPE, env=env)
+        process.communicate(stdin)
+        if process.returncode != 0:
+            raise RuntimeError('Benchmark child failed with code %d' %
+                               process.returncode)
+        with open(results_path) as input_file:
+            return json.load(input_file)
+    finally:
+        os.unlink(results_path)
+
+
+def main():
+    """Runs the benchmark and prints the results.
+
+    Exits with an error if any of the runs that do not convert anything spend
+    more than IMPORT_BUDGET in imports.
+    """
+    handle, bad_config = tempfile.mkstemp()
+    os.write(handle, 'This is not a configuration file\n')
+    os.close(handle)
+    over_budget = False
+    try:
+        # list(tuple(str, list(str), bool)).  Label, arguments and whether the
+        # imports must fit in IMPORT_BUDGET for each scenario.
+        scenarios = [
+            ('--version', ['--version'], True),
+            ('--help', ['--help'], True),
+            ('bad config', ['--config_file=%s' % bad_config], True),
+            ('conversion', ['--config_file=/dev/null', '--no_cache'], False),
+        ]
+        for label, args, budgeted in scenarios:
+            results = min((measure(args, stdin='Some *text*\n')
+                           for _ in xrange(_RUNS)),
+                          key=lambda results: results['import_time'])
+            sys.stdout.write('%-12s total %7.2f ms, imports %7.2f ms, '
+                             '%d modules\n' % (label, results['elapsed'] * 1e3,
+                                               results['import_time'] * 1e3,
+                                               len(results['modules'])))
+            if budgeted and results['import_time'] > IMPORT_BUDGET:
+                sys.stdout.write('    over the budget of %.2f ms\n' % (
+                    IMPORT_BUDGET * 1e3))
+                over_budget = True
+            slowest = sorted(results['imports'].items(),
+                             key=lambda item: -item[1])
+            for name, cost in slowest[:8]:
+                sys.stdout.write('    %-30s %7.2f ms\n' % (name, cost * 1e3))
+    finally:
+        os.unlink(bad_config)
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
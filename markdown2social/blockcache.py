@@ -0,0 +1,137 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Persistent cache of formatted top-level blocks.
+
+Every top-level element of a document is formatted independently of its
+siblings, so the formatted text of an element can be reused whenever the same
+element shows up again, as happens when re-converting a long post after
+editing a single paragraph.  The cache is keyed by a hash of the serialized
+element, the configuration and the version of the program; see
+converter.Converter for how the keys are computed.
+
+Only the formatting of the blocks is cached: the document is still parsed in
+full on every conversion, which is also what keeps reference-style links
+correct as their targets are resolved into the elements before they are
+hashed.
+"""
+
+import json
+import os
+import tempfile
+
+import markdown2social
+
+
+# int.  Maximum number of blocks to keep in the cache.  When the cache grows
+# beyond this size, the blocks that were used the longest time ago are dropped.
+MAX_ENTRIES = 20000
+
+
+class BlockCache(object):
+    """Cache of formatted blocks backed by a file.
+
+    Attributes:
+        hits: int.  Number of lookups that found a block.
+        misses: int.  Number of lookups that did not find a block.
+    """
+
+    def __init__(self, path):
+        """Constructor.
+
+        Loads the contents of the cache if the file exists.  A missing or
+        corrupted file results in an empty cache.
+
+        Args:
+            path: str.  Path to the file backing the cache.
+        """
+        self._path = path
+        self._entries = {}
+        self._generation = 0
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            with open(path, 'rb') as input_file:
+                contents = json.load(input_file)
+            self._generation = contents['generation'] + 1
+            self._entries = contents['entries']
+        except IOError:
+            pass  # The cache has not been created yet.
+        except (ValueError, KeyError, TypeError) as e:
+            markdown2social.get_logger().warning(
+                'Ignoring corrupted block cache %s: %s', path, e)
+
+    def get(self, key, default=None):
+        """Looks up a block.
+
+        Args:
+            key: str.  The key of the block.
+            default: object.  Value to return if the block is not cached.
+
+        Returns:
+            unicode.  The formatted block, which may be None if the block
+            produced no output, or default if the block is not cached.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        if entry[0] != self._generation:
+            entry[0] = self._generation
+            self._dirty = True
+        return entry[1]
+
+    def put(self, key, block):
+        """Stores a block.
+
+        Args:
+            key: str.  The key of the block.
+            block: unicode.  The formatted block.  May be None.
+        """
+        self._entries[key] = [self._generation, block]
+        self._dirty = True
+
+    def save(self):
+        """Writes the cache back to its file if it has been modified.
+
+        The file is replaced atomically so that concurrent readers never see
+        a partially-written cache.
+
+        Raises:
+            IOError: If the cache cannot be written.
+            OSError: If the cache cannot be written.
+        """
+        if not self._dirty:
+            return
+
+        if len(self._entries) > MAX_ENTRIES:
+            by_age = sorted(self._entries.iteritems(),
+                            key=lambda item: item[1][0], reverse=True)
+            self._entries = dict(by_age[:MAX_ENTRIES])
+
+        directory = os.path.dirname(self._path) or '.'
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                json.dump({'generation': self._generation,
+                           'entries': self._entries}, output)
+            os.rename(temp_path, self._path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        self._dirty = False
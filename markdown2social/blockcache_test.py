@@ -0,0 +1,143 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from markdown2social import blockcache
+from markdown2social import converter
+
+
+class BlockCacheTest(unittest.TestCase):
+    """Unit tests for the BlockCache class."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_missing_file(self):
+        cache = blockcache.BlockCache(self.path)
+        self.assertEquals('default', cache.get('key', default='default'))
+        self.assertEquals(1, cache.misses)
+        cache.save()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_persistence(self):
+        cache = blockcache.BlockCache(self.path)
+        cache.put('key1', u'Block \u2014 1')
+        cache.put('key2', None)
+        cache.save()
+
+        cache = blockcache.BlockCache(self.path)
+        self.assertEquals(u'Block \u2014 1', cache.get('key1'))
+        self.assertIsNone(cache.get('key2', default='default'))
+        self.assertEquals(2, cache.hits)
+        self.assertEquals(['cache'], os.listdir(self.tempdir))
+
+    def test_corrupted_file(self):
+        with open(self.path, 'w') as output:
+            output.write('garbage')
+        cache = blockcache.BlockCache(self.path)
+        self.assertIsNone(cache.get('key'))
+        cache.put('key', u'value')
+        cache.save()
+        self.assertEquals(u'value', blockcache.BlockCache(self.path).get('key'))
+
+    def test_evicts_least_recently_used(self):
+        old_max_entries = blockcache.MAX_ENTRIES
+        blockcache.MAX_ENTRIES = 2
+        try:
+            cache = blockcache.BlockCache(self.path)
+            cache.put('old', u'old')
+            cache.put('reused', u'reused')
+            cache.save()
+
+            cache = blockcache.BlockCache(self.path)
+            cache.get('reused')
+            cache.put('new', u'new')
+            cache.save()
+        finally:
+            blockcache.MAX_ENTRIES = old_max_entries
+
+        cache = blockcache.BlockCache(self.path)
+        self.assertIsNone(cache.get('old'))
+        self.assertEquals(u'reused', cache.get('reused'))
+        self.assertEquals(u'new', cache.get('new'))
+
+
+class ConverterIntegrationTest(unittest.TestCase):
+    """Tests for the use of the block cache by converter.Converter."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _convert(self, content, replacements=None):
+        """Converts a document using a fresh instance of the cache.
+
+        Args:
+            content: unicode.  The document to convert.
+            replacements: list(tuple(str, str)).  The replacements to apply.
+
+        Returns:
+            tuple(unicode, blockcache.BlockCache).  The converted document and
+            the cache used during the conversion, already saved.
+        """
+        cache = blockcache.BlockCache(self.path)
+        gplus = converter.Converter(
+            replacements=replacements, block_cache=cache).convert({}, content)
+        cache.save()
+        self.assertEquals(converter.convert({}, content,
+                                            replacements=replacements), gplus)
+        return gplus, cache
+
+    def test_reuses_unchanged_blocks(self):
+        _, cache = self._convert(u'First.\n\n* Item.\n\nLast \u2014.\n')
+        self.assertEquals((0, 3), (cache.hits, cache.misses))
+
+        gplus, cache = self._convert(
+            u'First.\n\n* Item.\n\nEdited \u2014.\n')
+        self.assertEquals(u'First.\n\n*#* Item.\n\nEdited \u2014.\n', gplus)
+        self.assertEquals((2, 1), (cache.hits, cache.misses))
+
+    def test_reference_links(self):
+        self._convert(u'A [link][1].\n\n[1]: http://example.com/\n')
+        gplus, cache = self._convert(
+            u'A [link][1].\n\n[1]: http://example.org/\n')
+        self.assertEquals(u'A link [http://example.org/].\n', gplus)
+        self.assertEquals((0, 1), (cache.hits, cache.misses))
+
+    def test_replacements_are_part_of_the_key(self):
+        self._convert(u'Some text.\n', replacements=[('text', 'words')])
+        gplus, cache = self._convert(u'Some text.\n',
+                                     replacements=[('text', 'prose')])
+        self.assertEquals(u'Some prose.\n', gplus)
+        self.assertEquals((0, 1), (cache.hits, cache.misses))
+
+    def test_blocks_without_output(self):
+        self._convert(u'Text.\n\n<!-- comment -->\n\nMore.\n')
+        gplus, cache = self._convert(u'Text.\n\n<!-- comment -->\n\nMore.\n')
+        self.assertEquals(0, cache.misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Client for the resident conversion server.
+
+This module is deliberately lightweight: it must not depend on the conversion
+machinery so that delegating a conversion to a server is cheap.
+
+The protocol is trivial.  For each connection, the client sends one request
+and the server sends one response, both encoded as a header followed by a
+payload.  The request header is the length of the payload packed as
+LENGTH_FORMAT, and the payload is the raw UTF-8 document, including any front
+matter.  The response header is a status byte (STATUS_OK or STATUS_ERROR)
+followed by the length of the payload, and the payload is either the UTF-8
+converted post or an error message.
+"""
+
+import codecs
+import socket
+import struct
+
+
+# str.  struct format of the length of a payload.
+LENGTH_FORMAT = '!Q'
+
+# str.  Status byte of a successful response.
+STATUS_OK = 'O'
+
+# str.  Status byte of a failed response.
+STATUS_ERROR = 'E'
+
+
+class Error(Exception):
+    """Base class for exceptions raised by this module."""
+
+
+class ProtocolError(Error):
+    """Error when the peer does not follow the protocol."""
+
+
+class ConversionError(Error):
+    """Error reported by the server when a document cannot be converted."""
+
+
+def recv_exactly(sock, size):
+    """Reads an exact number of bytes from a socket.
+
+    Args:
+        sock: socket.socket.  The socket to read from.
+        size: int.  The number of bytes to read.
+
+    Returns:
+        str.  The bytes read.
+
+    Raises:
+        ProtocolError: If the peer closes the connection prematurely.
+        socket.error: If the socket cannot be read from.
+    """
+    parts = []
+    remaining = size
+    while remaining > 0:
+        chunk = sock.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise ProtocolError('Connection closed with %d bytes pending' %
+                                remaining)
+        parts.append(chunk)
+        remaining -= len(chunk)
+    return ''.join(parts)
+
+
+def recv_payload(sock):
+    """Reads a length-prefixed payload from a socket."""
+    header = recv_exactly(sock, struct.calcsize(LENGTH_FORMAT))
+    size, = struct.unpack(LENGTH_FORMAT, header)
+    return recv_exactly(sock, size)
+
+
+def send_payload(sock, payload):
+    """Writes a length-prefixed payload to a socket."""
+    sock.sendall(struct.pack(LENGTH_FORMAT, len(payload)))
+    sock.sendall(payload)
+
+
+def convert_remote(socket_path, raw_input):
+    """Converts a document by sending it to a running server.
+
+    Args:
+        socket_path: str.  Path to the socket the server listens on.
+        raw_input: unicode.  The Markdown document, including any front
+            matter.
+
+    Returns:
+        unicode.  The Google+ text ready to be pasted into the browser.
+
+    Raises:
+        ConversionError: If the server fails to convert the document.
+        ProtocolError: If the server does not follow the protocol.
+        socket.error: If the server cannot be contacted.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        send_payload(sock, codecs.encode(raw_input, 'utf-8'))
+        status = recv_exactly(sock, 1)
+        payload = codecs.decode(recv_payload(sock), 'utf-8')
+    finally:
+        sock.close()
+
+    if status == STATUS_ERROR:
+        raise ConversionError(payload)
+    elif status != STATUS_OK:
+        raise ProtocolError('Unknown response status %r' % status)
+    return payload
@@ -18,6 +18,7 @@ import ConfigParser
 import collections
 
 import markdown2social
+from markdown2social import replacement
 
 
 class Error(Exception):
@@ -32,9 +33,10 @@ class _Config(collections.namedtuple('_Config', 'replacements')):
     """High-level representation of the configuration file.
 
     Fields:
-        replacements: collection(tuple(str, str)).  List of pairs representing
-            a regular expression to match text and its corresponding
-            replacement.  The replacement can use backreferences.
+        replacements: replacement.ReplacementSet.  Ordered collection of pairs
+            representing a regular expression to match text and its
+            corresponding replacement.  The replacement can use
+            backreferences.
     """
 
     @classmethod
@@ -43,23 +45,26 @@ class _Config(collections.namedtuple('_Config', 'replacements')):
         return _Config(replacements=None)
 
 
-def _parse_replacements(parser, section):
+def _parse_replacements(parser, section, instrument):
     """Parses the replacements section of the configuration file.
 
     Args:
         parser: ConfigParser.ConfigParser.  Open parser from which to read the
             section.
         section: str.  Name of the section from which to read the replacements.
+        instrument: bool.  Whether to record the measurements of each rule.
 
     Returns:
-        collection(tuple(str, str)).  List of pairs representing a regular
-        expression to match text and its corresponding replacement.  The
-        replacement can use backreferences.  None if there are no replacements.
+        replacement.ReplacementSet.  Ordered collection of pairs representing a
+        regular expression to match text and its corresponding replacement.
+        The replacement can use backreferences.  None if there are no
+        replacements.
 
     Raises:
         ContentsError: If any of the replacements is incorrectly specified.
     """
 
+    keys = []
     replacements = []
 
     for key, value in parser.items(section, raw=True):
@@ -67,18 +72,27 @@ def _parse_replacements(parser, section):
         if len(fields) != 2:
             raise ContentsError('Bad replacement with name %s: not of the form '
                                 '"regex -> substitution"' % key)
+        keys.append(key)
         replacements.append(tuple(fields))
 
-    return replacements or None
+    if not replacements:
+        return None
+    try:
+        return replacement.ReplacementSet(replacements, instrument=instrument)
+    except replacement.InvalidRuleError as e:
+        raise ContentsError('Bad replacement with name %s: %s' % (
+            keys[e.index], e))
 
 
-def load_config(path):
+def load_config(path, instrument=False):
     """Reads a configuration file.
 
     Args:
         path: str.  Path to the configuration file to read.  The path is used
             verbatim, without the typical user expansion needed to load files
             from the home directory.
+        instrument: bool.  Whether to instrument the replacements so that they
+            record the measurements of each rule in their rule_stats.
 
     Returns:
         Config.  The parsed configuration.
@@ -96,8 +110,8 @@ def load_config(path):
     for section in parser.sections():
         if section == 'replacements':
             assert replacements is None, 'Duplicate section'
-            replacements = _parse_replacements(parser, section)
+            replacements = _parse_replacements(parser, section, instrument)
         else:
-            markdown2social.LOGGER.warning('Ignoring unknown section %s '
-                                           'in config file %s', section, path)
+            markdown2social.get_logger().warning(
+                'Ignoring unknown section %s in config file %s', section, path)
     return _Config(replacements=replacements)
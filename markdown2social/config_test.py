@@ -16,6 +16,7 @@ import unittest
 import tempfile
 
 from markdown2social import config
+from markdown2social import replacement
 
 
 class ConfigTest(unittest.TestCase):
@@ -74,6 +75,42 @@ class LoadConfigTest(unittest.TestCase):
             self.assert_config(config.load_config(tmp.name),
                                replacements=replacements)
 
+    def test_replacements_are_compiled(self):
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write('[replacements]\n')
+            tmp.write('1 = foo -> bar\n')
+            tmp.flush()
+
+            cfg = config.load_config(tmp.name)
+            self.assertIsInstance(cfg.replacements,
+                                  replacement.ReplacementSet)
+            self.assertEquals('a bar', cfg.replacements.apply('a foo'))
+
+    def test_instrument(self):
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write('[replacements]\n')
+            tmp.write('1 = foo -> bar\n')
+            tmp.flush()
+
+            self.assertIsNone(
+                config.load_config(tmp.name).replacements.rule_stats)
+            cfg = config.load_config(tmp.name, instrument=True)
+            self.assertEquals('a bar', cfg.replacements.apply('a foo'))
+            self.assertEquals(1, cfg.replacements.rule_stats[0].matches)
+
+    def test_bad_replacement_regex(self):
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write('[replacements]\n')
+            tmp.write('1 = foo -> bar\n')
+            tmp.write('2 = (unbalanced -> baz\n')
+            tmp.flush()
+
+            try:
+                config.load_config(tmp.name)
+                self.fail('ContentsError not raised')
+            except config.ContentsError as e:
+                self.assertIn('Bad replacement with name 2:', str(e))
+
     def test_bad_replacement(self):
         with tempfile.NamedTemporaryFile() as tmp:
             tmp.write('[replacements]\n')
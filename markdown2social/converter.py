@@ -15,12 +15,21 @@
 """Implementation of a Markdown to Google+ converter."""
 
 import collections
+import functools
+import hashlib
 import htmlentitydefs
 import re
+import threading
+import time
 import xml.etree.ElementTree as ET
 
 import markdown
+import markdown.postprocessors
+import markdown.util
 import markdown2social
+from markdown2social import fastpath
+from markdown2social import package
+from markdown2social import replacement
 
 
 # list(str).  Bullet types for unordered lists.  Each entry in this list is used
@@ -35,80 +44,128 @@ _UNORDERED_BULLETS = ['#', '-', 'o']
 _ORDERED_BULLETS = ['1', 'A', 'a']
 
 
-def _replace_match(text, match, replacement):
-    """Expands a regexp match in the text with its replacement.
+# re.RegexObject.  Pattern to locate HTML entities in a piece of text.  The
+# first group matches named entities, the second group matches hexadecimal code
+# points and the third group matches decimal code points.
+_ENTITY_PATTERN = re.compile(r'&(?:([A-Za-z]+)|#x([0-9]+)|#([0-9]+));')
+
+
+# dict(str, unicode).  Mapping of HTML entity names to the characters they
+# represent.
+_ENTITY_CHARS = dict((name, unichr(codepoint)) for name, codepoint
+                     in htmlentitydefs.name2codepoint.iteritems())
+
+
+def _expand_entity(match, logger):
+    """Computes the replacement for an HTML entity.
 
     Args:
-        text: str.  The text in which to perform the replacement.
-        match: re.MatchObject.  A match object that applies to "text".
-        replacement: str.  The string to replace the match with.
+        match: re.MatchObject.  A match of _ENTITY_PATTERN.
+        logger: logging.Logger.  Logger to report unknown entities to.
 
     Returns:
-        (str, int).  The text with the substitution performed and the first
-        position in the text after the replacement that was done.
+        unicode.  The character represented by the entity, or the entity
+        itself if it is unknown.
     """
-    new_text = text[:match.start()] + replacement + text[match.end():]
-    new_start_pos = match.start() + len(replacement)
-    return new_text, new_start_pos
-
-
-def _replace_entities(text):
+    name, hex_codepoint, dec_codepoint = match.groups()
+    if name is not None:
+        char = _ENTITY_CHARS.get(name)
+        if char is None:
+            logger.warning('Ignoring unknown entity: %s', name)
+            return match.group(0)
+        return char
+    elif hex_codepoint is not None:
+        return unichr(int(hex_codepoint, 16))
+    else:
+        return unichr(int(dec_codepoint, 10))
+
+
+def _replace_entities(text, stats=None, logger=None):
     """Replaces any HTML entities in the  text with their UTF-8 characters.
 
     Args:
         text: str.  The line of text to be processed.
+        stats: Stats.  If not None, the statistics to update.
+        logger: logging.Logger.  Logger to report unknown entities to, or None
+            to use the global logger of the program.
 
     Returns:
         str.  The modified text with all HTML entities stripped.
     """
-    pattern = re.compile(r'&(([A-Za-z]+)|#x([0-9]+)|#([0-9]+));')
-    name_match_id = 2
-    hex_match_id = 3
-    dec_match_id = 4
-
-    start_pos = 0
-    while True:
-        match = pattern.search(text, start_pos)
-        if not match:
-            break
-
-        if match.group(name_match_id):
-            name = match.group(name_match_id)
-            if name in htmlentitydefs.name2codepoint:
-                text, start_pos = _replace_match(
-                    text, match, unichr(htmlentitydefs.name2codepoint[name]))
-            else:
-                markdown2social.LOGGER.warning('Ignoring unknown entity: %s',
-                                               name)
-                start_pos = match.end() + 1
-        elif match.group(hex_match_id):
-            codepoint = int(match.group(hex_match_id), 16)
-            text, start_pos = _replace_match(text, match, unichr(codepoint))
-        else:
-            assert match.group(dec_match_id)
-            codepoint = int(match.group(dec_match_id), 10)
-            text, start_pos = _replace_match(text, match, unichr(codepoint))
+    if logger is None:
+        logger = markdown2social.get_logger()
+    expand = lambda match: _expand_entity(match, logger)
 
+    if stats is None:
+        return _ENTITY_PATTERN.sub(expand, text)
+
+    start = time.time()
+    text, count = _ENTITY_PATTERN.subn(expand, text)
+    stats.times['entities'] += time.time() - start
+    stats.entities += count
     return text
 
 
-def _apply_replacements(text, replacements):
+def _apply_replacements(text, replacements, stats=None):
     """Applies a set of replacements to the given text.
 
     Args:
         text: str.  The line of text to be processed.
-        replacements: collection(tuple(re pattern, str)).  List of pairs
-            representing a compiled regular expression to match text and its
-            corresponding replacement.  The replacement can use backreferences.
+        replacements: replacement.ReplacementSet.  The replacements to apply.
+        stats: Stats.  If not None, the statistics to update.
 
     Returns:
         str.  A new line of text with all replacements applied.
     """
-    for preg, subst in replacements:
-        text = preg.sub(subst, text)
+    if stats is None:
+        return replacements.apply(text)
+
+    start = time.time()
+    text, count = replacements.subn(text)
+    stats.times['replacements'] += time.time() - start
+    stats.replacement_hits += count
     return text
 
 
+class Stats(object):
+    """Measurements collected while converting documents.
+
+    A Stats object can be passed to any number of conversions, in which case
+    it accumulates the measurements of all of them.
+
+    Attributes:
+        times: dict(str, float).  Wall time in seconds spent in each stage of
+            the conversion.  The stages are, in order: parse, for the Markdown
+            parsing; format, for the walk of the element tree excluding the
+            replacements; replacements, for the application of the
+            replacements; and entities, for the expansion of HTML entities.
+        elements: collections.Counter.  Number of elements in the parsed
+            documents by tag.
+        replacement_hits: int.  Number of substitutions made by the
+            replacements.
+        entities: int.  Number of HTML entities found in the output.
+    """
+
+    # list(str).  Names of the stages in the times attribute, in order.
+    STAGES = ['parse', 'format', 'replacements', 'entities']
+
+    def __init__(self):
+        """Constructor for an empty set of measurements."""
+        self.times = dict((stage, 0.0) for stage in self.STAGES)
+        self.elements = collections.Counter()
+        self.replacement_hits = 0
+        self.entities = 0
+
+
+# re.RegexObject.  Pattern to locate runs of horizontal whitespace.
+_COLLAPSE_SPACE_PATTERN = re.compile('[ \t]+')
+
+
+# str.  Characters that, when found at the boundary between two items, prevent
+# us from introducing a separating space between them.
+_SPACE_CHARS = ' \n\t'
+
+
 def _flatten_text(text):
     """Flattens a text node.
 
@@ -119,15 +176,10 @@ def _flatten_text(text):
         str.  The contents of the text node in a single line.
     """
     flattened = ' '.join(text.rstrip('\n').split('\n'))
+    return _COLLAPSE_SPACE_PATTERN.sub(' ', flattened)
 
-    collapse_space = re.compile('[ \t]+')
-    flattened = collapse_space.sub(' ', flattened)
-
-    return flattened
 
-
-class _Locator(collections.namedtuple('_Locator',
-                                      'ancestors cardinality rank')):
+class _Locator(object):
     """Holds information for the location of an element within an etree.
 
     We need this auxiliary class because the elements in the standard xml.etree
@@ -135,22 +187,127 @@ class _Locator(collections.namedtuple('_Locator',
     "up the tree" when we need details about parents or siblings in order to
     perform formatting decisions.
 
+    Locators are linked to the locator of their parent element and carry
+    precomputed details about their ancestors so that the formatters can query
+    them in constant time, regardless of how deep the element is.
+
     Fields:
-        ancestors: list(str).  List of element tags to the current element.
+        parent: _Locator.  Locator of the parent element, or None if this is a
+            top-level element.
+        parent_tag: str.  Tag of the parent element, or None if this is a
+            top-level element.
         cardinality: int.  Number of siblings, including self.
         rank: int.  Rank within the element; zero-indexed.
+        depth: int.  Number of ancestors of the element.
+        ordered_depth: int.  Number of <ol> ancestors of the element.
+        unordered_depth: int.  Number of <ul> ancestors of the element.
+        list_tag: str.  Tag of the closest <ol> or <ul> ancestor, or None if
+            the element is not within a list.
+        in_pre: bool.  Whether the element has a <pre> ancestor.
     """
 
-    def __init__(self, *args, **kwargs):
-        """Initializes a _Locator and validates preconditions."""
-        super(_Locator, self).__init__(*args, **kwargs)
-        assert self.rank < self.cardinality
+    __slots__ = ('parent', 'parent_tag', 'cardinality', 'rank', 'depth',
+                 'ordered_depth', 'unordered_depth', 'list_tag', 'in_pre')
+
+    def __init__(self, parent=None, parent_tag=None, cardinality=1, rank=0):
+        """Initializes a _Locator and validates preconditions.
+
+        Args:
+            parent: _Locator.  Locator of the parent element, or None for a
+                top-level element.
+            parent_tag: str.  Tag of the parent element, or None for a
+                top-level element.
+            cardinality: int.  Number of siblings, including self.
+            rank: int.  Rank within the element; zero-indexed.
+        """
+        assert rank < cardinality
+        self.parent = parent
+        self.parent_tag = parent_tag
+        self.cardinality = cardinality
+        self.rank = rank
+
+        if parent is None:
+            assert parent_tag is None
+            self.depth = 0
+            self.ordered_depth = 0
+            self.unordered_depth = 0
+            self.list_tag = None
+            self.in_pre = False
+        else:
+            self.depth = parent.depth + 1
+            self.ordered_depth = parent.ordered_depth
+            self.unordered_depth = parent.unordered_depth
+            self.list_tag = parent.list_tag
+            if parent_tag == 'ol':
+                self.ordered_depth += 1
+                self.list_tag = parent_tag
+            elif parent_tag == 'ul':
+                self.unordered_depth += 1
+                self.list_tag = parent_tag
+            self.in_pre = parent.in_pre or parent_tag == 'pre'
+
+    def child(self, tag, cardinality, rank):
+        """Creates the locator for a child of this element.
+
+        Args:
+            tag: str.  Tag of the element this locator belongs to.
+            cardinality: int.  Number of children of the element.
+            rank: int.  Rank of the child within the element; zero-indexed.
+
+        Returns:
+            _Locator.  The locator for the child.
+        """
+        return _Locator(self, tag, cardinality, rank)
+
+    @property
+    def ancestors(self):
+        """list(str).  List of element tags to the current element."""
+        ancestors = []
+        locator = self
+        while locator.parent is not None:
+            ancestors.append(locator.parent_tag)
+            locator = locator.parent
+        ancestors.reverse()
+        return ancestors
 
     def is_last(self):
         """Returns true if this element is the last among its siblings."""
         return self.rank + 1 == self.cardinality
 
 
+class _Frame(object):
+    """Formatting state of an element while its children are being processed.
+
+    Fields:
+        locator: _Locator.  Information about the position of the element in
+            the etree.
+        element: ET.Element.  The element being formatted.
+        formatter: _Formatter.  The formatter for the element.
+        parts: list(str).  Fragments of the formatted contents so far.
+        last_char: str.  Last character in parts, or the empty string if there
+            are no contents yet.
+        next_child: int.  Index of the next child element to process.
+    """
+
+    __slots__ = ('locator', 'element', 'formatter', 'parts', 'last_char',
+                 'next_child')
+
+    def __init__(self, locator, element, formatter):
+        """Constructor for an element whose contents are still empty."""
+        self.locator = locator
+        self.element = element
+        self.formatter = formatter
+        self.parts = []
+        self.last_char = ''
+        self.next_child = 0
+
+    def append(self, text):
+        """Appends a fragment to the formatted contents."""
+        if text:
+            self.parts.append(text)
+            self.last_char = text[-1]
+
+
 class _Formatter(object):
     """Formatting hooks for an etree element type.
 
@@ -233,7 +390,7 @@ class _MakeList(_Formatter):
 
     def format_contents(self, locator, unused_element, text):
         """See docstring in parent class for details."""
-        if len(locator.ancestors) > 1:
+        if locator.depth > 1:
             # We are starting a nested list so we must introduce a line break.
             # This is necessary because the nested list starts within a previous
             # <li> element which has not yet been closed.
@@ -245,17 +402,25 @@ class _MakeList(_Formatter):
 class _MakeListItem(_Formatter):
     """Adds a link to an element."""
 
+    def __init__(self, bold_bullets=True):
+        """Constructor.
+
+        Args:
+            bold_bullets: bool.  Whether to render the bullets in bold face.
+        """
+        self._bullet_format = '*%s*' if bold_bullets else '%s'
+
     def format_contents(self, locator, unused_element, text):
         """See docstring in parent class for details."""
-        list_tags = [tag for tag in locator.ancestors if tag in ['ol', 'ul']]
-        indentation = ' ' * ((len(list_tags) - 1) * 4)
+        nesting = locator.ordered_depth + locator.unordered_depth
+        indentation = ' ' * ((nesting - 1) * 4)
 
         bullet = None
-        if list_tags[-1] == 'ul':
-            level = len([tag for tag in list_tags if tag == 'ul'])
+        if locator.list_tag == 'ul':
+            level = locator.unordered_depth
             bullet = _UNORDERED_BULLETS[(level - 1) % len(_UNORDERED_BULLETS)]
         else:
-            level = len([tag for tag in list_tags if tag == 'ol'])
+            level = locator.ordered_depth
             bullet = chr(
                 ord(_ORDERED_BULLETS[(level - 1) % len(_ORDERED_BULLETS)]) +
                 locator.rank) + '.'
@@ -268,27 +433,26 @@ class _MakeListItem(_Formatter):
             # or due to it being at the end of a paragraph.
             text += '\n'
 
-        return '%s*%s* %s' % (indentation, bullet, text)
+        return '%s%s %s' % (indentation, self._bullet_format % bullet, text)
 
 
 class _PassText(_Formatter):
     """Lets a piece of text pass verbatim."""
 
-    def __init__(self, warn_unknown):
+    def __init__(self, logger=None):
         """Constructor.
 
         Args:
-            warn_unknown: bool.  If true, emit a warning when the element being
-                processed is unknown.  This often indicates a possibility in
-                improving this converter.
+            logger: logging.Logger.  If not None, emit a warning to this logger
+                when the element being processed is unknown.  This often
+                indicates a possibility in improving this converter.
         """
-        self._warn_unknown = warn_unknown
+        self._logger = logger
 
     def format_contents(self, unused_locator, element, text):
         """See docstring in parent class for details."""
-        if self._warn_unknown:
-            markdown2social.LOGGER.warning('Unhandled element type: %s',
-                                           element.tag)
+        if self._logger is not None:
+            self._logger.warning('Unhandled element type: %s', element.tag)
         return text
 
 
@@ -297,14 +461,14 @@ class _Quote(_Formatter):
 
     def format_text(self, locator, element):
         """See docstring in parent class for details."""
-        if 'pre' in locator.ancestors:
+        if locator.in_pre:
             return element.text
         else:
             return super(_Quote, self).format_text(locator, element)
 
     def format_contents(self, locator, unused_element, text):
         """See docstring in parent class for details."""
-        if 'pre' in locator.ancestors:
+        if locator.in_pre:
             return text
         else:
             delimiter = '"'
@@ -314,7 +478,7 @@ class _Quote(_Formatter):
 
     def format_tail(self, locator, element):
         """See docstring in parent class for details."""
-        if 'pre' in locator.ancestors:
+        if locator.in_pre:
             return element.tail
         else:
             return super(_Quote, self).format_tail(locator, element)
@@ -328,37 +492,167 @@ class _QuoteVerbatim(_Formatter):
         return '----\n%s\n----' % text.rstrip('\n')
 
 
-# dict(str, func(ET.Element, _Formatter)).
-# Mapping of HTML element names to _Formatter objects for Google+ output.
-_ELEMENTS = {
-    'h1': _Boldify(),
-    'h2': _Boldify(),
-    'h3': _Emphasize(),
-    'h4': _Emphasize(),
-    'h5': _Emphasize(),
-    'h6': _Emphasize(),
+def _new_gplus_formatters(logger):
+    """Creates the table of formatters for Google+ output.
+
+    Every converter gets its own table so that no formatter is ever shared by
+    two converters.
+
+    Args:
+        logger: logging.Logger.  Logger to report unknown elements to.
+
+    Returns:
+        dict(str, _Formatter).  Mapping of HTML element names to the formatters
+        for their elements.  The formatter for unknown elements is keyed by
+        None.
+    """
+    return {
+        'h1': _Boldify(),
+        'h2': _Boldify(),
+        'h3': _Emphasize(),
+        'h4': _Emphasize(),
+        'h5': _Emphasize(),
+        'h6': _Emphasize(),
+
+        'b': _Boldify(),
+        'strong': _Boldify(),
+
+        'em': _Emphasize(),
+        'i': _Emphasize(),
+
+        'a': _MakeLink(),
+
+        'code': _Quote(),
+        'tt': _Quote(),
 
-    'b': _Boldify(),
-    'strong': _Boldify(),
+        'pre': _QuoteVerbatim(),
 
-    'em': _Emphasize(),
-    'i': _Emphasize(),
+        'li': _MakeListItem(),
+        'ol': _MakeList(),
+        'ul': _MakeList(),
 
-    'a': _MakeLink(),
+        'p': _PassText(),
 
-    'code': _Quote(),
-    'tt': _Quote(),
+        None: _PassText(logger),
+    }
 
-    'pre': _QuoteVerbatim(),
 
-    'li': _MakeListItem(),
-    'ol': _MakeList(),
-    'ul': _MakeList(),
+def _new_plain_formatters(logger):
+    """Creates the table of formatters for plain text output.
 
-    'p': _PassText(False),
+    Plain text output is like Google+ output without any markup for bold face
+    and emphasis, which is suitable for sites that do not support formatting.
 
-    None: _PassText(True),
-}
+    Args:
+        logger: logging.Logger.  Logger to report unknown elements to.
+
+    Returns:
+        dict(str, _Formatter).  Mapping of HTML element names to the formatters
+        for their elements.  The formatter for unknown elements is keyed by
+        None.
+    """
+    formatters = _new_gplus_formatters(logger)
+    for tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'b', 'strong', 'em', 'i'):
+        formatters[tag] = _Formatter()
+    formatters['li'] = _MakeListItem(bold_bullets=False)
+    return formatters
+
+
+# collections.OrderedDict(str, func(logging.Logger) -> dict(str, _Formatter)).
+# Registry of output formats.  Maps the name of each format to the function
+# that creates its table of formatters; see _new_gplus_formatters.
+_FORMATS = collections.OrderedDict([
+    ('gplus', _new_gplus_formatters),
+    ('plain', _new_plain_formatters),
+])
+
+
+def output_formats():
+    """Gets the names of the supported output formats.
+
+    Returns:
+        list(str).  The names of the formats, starting with the default one.
+    """
+    return _FORMATS.keys()
+
+
+# collections.OrderedDict(str, dict(str, tuple(str))).  Registry of parsing
+# pipelines.  Maps the name of each pipeline to the python-markdown processors
+# it unregisters, keyed by the kind of processor.  The "full" pipeline is the
+# stock one.  The "lean" pipeline only keeps the processors for the syntax that
+# the formatters handle: paragraphs, headings, lists, code, emphasis, strong
+# emphasis, links of all kinds, backslash escapes and horizontal rules, which
+# must be recognized so that they are not taken for lists.  Raw HTML and
+# entities are parsed as text: they are visible to the replacements and HTML
+# blocks are joined into single lines like paragraphs are.  Images, block
+# quotes and hard line breaks are left as typed.
+_PIPELINES = collections.OrderedDict([
+    ('full', {}),
+    ('lean', {
+        'preprocessors': ('html_block',),
+        'blockprocessors': ('quote',),
+        'inlinePatterns': ('image_link', 'image_reference', 'linebreak',
+                           'html', 'entity'),
+        'postprocessors': ('raw_html',),
+    }),
+])
+
+
+def pipelines():
+    """Gets the names of the supported parsing pipelines.
+
+    Returns:
+        list(str).  The names of the pipelines, starting with the default one.
+    """
+    return _PIPELINES.keys()
+
+
+# object.  Sentinel returned by the block cache for blocks it does not know.
+_NOT_CACHED = object()
+
+
+class _RawHtmlPostprocessor(markdown.postprocessors.RawHtmlPostprocessor):
+    """Restores raw HTML in constant time per placeholder.
+
+    The stock postprocessor builds a pattern out of all the stashed HTML on
+    every call, which is fine when called once per document but quadratic when
+    called once per paragraph as _Markdown.iter_convert() does: documents can
+    have many thousands of stashed entities.  This version looks up each
+    placeholder by its index instead.  Placeholders with unknown indexes, which
+    can only come from the document itself, are left alone as the stock
+    postprocessor does.  Safe mode is not supported.
+    """
+
+    # re.RegexObject.  Matches a placeholder for stashed HTML, optionally
+    # enclosed in a paragraph.  The second group is the index of the HTML.
+    _PATTERN = re.compile(r'(<p>)?%s(\d+)%s(?(1)</p>)' % tuple(
+        re.escape(part)
+        for part in markdown.util.HTML_PLACEHOLDER.split('%s')))
+
+    def run(self, text):
+        """Replaces the placeholders in a text with their HTML.
+
+        Args:
+            text: unicode.  The text to process.
+
+        Returns:
+            unicode.  The text with the stashed HTML restored.
+        """
+        raw_html_blocks = self.markdown.htmlStash.rawHtmlBlocks
+
+        def expand(match):
+            index = int(match.group(2))
+            if index >= len(raw_html_blocks):
+                return match.group(0)
+            html = raw_html_blocks[index][0]
+            if match.group(1) is None:
+                return html
+            elif self.isblocklevel(html):
+                return html + '\n'
+            else:
+                return '<p>%s</p>' % html
+
+        return self._PATTERN.sub(expand, text)
 
 
 class _Markdown(markdown.Markdown):
@@ -376,18 +670,56 @@ class _Markdown(markdown.Markdown):
                 replacements: collection(tuple(str, str)).  List of pairs
                     representing a regular expression to match text and its
                     corresponding replacement.  The replacement can use
-                    backreferences.
+                    backreferences.  Can also be a prebuilt
+                    replacement.ReplacementSet.
+                block_cache: blockcache.BlockCache.  Cache of formatted
+                    top-level blocks to use, or None.
+                logger: logging.Logger.  Logger to report problems in the
+                    documents to, or None to use the global logger of the
+                    program.
+                fast_path: bool.  Whether to parse the documents with the
+                    fast parser in the fastpath module when possible.
+                pipeline: str.  Name of the parsing pipeline to use; see
+                    pipelines().
+
+        Raises:
+            KeyError: If the pipeline is unknown.
         """
-        replacements = kwargs.pop('replacements', None) or []
-        self.replacements = [(re.compile(regex), subst)
-                             for regex, subst in replacements]
+        replacements = kwargs.pop('replacements', None)
+        if not isinstance(replacements, replacement.ReplacementSet):
+            replacements = replacement.ReplacementSet(replacements)
+        self.replacements = replacements
+
+        self.logger = kwargs.pop('logger', None)
+        if self.logger is None:
+            self.logger = markdown2social.get_logger()
+        self._formatters = dict((name, new_formatters(self.logger))
+                                for name, new_formatters in _FORMATS.items())
+
+        self._fast_path = kwargs.pop('fast_path', False)
+
+        pipeline = kwargs.pop('pipeline', 'full')
+        if pipeline not in _PIPELINES:
+            raise KeyError('Invalid pipeline: %s' % pipeline)
+
+        self._block_cache = kwargs.pop('block_cache', None)
+        if self._block_cache is not None:
+            # Everything other than the element itself that influences the
+            # formatting of a block, to be prepended to the keys.
+            self._block_key_prefixes = dict(
+                (name, '%s\0%s\0%s\0' % (package.VERSION, name,
+                                         replacements.fingerprint()))
+                for name in _FORMATS)
+
+        # Stats.  Statistics to update during the current conversion, if any.
+        self.stats = None
 
         # Override the definition of possible formats in the parent class.  This
         # is a class attribute in the parent class and is queried in the
         # constructor, so we must override this before we call init.
-        self.output_formats = {
-            'gplus': self._format_gplus,
-        }
+        self.output_formats = dict(
+            (name, functools.partial(self._format_document, output_format=name))
+            for name in _FORMATS)
 
         markdown.Markdown.__init__(self, *args, **kwargs)
 
@@ -395,83 +727,366 @@ class _Markdown(markdown.Markdown):
         # our plain-text output.
         self.stripTopLevelTags = False  # pylint: disable=invalid-name
 
-    def _format_gplus(self, document):
-        """Convert a Markdown document to a Google+ post.
+        self.postprocessors['raw_html'] = _RawHtmlPostprocessor(self)
+
+        registries = {
+            'preprocessors': self.preprocessors,
+            'blockprocessors': self.parser.blockprocessors,
+            'inlinePatterns': self.inlinePatterns,
+            'postprocessors': self.postprocessors,
+        }
+        for kind, names in _PIPELINES[pipeline].items():
+            for name in names:
+                del registries[kind][name]
+
+    def convert(self, source):
+        """Converts a Markdown document into the configured output format.
+
+        Args:
+            source: unicode.  The Markdown document.
+
+        Returns:
+            unicode.  The converted document.
+        """
+        if not self._fast_path:
+            return markdown.Markdown.convert(self, source)
+        return self.convert_formats(source,
+                                    [self.output_format])[self.output_format]
+
+    def convert_formats(self, source, formats, heading=None):
+        """Converts a Markdown document into several output formats.
+
+        This is the same as convert() but parses the document only once and
+        then formats the resulting tree for each of the requested formats.
+
+        Args:
+            source: unicode.  The Markdown document.
+            formats: list(str).  Names of the output formats to generate.
+            heading: unicode.  Markdown line to parse as if it preceded the
+                document, followed by a blank line, or None.  Avoids copying
+                the whole document just to prepend a title to it.
+
+        Returns:
+            dict(str, unicode).  The converted document keyed by format.
+
+        Raises:
+            KeyError: If any of the formats is unknown.
+            TypeError: If the document is not a string.
+        """
+        for output_format in formats:
+            if output_format not in self.output_formats:
+                raise KeyError('Invalid output format: %s' % output_format)
+
+        if not isinstance(source, basestring):
+            raise TypeError('Invalid document type: %s' % type(source).__name__)
+        if heading is None and not source.strip():
+            return dict((output_format, u'') for output_format in formats)
+
+        root = self._parse(source, heading)
+        del source
+
+        outputs = {}
+        for i, output_format in enumerate(formats):
+            output = self._format_document(root, output_format,
+                                           count_elements=(i == 0))
+            for postprocessor in self.postprocessors.values():
+                output = postprocessor.run(output)
+            outputs[output_format] = output.strip()
+        return outputs
+
+    def iter_convert(self, source, heading=None):
+        """Converts a Markdown document one top-level block at a time.
+
+        Each block is formatted, postprocessed and then released, so the
+        formatted document is never held in memory in full.
+
+        Args:
+            source: unicode.  The Markdown document.
+            heading: unicode.  Markdown line to parse as if it preceded the
+                document, followed by a blank line, or None.
+
+        Yields:
+            unicode.  Fragments of the converted document which, once
+            concatenated, are the same as the return value of convert().
+            Fragments only start or end with whitespace where the document
+            has paragraph breaks.
+        """
+        if not isinstance(source, basestring):
+            raise TypeError('Invalid document type: %s' % type(source).__name__)
+        if heading is None and not source.strip():
+            return
+
+        root = self._parse(source, heading)
+        del source
+
+        # Detach the blocks from the tree and consume them in order, so that
+        # each one can be freed as soon as it has been formatted.
+        blocks = list(root)
+        blocks.reverse()
+        root.clear()
+
+        # Mimic the join of the paragraphs and the stripping of the output done
+        # by convert() without ever looking at more than one paragraph.
+        first = True
+        pending = ''
+        while blocks:
+            paragraph = self._format_block(blocks.pop(), self.output_format)
+            if paragraph is None:
+                continue
+            for postprocessor in self.postprocessors.values():
+                paragraph = postprocessor.run(paragraph)
+
+            if first:
+                paragraph = paragraph.lstrip()
+                first = not paragraph
+            else:
+                paragraph = '\n\n' + paragraph
+            stripped = paragraph.rstrip()
+            if stripped:
+                yield pending + stripped
+                pending = paragraph[len(stripped):]
+            else:
+                pending += paragraph
+
+    def _parse(self, source, heading=None):
+        """Parses a Markdown document into its element tree.
+
+        Args:
+            source: unicode.  The Markdown document.  Must not be blank unless
+                there is a heading.
+            heading: unicode.  Markdown line to parse as if it preceded the
+                document, followed by a blank line, or None.
+
+        Returns:
+            ET.Element.  The root of the document, ready to be formatted.
+        """
+        source = unicode(source)
+
+        if self._fast_path:
+            # Entities are hidden from the formatters by the full pipeline, so
+            # they can only be exposed to the replacements if there are none.
+            allow_entities = (not self.replacements or
+                              'entity' not in self.inlinePatterns)
+            root = fastpath.parse(source, allow_entities=allow_entities,
+                                  heading=heading)
+            if root is not None:
+                self.treeprocessors['prettify'].run(root)
+                return root
+
+        # Mirrors the pipeline of markdown.Markdown.convert() up to the
+        # serialization of the tree, which is what we repeat for each format.
+        self.lines = source.split('\n')
+        del source
+        if heading is not None:
+            self.lines[:0] = unicode(heading).split('\n') + [u'']
+        for preprocessor in self.preprocessors.values():
+            self.lines = preprocessor.run(self.lines)
+        root = self.parser.parseDocument(self.lines).getroot()
+        self.lines = None  # Release the preprocessed copy of the document.
+        for treeprocessor in self.treeprocessors.values():
+            new_root = treeprocessor.run(root)
+            if new_root is not None:
+                root = new_root
+        return root
+
+    def _format_document(self, document, output_format, count_elements=True):
+        """Formats a Markdown document in the given output format.
 
         The root element of the document is special, and this is why we handle
         it directly here: we want each top-level element of the HTML tree to end
-        up as a separate "paragraph" in the final Google+ post.  All other
-        elements should be considered span-level and are handled in our
-        recursive algorithm.
+        up as a separate "paragraph" in the final post.  All other elements
+        should be considered span-level and are handled in our tree-walking
+        algorithm.
 
         Args:
             document: ET.ElementTree.
+            output_format: str.  Name of the output format.
+            count_elements: bool.  Whether to count the elements of the
+                document in the statistics, if any, which must be done only
+                once per document.
 
         Returns:
-            str.  The textual Google+ post.
+            str.  The textual post.
 
         """
         root = ET.ElementTree(document).getroot()
 
+        stats = self.stats
+        if stats is not None:
+            start = time.time()
+            replacements_before = stats.times['replacements']
+            if count_elements:
+                for element in root:
+                    stats.elements.update(
+                        child.tag for child in element.iter())
+
         paragraphs = []
         for element in root:
-            paragraph = self._format_element(
-                _Locator(ancestors=[], cardinality=1, rank=0), element)
+            paragraph = self._format_block(element, output_format)
             if paragraph is not None:
                 paragraphs.append(paragraph)
-        return '\n\n'.join(paragraphs)
+        post = '\n\n'.join(paragraphs)
+
+        if stats is not None:
+            stats.times['format'] += (
+                time.time() - start -
+                (stats.times['replacements'] - replacements_before))
+        return post
+
+    def _format_block(self, element, output_format):
+        """Formats a top-level element of the document.
+
+        Args:
+            element: ET.Element.  A top-level element of the document.
+            output_format: str.  Name of the output format.
+
+        Returns:
+            str.  A string representing the formatted element, or None if the
+            element generated no output.
+        """
+        if self._block_cache is None:
+            return self._format_element(_Locator(), element,
+                                        self._formatters[output_format])
+        return self._format_cached_element(element, output_format)
+
+    def _format_cached_element(self, element, output_format):
+        """Formats a top-level element reusing its cached formatting if any.
+
+        Args:
+            element: ET.Element.  A top-level element of the document.
+            output_format: str.  Name of the output format.
+
+        Returns:
+            str.  A string representing the formatted element, or None if the
+            element generated no output.
+        """
+        key = hashlib.sha1(self._block_key_prefixes[output_format] +
+                           ET.tostring(element, encoding='utf-8')).hexdigest()
+        paragraph = self._block_cache.get(key, default=_NOT_CACHED)
+        if paragraph is _NOT_CACHED:
+            paragraph = self._format_element(
+                _Locator(), element, self._formatters[output_format])
+            self._block_cache.put(key, paragraph)
+        return paragraph
+
+    def _open_element(self, locator, element, formatters):
+        """Starts the formatting of an element.
+
+        Args:
+            locator: _Locator.  Information about the position of the element in
+                the etree.
+            element: ET.Element.  An element in the tree.
+            formatters: dict(str, _Formatter).  The formatters of the output
+                format.
+
+        Returns:
+            _Frame.  The formatting state of the element, with its text already
+            processed.
+        """
+        formatter = formatters.get(element.tag, formatters[None])
+        frame = _Frame(locator, element, formatter)
+        if element.text:
+            frame.append(_apply_replacements(
+                formatter.format_text(locator, element), self.replacements,
+                self.stats))
+        return frame
+
+    def _close_element(self, frame):
+        """Finishes the formatting of an element.
+
+        Args:
+            frame: _Frame.  The formatting state of the element, with all of its
+                children already processed.
 
-    def _format_element(self, locator, element):
+        Returns:
+            str.  A string representing the formatted element.
+        """
+        locator, element, formatter = (frame.locator, frame.element,
+                                       frame.formatter)
+        line = formatter.format_contents(locator, element, ''.join(frame.parts))
+        if element.tail:
+            line += _apply_replacements(formatter.format_tail(locator, element),
+                                        self.replacements, self.stats)
+        return line
+
+    def _format_element(self, locator, element, formatters):
         """Formats an element of the document.
 
         An element, as defined by the Markdown library, is composed of a leading
         literal text, an optional ordered list of subelements, and an optional
         literal tail.
 
+        The tree is walked with an explicit stack instead of recursion so that
+        deeply-nested documents cannot exhaust the interpreter's stack, and the
+        contents of each element are accumulated as a list of fragments that is
+        joined only once.
+
         Args:
             locator: _Locator.  Information about the position of the element in
                 the etree.
             element: ET.Element.  An element in the tree.
+            formatters: dict(str, _Formatter).  The formatters of the output
+                format.
 
         Returns:
             str.  A string representing the formatted element or None if there
             is nothing to output for this element.
         """
-        formatter = _ELEMENTS.get(element.tag, _ELEMENTS[None])
-
-        line = ''
-        if element.text:
-            line += _apply_replacements(formatter.format_text(locator, element),
-                                        self.replacements)
-
-        for i, item in enumerate(element):
-            item_locator = _Locator(ancestors=locator.ancestors + [element.tag],
-                                    cardinality=len(element),
-                                    rank=i)
-            item_line = self._format_element(item_locator, item)
+        stack = [self._open_element(locator, element, formatters)]
+        while True:
+            frame = stack[-1]
+            if frame.next_child < len(frame.element):
+                rank = frame.next_child
+                frame.next_child += 1
+                item_locator = frame.locator.child(
+                    frame.element.tag, len(frame.element), rank)
+                stack.append(self._open_element(
+                    item_locator, frame.element[rank], formatters))
+                continue
+
+            stack.pop()
+            line = self._close_element(frame)
+            if not stack:
+                return line
 
             # Add a space between items if necessary.  In particular, we must
             # only do this if neither the current line ends nor the item's line
             # starts with a newline character because otherwise we would end up
             # with trailing spaces.  This could happen because of the way we
             # handle the formatting of lists.
-            if ((line and line[-1] not in ' \n\t') and
-                (item_line and item_line[0] not in ' \n\t')):
-                line += ' '
-            line += item_line
+            parent = stack[-1]
+            if ((parent.last_char and parent.last_char not in _SPACE_CHARS) and
+                    (line and line[0] not in _SPACE_CHARS)):
+                parent.append(' ')
+            parent.append(line)
 
-        line = formatter.format_contents(locator, element, line)
 
-        if element.tail:
-            line += _apply_replacements(formatter.format_tail(locator, element),
-                                        self.replacements)
+# tuple(str).  Front Matter properties that the converters use.  Callers can
+# pass these to front_matter.parse() to skip loading any others.
+METADATA_KEYS = ('title',)
 
-        return line
+
+def _metadata_heading(metadata):
+    """Computes the Markdown heading that represents the metadata of a post.
+
+    Args:
+        metadata: dict(str, str).  A dictionary containing the YAML Front
+            Matter of the post.  May be empty.
+
+    Returns:
+        unicode.  The heading, or None if the post has no title.
+    """
+    if 'title' not in metadata:
+        return None
+    return u'' + '# %s' % metadata['title']
 
 
 def merge_metadata_with_content(metadata, content):
     """Adds relevant metadata entries to the post content.
 
+    The converters do not use this: they parse the heading of the metadata
+    separately to avoid creating a copy of the whole content.
+
     Args:
         metadata: dict(str, str).  A dictionary containing the YAML Front
             Matter of the post.  May be empty.
@@ -481,16 +1096,243 @@ def merge_metadata_with_content(metadata, content):
         unicode.  The modified content with additional text corresponding to
         the metadata.
     """
-    output = u''
-    if 'title' in metadata:
-        output += '# %s\n\n' % metadata['title']
-    output += content
-    return output
+    heading = _metadata_heading(metadata)
+    if heading is None:
+        return u'' + content
+    return heading + '\n\n' + content
+
+
+class Converter(object):
+    """Reusable Markdown to Google+ converter.
+
+    Constructing the underlying Markdown parser is expensive: the library
+    registers all of its processors and we compile all the replacement
+    expressions.  This class does that work once and then reuses the same
+    parser for every document passed to convert(), which is what callers that
+    process many documents in a row should use.
+
+    Converters do not share any mutable state, so different converters can be
+    used from different threads at the same time.  A single converter can also
+    be shared by multiple threads, but it converts one document at a time, so
+    threads that want to convert documents concurrently should each have their
+    own converter.  Note that the block cache and the statistics, if any, are
+    not protected against concurrent access.
+    """
 
+    def __init__(self, replacements=None, output_format='gplus',
+                 block_cache=None, logger=None, fast_path=False,
+                 pipeline='full'):
+        """Constructor.
 
-def convert(metadata, content, replacements=None):
+        Args:
+            replacements: collection(tuple(str, str)).  List of pairs
+                representing a regular expression to match text and its
+                corresponding replacement.  The replacement can use
+                backreferences.
+            output_format: str.  Name of the output format to generate.
+            block_cache: blockcache.BlockCache.  Cache in which to look up and
+                store the formatting of the top-level blocks of the documents,
+                or None to format every block.  The caller is responsible for
+                saving the cache.
+            logger: logging.Logger.  Logger to report problems in the
+                documents to, such as unknown HTML entities, or None to use
+                the global logger of the program.
+            fast_path: bool.  Whether to parse the documents with a faster
+                parser that only supports the subset of Markdown that the
+                formatters handle, falling back to python-markdown for the
+                documents that use anything else.  The output is the same
+                either way.
+            pipeline: str.  Name of the python-markdown pipeline to parse the
+                documents with; see pipelines().  The "lean" pipeline is
+                faster but only recognizes the Markdown syntax that the
+                formatters handle, leaving any other syntax as typed.
+
+        Raises:
+            KeyError: If the pipeline is unknown.
+        """
+        self._lock = threading.Lock()
+        self._markdown = _Markdown(output_format=output_format,
+                                   replacements=replacements,
+                                   block_cache=block_cache, logger=logger,
+                                   fast_path=fast_path, pipeline=pipeline)
+
+    @property
+    def replacements(self):
+        """The replacements applied by this converter.
+
+        Returns:
+            replacement.ReplacementSet.  The replacements.
+        """
+        return self._markdown.replacements
+
+    def convert(self, metadata, content, stats=None):
+        """Converts a Markdown document in raw form to a Google+ post.
+
+        Args:
+            metadata: dict(str, str).  A dictionary containing the YAML Front
+                Matter of the post.  May be empty.
+            content: unicode.  The Markdown document in raw format.
+            stats: Stats.  If not None, the statistics to update with the
+                measurements of this conversion.
+
+        Returns:
+            unicode.  The Google+ text ready to be pasted into the browser.
+        """
+        with self._lock:
+            return self._convert_locked(metadata, content, stats)
+
+    def convert_formats(self, metadata, content, formats, stats=None):
+        """Converts a Markdown document in raw form to several output formats.
+
+        The document is parsed only once regardless of the number of formats,
+        so this is cheaper than converting the document once per format.
+
+        Args:
+            metadata: dict(str, str).  A dictionary containing the YAML Front
+                Matter of the post.  May be empty.
+            content: unicode.  The Markdown document in raw format.
+            formats: list(str).  Names of the output formats to generate; see
+                output_formats().
+            stats: Stats.  If not None, the statistics to update with the
+                measurements of this conversion.
+
+        Returns:
+            dict(str, unicode).  The converted document keyed by format.
+
+        Raises:
+            KeyError: If any of the formats is unknown.
+        """
+        with self._lock:
+            return self._convert_locked(metadata, content, stats,
+                                        formats=formats)
+
+    def iter_convert(self, metadata, content):
+        """Converts a Markdown document in raw form to a Google+ post lazily.
+
+        This is the same as convert() but generates the post one paragraph at
+        a time, so that callers can write out each paragraph as soon as it is
+        ready and the memory used by the conversion is bounded by the size of
+        the parsed document and the largest paragraph rather than by the size
+        of the whole post.
+
+        The converter cannot be used by other threads until the returned
+        generator is exhausted or closed.
+
+        Args:
+            metadata: dict(str, str).  A dictionary containing the YAML Front
+                Matter of the post.  May be empty.
+            content: unicode.  The Markdown document in raw format.
+
+        Yields:
+            unicode.  Consecutive fragments of the Google+ text, typically one
+            per paragraph.
+        """
+        with self._lock:
+            self._markdown.reset()
+            fragments = self._markdown.iter_convert(
+                content, heading=_metadata_heading(metadata))
+            del content
+            for fragment in fragments:
+                # Entities never span fragments because fragments are split at
+                # whitespace.
+                yield _replace_entities(fragment, logger=self._markdown.logger)
+            yield '\n'
+
+    def _convert_locked(self, metadata, content, stats, formats=None):
+        """Implementation of convert() to be called with the lock held.
+
+        If formats is not None, implements convert_formats() instead.
+        """
+        # The parser keeps state across documents (e.g. link references and
+        # stashed HTML), so we must clear it before processing a new one.
+        self._markdown.reset()
+
+        if stats is not None:
+            return self._convert_with_stats(metadata, content, stats, formats)
+
+        return self._finish(self._render(metadata, content, formats))
+
+    def _render(self, metadata, content, formats):
+        """Runs the Markdown parser and formatters over a document.
+
+        Args:
+            metadata: dict(str, str).  The YAML Front Matter of the post.
+            content: unicode.  The Markdown document in raw format.
+            formats: list(str).  Names of the output formats to generate, or
+                None to generate the format given to the constructor.
+
+        Returns:
+            unicode or dict(str, unicode).  The formatted document if formats
+            is None, or the formatted document keyed by format otherwise.
+        """
+        heading = _metadata_heading(metadata)
+        if formats is None:
+            output_format = self._markdown.output_format
+            return self._markdown.convert_formats(
+                content, [output_format], heading=heading)[output_format]
+        else:
+            return self._markdown.convert_formats(content, formats,
+                                                  heading=heading)
+
+    def _finish(self, rendered, stats=None):
+        """Completes the conversion of the output of _render().
+
+        Args:
+            rendered: unicode or dict(str, unicode).  The return value of
+                _render().
+            stats: Stats.  If not None, the statistics to update.
+
+        Returns:
+            unicode or dict(str, unicode).  The converted document or
+            documents, matching the type of rendered.
+        """
+        if isinstance(rendered, dict):
+            return dict((output_format, self._finish(text, stats))
+                        for output_format, text in rendered.items())
+
+        # The markdown library does some strange extraction of HTML entities
+        # and puts them aside until its postprocessing stage.  We cannot hook
+        # into the process easily, which means we cannot process entities as
+        # part of the conversion algorithm above.  Therefore, just expand
+        # entities afterwards.
+        return _replace_entities(rendered + '\n', stats,
+                                 logger=self._markdown.logger)
+
+    def _convert_with_stats(self, metadata, content, stats, formats):
+        """Same as _convert_locked() but collecting statistics along the way.
+
+        Args:
+            metadata: dict(str, str).  The YAML Front Matter of the post.
+            content: unicode.  The Markdown document in raw format.
+            stats: Stats.  The statistics to update.
+            formats: list(str).  Names of the output formats to generate, or
+                None to generate the format given to the constructor.
+
+        Returns:
+            unicode or dict(str, unicode).  The converted document or
+            documents; see _render().
+        """
+        start = time.time()
+        formatting_before = stats.times['format'] + stats.times['replacements']
+        self._markdown.stats = stats
+        try:
+            rendered = self._render(metadata, content, formats)
+        finally:
+            self._markdown.stats = None
+        formatting = (stats.times['format'] + stats.times['replacements'] -
+                      formatting_before)
+        stats.times['parse'] += time.time() - start - formatting
+
+        return self._finish(rendered, stats)
+
+
+def convert(metadata, content, replacements=None, stats=None):
     """Converts a Markdown document in raw form to a Google+ post.
 
+    This is a convenience wrapper over Converter for one-off conversions.
+    Callers that process more than one document should instantiate a Converter
+    and reuse it.
+
     Args:
         metadata: dict(str, str).  A dictionary containing the YAML Front
             Matter of the post.  May be empty.
@@ -498,20 +1340,11 @@ def convert(metadata, content, replacements=None):
         replacements: collection(tuple(str, str)).  List of pairs representing
             a regular expression to match text and its corresponding
             replacement.  The replacement can use backreferences.
+        stats: Stats.  If not None, the statistics to update with the
+            measurements of this conversion.
 
     Returns:
         unicode.  The Google+ text ready to be pasted into the browser.
     """
-    markdown_document = _Markdown(output_format='gplus',
-                                  replacements=replacements)
-
-    text = markdown_document.convert(
-        merge_metadata_with_content(metadata, content)) + '\n'
-
-    # The markdown library does some strange extraction of HTML entities and
-    # puts them aside until its postprocessing stage.  We cannot hook into the
-    # process easily, which means we cannot process entities as part of the
-    # conversion algorithm above.  Therefore, just expand entities afterwards.
-    text = _replace_entities(text)
-
-    return text
+    return Converter(replacements=replacements).convert(metadata, content,
+                                                        stats=stats)
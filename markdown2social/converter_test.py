@@ -14,9 +14,17 @@
 
 import codecs
 import frontmatter
+import logging
 import os
+import random
+import threading
+import time
 import unittest
+import xml.etree.ElementTree as ET
 
+import markdown.postprocessors
+import markdown2social
+from markdown2social import blockcache
 from markdown2social import converter
 
 
@@ -143,6 +151,507 @@ class GoldenDataTest(unittest.TestCase):
     def test_utf8(self):
         self._test_one_file('utf8.txt')
 
+    def test_converter_reuse(self):
+        gplus_converter = converter.Converter()
+        for data_file in self.TESTDATA_FILES:
+            if data_file == 'replacements.txt':
+                continue  # Needs a differently-configured converter.
+            markdown, gplus = self._load_data_file(data_file)
+            metadata, content = frontmatter.parse(markdown)
+            self.assertListEqual(
+                gplus.split('\n'),
+                gplus_converter.convert(metadata, content).split('\n'))
+
+    def test_lean_pipeline(self):
+        replacements = [
+            (r'(\A|\s)(magic/[0-9_-]+)', r'\1http://\2'),
+            (r'^anchored', r'replaced'),
+        ]
+        for data_file in self.TESTDATA_FILES:
+            lean_converter = converter.Converter(
+                replacements=(replacements if data_file == 'replacements.txt'
+                              else None),
+                pipeline='lean')
+            markdown, gplus = self._load_data_file(data_file)
+            metadata, content = frontmatter.parse(markdown)
+            self.assertListEqual(
+                gplus.split('\n'),
+                lean_converter.convert(metadata, content).split('\n'))
+
+
+class ConverterTest(unittest.TestCase):
+    """Unit tests for the Converter class."""
+
+    def test_references_do_not_leak_between_documents(self):
+        gplus_converter = converter.Converter()
+        self.assertEquals(
+            'A link [http://example.com/]\n',
+            gplus_converter.convert(
+                {}, 'A [link] [1]\n\n[1]: http://example.com/\n'))
+        self.assertEquals('A [link] [1]\n',
+                          gplus_converter.convert({}, 'A [link] [1]\n'))
+
+    def test_replacements(self):
+        gplus_converter = converter.Converter(replacements=[('a', 'b')])
+        self.assertEquals('b\n', gplus_converter.convert({}, 'a'))
+        self.assertEquals('*Title b*\n\nbbc\n',
+                          gplus_converter.convert({'title': 'Title a'}, 'abc'))
+
+    def test_empty_document(self):
+        gplus_converter = converter.Converter()
+        self.assertEquals('\n', gplus_converter.convert({}, ''))
+        self.assertEquals('Foo\n', gplus_converter.convert({}, 'Foo'))
+
+    def test_logger(self):
+        warnings = []
+
+        class _RecordingHandler(logging.Handler):
+            def emit(unused_self, record):
+                warnings.append(record.getMessage())
+
+        logger = logging.getLogger('converter_test.test_logger')
+        logger.addHandler(_RecordingHandler())
+        logger.propagate = False
+        gplus_converter = converter.Converter(logger=logger)
+        gplus_converter.convert({}, 'Foo &bogus;\n\n***\n')
+        self.assertEquals(['Unhandled element type: hr',
+                           'Ignoring unknown entity: bogus'], warnings)
+
+    def test_convert_formats(self):
+        content = ('# Heading\n\nSome **bold** and _emphasized_ '
+                   'text &amp; a [link](http://example.com/).\n\n'
+                   '* First\n* Second\n')
+        gplus_converter = converter.Converter(replacements=[('text', 'words')])
+        outputs = gplus_converter.convert_formats(
+            {'title': 'Title'}, content, ['plain', 'gplus'])
+        self.assertEquals(gplus_converter.convert({'title': 'Title'}, content),
+                          outputs['gplus'])
+        self.assertEquals(
+            'Title\n\nHeading\n\n'
+            'Some bold and emphasized words & a link [http://example.com/].'
+            '\n\n# First\n# Second\n', outputs['plain'])
+
+    def test_convert_formats__empty_document(self):
+        self.assertEquals(
+            {'gplus': '\n', 'plain': '\n'},
+            converter.Converter().convert_formats({}, '', ['gplus', 'plain']))
+
+    def test_convert_formats__unknown(self):
+        self.assertRaises(KeyError, converter.Converter().convert_formats,
+                          {}, 'Foo', ['gplus', 'bogus'])
+
+    def test_convert_formats__stats(self):
+        stats = converter.Stats()
+        outputs = converter.Converter().convert_formats(
+            {}, '*a* and *b*', ['gplus', 'plain'], stats=stats)
+        self.assertEquals({'gplus': '_a_ and _b_\n', 'plain': 'a and b\n'},
+                          outputs)
+        self.assertEquals(2, stats.elements['em'])
+
+
+    def test_iter_convert(self):
+        gplus_converter = converter.Converter(replacements=[('text', 'words')])
+        fragments = gplus_converter.iter_convert(
+            {'title': 'Title'}, 'Some text &amp; more.\n\n* One\n* Two\n')
+        self.assertEquals('*Title*', next(fragments))
+        self.assertEquals(['\n\nSome words & more.', '\n\n*#* One\n*#* Two',
+                           '\n'], list(fragments))
+
+    def test_iter_convert__empty_document(self):
+        self.assertEquals(['\n'],
+                          list(converter.Converter().iter_convert({}, '  \n')))
+
+    def test_iter_convert__matches_convert(self):
+        contents = [
+            '<div>\nRaw\n</div>\n\nA &amp; B &mdash; C',
+            'A [link] [1]\n\n[1]: http://example.com/\n',
+            '    \n\n* One\n\n    * Two\n\n> Quote\n\nEnd  \n',
+            '    code\n\n        more code\n',
+        ]
+        for kwargs in [{}, {'output_format': 'plain'}, {'fast_path': True},
+                       {'block_cache': blockcache.BlockCache(os.devnull)}]:
+            gplus_converter = converter.Converter(**kwargs)
+            for content in contents:
+                self.assertEquals(
+                    gplus_converter.convert({'title': 'T'}, content),
+                    ''.join(gplus_converter.iter_convert({'title': 'T'},
+                                                         content)))
+
+    def test_iter_convert__releases_converter(self):
+        gplus_converter = converter.Converter()
+        fragments = gplus_converter.iter_convert({}, 'One\n\nTwo\n')
+        self.assertEquals('One', next(fragments))
+        fragments.close()
+        self.assertEquals('Foo\n', gplus_converter.convert({}, 'Foo'))
+
+    def test_title_matches_merged_content(self):
+        gplus_converter = converter.Converter()
+        for title in ['Title', '*Title*', '', 'Two\nlines', 'Tab\there']:
+            for content in ['', 'Text', '\n   \n    Code', '* Item\n']:
+                metadata = {'title': title}
+                merged = converter.merge_metadata_with_content(metadata,
+                                                               content)
+                self.assertEquals(gplus_converter.convert({}, merged),
+                                  gplus_converter.convert(metadata, content))
+                self.assertEquals(
+                    gplus_converter.convert({}, merged),
+                    ''.join(gplus_converter.iter_convert(metadata, content)))
+
+    def test_raw_html_matches_markdown(self):
+        content = ('<div>\nBlock\n</div>\n\nText <b>b</b> &amp; '
+                   '<span>i</span>\n\n<p>Para</p>\n\n<!-- c -->\n')
+        gplus_converter = converter.Converter()
+        stock_converter = converter.Converter()
+        # pylint: disable=protected-access
+        stock_markdown = stock_converter._markdown
+        stock_markdown.postprocessors['raw_html'] = (
+            markdown.postprocessors.RawHtmlPostprocessor(stock_markdown))
+        self.assertEquals(stock_converter.convert({}, content),
+                          gplus_converter.convert({}, content))
+
+    def test_raw_html_unknown_placeholder(self):
+        # The parser strips placeholders from the document, but the
+        # replacements can still generate them.
+        content = u'Text X &amp; <b>b</b>'
+        replacements = [('X', u'\x02wzxhzdk:99\x03')]
+        gplus_converter = converter.Converter(replacements=replacements)
+        stock_converter = converter.Converter(replacements=replacements)
+        # pylint: disable=protected-access
+        stock_markdown = stock_converter._markdown
+        stock_markdown.postprocessors['raw_html'] = (
+            markdown.postprocessors.RawHtmlPostprocessor(stock_markdown))
+        self.assertEquals(stock_converter.convert({}, content),
+                          gplus_converter.convert({}, content))
+        self.assertIn(u'\x02wzxhzdk:99\x03',
+                      gplus_converter.convert({}, content))
+
+
+class PipelineTest(unittest.TestCase):
+    """Tests for the Markdown syntax recognized by each pipeline."""
+
+    def setUp(self):
+        self.logger = logging.getLogger('converter_test.PipelineTest')
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+
+    def _convert(self, content, pipeline, replacements=None):
+        """Converts a document with a pipeline."""
+        return converter.Converter(replacements=replacements,
+                                   logger=self.logger,
+                                   pipeline=pipeline).convert({}, content)
+
+    def test_pipelines(self):
+        self.assertEquals(['full', 'lean'], converter.pipelines())
+
+    def test_unknown(self):
+        self.assertRaises(KeyError, converter.Converter, pipeline='bogus')
+
+    def test_supported_by_all(self):
+        for content in [
+                '# ATX heading', 'Setext heading\n===', 'a\n\n***\n\nb',
+                '* a\n\n    * b\n\n1. c', '    code &amp; <b>',
+                '*em* **strong** ***both*** `code` \\*escaped\\*',
+                '[inline](http://a.com/) [reference][1] [short]\n\n'
+                '[1]: http://b.com/\n[short]: http://c.com/',
+                '<http://a.com/> <me@example.com>',
+                '&amp; &copy; &#169; <b>inline</b>']:
+            self.assertEquals(self._convert(content, 'full'),
+                              self._convert(content, 'lean'),
+                              msg=repr(content))
+
+    def test_lean_leaves_text_as_typed(self):
+        for content, full, lean in [
+                ('> Quote\n> more', 'Quote more\n', '> Quote > more\n'),
+                ('![alt](http://a.com/b.png) text', 'text\n',
+                 '![alt](http://a.com/b.png) text\n'),
+                ('<div>\nBlock\n</div>', '<div>\nBlock\n</div>\n',
+                 '<div> Block </div>\n')]:
+            self.assertEquals(full, self._convert(content, 'full'))
+            self.assertEquals(lean, self._convert(content, 'lean'))
+
+    def test_lean_exposes_entities_to_replacements(self):
+        replacements = [('&amp;', 'and')]
+        self.assertEquals('A & B\n', self._convert('A &amp; B', 'full',
+                                                   replacements))
+        self.assertEquals('A and B\n', self._convert('A &amp; B', 'lean',
+                                                     replacements))
+
+
+class ConcurrencyTest(unittest.TestCase):
+    """Stress tests for conversions running in multiple threads."""
+
+    # int.  Number of threads to run conversions in.
+    THREADS = 8
+
+    # int.  Number of conversions each thread performs.
+    CONVERSIONS_PER_THREAD = 150
+
+    # collection(tuple(str, str)).  Replacements to configure converters with.
+    REPLACEMENTS = [('foo', 'bar'), (r'(\w+)@example', r'\1 at example')]
+
+    def setUp(self):
+        # Some documents trigger warnings, which are irrelevant here.
+        self.logger = logging.getLogger('converter_test.ConcurrencyTest')
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+
+        testdata_dir = os.path.join(os.path.dirname(__file__), 'testdata')
+        self.documents = []
+        for data_file in GoldenDataTest.TESTDATA_FILES:
+            with codecs.open(os.path.join(testdata_dir, data_file), 'r',
+                             'utf-8') as input_file:
+                markdown = input_file.read().split(
+                    GoldenDataTest.GPLUS_SEPARATOR)[0]
+            self.documents.append(frontmatter.parse(markdown))
+        self.documents.append(({}, u'A [link] [1] &amp; foo@example.\n\n'
+                                   u'[1]: http://example.com/\n'))
+        self.documents.append(({}, u'* One\n    1. Two\n        * foo\n'))
+
+        serial_converter = self._new_converter()
+        self.expected = [serial_converter.convert(metadata, content)
+                         for metadata, content in self.documents]
+
+    def _new_converter(self):
+        """Creates a converter configured for the tests."""
+        return converter.Converter(replacements=self.REPLACEMENTS,
+                                   logger=self.logger)
+
+    def _run_threads(self, make_converter):
+        """Converts the documents from many threads at once.
+
+        Args:
+            make_converter: callable.  Function that returns the converter to
+                be used by a thread.
+
+        Returns:
+            list(str).  Descriptions of the mismatches found, if any.
+        """
+        mismatches = []
+        start = threading.Event()
+
+        def work(seed):
+            gplus_converter = make_converter()
+            order = random.Random(seed)
+            start.wait()
+            for _ in xrange(self.CONVERSIONS_PER_THREAD):
+                i = order.randrange(len(self.documents))
+                metadata, content = self.documents[i]
+                gplus = gplus_converter.convert(metadata, content)
+                if gplus != self.expected[i]:
+                    mismatches.append('document %d: %r' % (i, gplus))
+
+        threads = [threading.Thread(target=work, args=(seed,))
+                   for seed in xrange(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return mismatches
+
+    def test_converter_per_thread(self):
+        self.assertEquals([], self._run_threads(self._new_converter))
+
+    def test_shared_converter(self):
+        shared = self._new_converter()
+        self.assertEquals([], self._run_threads(lambda: shared))
+
+
+class StatsTest(unittest.TestCase):
+    """Unit tests for the collection of statistics during conversions."""
+
+    def test_counters(self):
+        stats = converter.Stats()
+        gplus = converter.convert(
+            {'title': 'Title'},
+            'Some *text* &mdash; and foo &amp; foo.\n\n* One.\n* Two foo.\n',
+            replacements=[('foo', 'bar'), (r'T(wo)', r't\1')], stats=stats)
+        self.assertEquals(
+            u'*Title*\n\nSome _text_ \u2014 and bar & bar.\n\n'
+            u'*#* One.\n*#* two bar.\n', gplus)
+        self.assertEquals({'h1': 1, 'p': 1, 'em': 1, 'ul': 1, 'li': 2},
+                          stats.elements)
+        self.assertEquals(4, stats.replacement_hits)
+        self.assertEquals(2, stats.entities)
+        self.assertEquals(sorted(converter.Stats.STAGES),
+                          sorted(stats.times.keys()))
+        for stage, seconds in stats.times.iteritems():
+            self.assertLessEqual(0, seconds, msg=stage)
+        self.assertLess(0, stats.times['parse'])
+
+    def test_accumulates(self):
+        stats = converter.Stats()
+        gplus_converter = converter.Converter(replacements=[('a', 'b')])
+        gplus_converter.convert({}, 'a &amp; a', stats=stats)
+        gplus_converter.convert({}, '*a*', stats=stats)
+        self.assertEquals({'p': 2, 'em': 1}, stats.elements)
+        self.assertEquals(3, stats.replacement_hits)
+        self.assertEquals(1, stats.entities)
+
+    def test_disabled_after_conversion(self):
+        stats = converter.Stats()
+        gplus_converter = converter.Converter()
+        gplus_converter.convert({}, 'text', stats=stats)
+        gplus_converter.convert({}, '*text*')
+        self.assertEquals({'p': 1}, stats.elements)
+
+    def test_same_output(self):
+        testdata_dir = os.path.join(os.path.dirname(__file__), 'testdata')
+        for data_file in GoldenDataTest.TESTDATA_FILES:
+            with codecs.open(os.path.join(testdata_dir, data_file), 'r',
+                             'utf-8') as input_file:
+                metadata, content = frontmatter.parse(input_file.read())
+            self.assertEquals(
+                converter.convert(metadata, content),
+                converter.convert(metadata, content, stats=converter.Stats()))
+
+
+class LocatorTest(unittest.TestCase):
+    """Unit tests for the _Locator class."""
+
+    def test_top_level(self):
+        locator = converter._Locator()
+        self.assertEquals([], locator.ancestors)
+        self.assertEquals(0, locator.depth)
+        self.assertIsNone(locator.list_tag)
+        self.assertFalse(locator.in_pre)
+        self.assertTrue(locator.is_last())
+
+    def test_nesting_counters(self):
+        locator = converter._Locator()
+        for tag in ['ul', 'li', 'ol', 'li', 'ul', 'li', 'pre']:
+            locator = locator.child(tag, 3, 1)
+        self.assertEquals(['ul', 'li', 'ol', 'li', 'ul', 'li', 'pre'],
+                          locator.ancestors)
+        self.assertEquals(7, locator.depth)
+        self.assertEquals(1, locator.ordered_depth)
+        self.assertEquals(2, locator.unordered_depth)
+        self.assertEquals('ul', locator.list_tag)
+        self.assertTrue(locator.in_pre)
+        self.assertFalse(locator.is_last())
+
+    def test_parent_is_not_modified(self):
+        parent = converter._Locator().child('pre', 1, 0)
+        parent.child('ol', 2, 1)
+        self.assertEquals(1, parent.depth)
+        self.assertEquals(0, parent.ordered_depth)
+        self.assertTrue(parent.in_pre)
+
+
+class FormatterStressTest(unittest.TestCase):
+    """Stress tests for the formatting of large element trees.
+
+    The trees are constructed by hand because python-markdown itself cannot
+    parse documents with these characteristics in reasonable time.
+    """
+
+    def _format(self, root):
+        """Formats an etree as a Google+ post.
+
+        Args:
+            root: ET.Element.  The root of the document.
+
+        Returns:
+            str.  The formatted post.
+        """
+        return converter._Markdown(output_format='gplus')._format_document(
+            root, 'gplus')
+
+    def test_deeply_nested_lists(self):
+        depth = 1000
+        root = ET.Element('div')
+        parent = root
+        for _ in xrange(depth):
+            item = ET.SubElement(ET.SubElement(parent, 'ul'), 'li')
+            item.text = 'item'
+            parent = item
+
+        lines = self._format(root).split('\n')
+        self.assertEquals(depth, len(lines))
+        self.assertEquals('*#* item', lines[0])
+        self.assertEquals('    *-* item', lines[1])
+        self.assertEquals(' ' * (4 * (depth - 1)) + '*#* item', lines[-1])
+
+    def test_deeply_nested_spans(self):
+        depth = 1000
+        root = ET.Element('div')
+        parent = ET.SubElement(root, 'p')
+        for _ in xrange(depth):
+            parent = ET.SubElement(parent, 'em')
+        parent.text = 'text'
+
+        self.assertEquals('_' * depth + 'text' + '_' * depth,
+                          self._format(root))
+
+    def test_many_inline_elements(self):
+        count = 100000
+        root = ET.Element('div')
+        paragraph = ET.SubElement(root, 'p')
+        paragraph.text = 'Start'
+        for _ in xrange(count):
+            strong = ET.SubElement(paragraph, 'strong')
+            strong.text = 'w'
+            strong.tail = ','
+
+        self.assertEquals('Start' + ' *w*,' * count, self._format(root))
+
+
+class ReplaceEntitiesTest(unittest.TestCase):
+    """Unit tests for the _replace_entities function."""
+
+    def setUp(self):
+        self.warnings = []
+
+        class _RecordingHandler(logging.Handler):
+            def emit(unused_self, record):
+                self.warnings.append(record.getMessage())
+
+        self.handler = _RecordingHandler()
+        markdown2social.get_logger().addHandler(self.handler)
+        markdown2social.get_logger().propagate = False
+
+    def tearDown(self):
+        markdown2social.get_logger().removeHandler(self.handler)
+        markdown2social.get_logger().propagate = True
+
+    def test_no_entities(self):
+        self.assertEquals('foo & bar;',
+                          converter._replace_entities('foo & bar;'))
+
+    def test_named(self):
+        self.assertEquals(u'a\u2014b&c',
+                          converter._replace_entities('a&mdash;b&amp;c'))
+
+    def test_codepoints(self):
+        self.assertEquals(u'\u2014 \u07de',
+                          converter._replace_entities('&#x2014; &#2014;'))
+
+    def test_no_recursive_expansion(self):
+        self.assertEquals('&mdash;', converter._replace_entities('&amp;mdash;'))
+
+    def test_unknown(self):
+        self.assertEquals(u'&unknown;&\u2014',
+                          converter._replace_entities('&unknown;&amp;&mdash;'))
+        self.assertEquals(['Ignoring unknown entity: unknown'], self.warnings)
+
+    def test_scales_linearly(self):
+        def cost(count):
+            text = u'Some text&mdash;with &amp; entities. ' * count
+            best = None
+            for _ in xrange(3):
+                start = time.time()
+                converter._replace_entities(text)
+                elapsed = time.time() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            return best
+
+        small = cost(2000)
+        large = cost(16000)
+        # Linear growth would give a ratio of 8 and quadratic growth a ratio of
+        # 64.  Leave plenty of room for noise in between.
+        self.assertLess(large, max(small, 0.001) * 24)
+
 
 if __name__ == '__main__':
     unittest.main()
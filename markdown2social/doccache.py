@@ -0,0 +1,374 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Content-addressed cache of converted documents.
+
+Each converted document is stored in its own file named after the hash of
+everything that determines the output of a conversion: the raw input, the
+replacements and the version of the program.  Entries are written to a
+temporary file and renamed into place, so any number of processes can read
+and populate the cache at the same time without ever seeing partial entries.
+The modification time of an entry is bumped every time it is used, and trim()
+removes the least recently used entries once the cache outgrows its limit.
+
+To avoid scanning the whole cache on every conversion, the size of the cache
+is recorded in a stamp file: each scan writes the total it found, and each new
+entry appends its own size.  trim() only scans the cache when the recorded
+size exceeds the limit or after _RESCAN_WRITES new entries, which bounds the
+error of the recorded size when entries are overwritten or when appends race
+with a scan.
+
+Documents whose conversion logs warnings are not cached, so that the warnings
+are reported again on every run instead of being hidden by a cache hit.
+"""
+
+import codecs
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+
+import markdown2social
+from markdown2social import package
+from markdown2social import replacement
+
+
+# int.  Default maximum size of the cache in bytes.
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# int.  Number of entries written since the last scan of the cache after which
+# trim() scans it again even if the recorded size is within the limit.
+_RESCAN_WRITES = 1000
+
+
+def default_cache_dir():
+    """Computes the default location of the cache.
+
+    Returns:
+        str.  The markdown2social subdirectory of $XDG_CACHE_HOME, or of
+        ~/.cache if the variable is not set.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'markdown2social')
+
+
+class WarningMonitor(object):
+    """Tells whether the program logged any warnings within a block of code.
+
+    Use it around a conversion to decide whether to cache the result:
+
+        with doccache.WarningMonitor() as monitor:
+            gplus = gplus_converter.convert(metadata, content)
+        if not monitor.warned:
+            document_cache.put(key, gplus)
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.warned = False
+        self._handler = _WarningHandler(self)
+
+    def __enter__(self):
+        markdown2social.get_logger().addHandler(self._handler)
+        return self
+
+    def __exit__(self, unused_type, unused_value, unused_traceback):
+        markdown2social.get_logger().removeHandler(self._handler)
+
+
+class _WarningHandler(logging.Handler):
+    """Logging handler that flags its monitor when a warning is logged."""
+
+    def __init__(self, monitor):
+        """Constructor.
+
+        Args:
+            monitor: WarningMonitor.  The monitor to flag.
+        """
+        logging.Handler.__init__(self, logging.WARNING)
+        self._monitor = monitor
+
+    def emit(self, record):
+        self._monitor.warned = True
+
+
+class DocumentCache(object):
+    """On-disk cache of converted documents.
+
+    Failures to access the cache are logged and otherwise ignored because the
+    cache is only an optimization: a broken cache behaves as an empty one.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        """Constructor.
+
+        Args:
+            directory: str.  Directory holding the cache.  Created on demand.
+            max_size: int.  Maximum size of the cache in bytes, enforced by
+                trim().
+        """
+        self._directory = directory
+        self._objects_dir = os.path.join(directory, 'objects')
+        self._size_path = os.path.join(directory, 'size')
+        self._max_size = max_size
+
+    @staticmethod
+    def key(raw_input, replacements, output_format='gplus', pipeline='full'):
+        """Computes the key of a document.
+
+        Args:
+            raw_input: unicode.  The document to convert, including its Front
+                Matter.
+            replacements: collection(tuple(str, str)).  The replacements the
+                document is converted with.  May be None.
+            output_format: str.  Name of the format the document is converted
+                to.
+            pipeline: str.  Name of the pipeline the document is parsed with.
+
+        Returns:
+            str.  The key of the document.
+        """
+        if not isinstance(replacements, replacement.ReplacementSet):
+            replacements = replacement.ReplacementSet(replacements)
+        digest = hashlib.sha1()
+        digest.update('%s\0%s\0%s\0%s\0' % (package.VERSION, output_format,
+                                            pipeline,
+                                            replacements.fingerprint()))
+        digest.update(codecs.encode(raw_input, 'utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        """Computes the path to the file holding an entry."""
+        return os.path.join(self._objects_dir, key[:2], key[2:])
+
+    def get(self, key):
+        """Looks up a converted document.
+
+        Args:
+            key: str.  The key of the document as returned by key().
+
+        Returns:
+            unicode.  The converted document, or None if it is not cached or
+            if its entry is corrupted, in which case the entry is removed.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as input_file:
+                contents = input_file.read()
+            os.utime(path, None)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                markdown2social.get_logger().warning(
+                    'Cannot read cache entry %s: %s', path, e)
+            return None
+
+        try:
+            return codecs.decode(contents, 'utf-8')
+        except UnicodeDecodeError as e:
+            markdown2social.get_logger().warning(
+                'Removing corrupted cache entry %s: %s', path, e)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass  # Removed by someone else in the meantime.
+            return None
+
+    def put(self, key, gplus):
+        """Stores a converted document.
+
+        Args:
+            key: str.  The key of the document as returned by key().
+            gplus: unicode.  The converted document.
+        """
+        for _ in self.put_fragments(key, [gplus]):
+            pass
+
+    def put_fragments(self, key, fragments):
+        """Stores a converted document while it is being generated.
+
+        This allows storing the output of converter.Converter.iter_convert()
+        without ever holding the whole document in memory.
+
+        Args:
+            key: str.  The key of the document as returned by key().
+            fragments: iterable(unicode).  Consecutive fragments of the
+                converted document.
+
+        Yields:
+            unicode.  The fragments, unchanged.  The entry is only added to the
+            cache once all of them have been consumed, and only if no warnings
+            were logged while they were generated.
+        """
+        path = self._path(key)
+        output = None
+        temp_path = None
+        size = 0
+        try:
+            try:
+                subdir = os.path.dirname(path)
+                if not os.path.isdir(subdir):
+                    try:
+                        os.makedirs(subdir)
+                    except OSError as e:
+                        if e.errno != errno.EEXIST:  # Lost a race; that's fine.
+                            raise
+                handle, temp_path = tempfile.mkstemp(dir=subdir, prefix='.tmp')
+                output = os.fdopen(handle, 'wb')
+            except (IOError, OSError) as e:
+                markdown2social.get_logger().warning(
+                    'Cannot write cache entry %s: %s', path, e)
+
+            with WarningMonitor() as monitor:
+                for fragment in fragments:
+                    if output is not None and not monitor.warned:
+                        try:
+                            encoded = codecs.encode(fragment, 'utf-8')
+                            output.write(encoded)
+                            size += len(encoded)
+                        except (IOError, OSError) as e:
+                            markdown2social.get_logger().warning(
+                                'Cannot write cache entry %s: %s', path, e)
+                            output.close()
+                            output = None
+                    yield fragment
+
+            if output is not None and not monitor.warned:
+                try:
+                    output.close()
+                    output = None
+                    os.rename(temp_path, path)
+                except (IOError, OSError) as e:
+                    markdown2social.get_logger().warning(
+                        'Cannot write cache entry %s: %s', path, e)
+                else:
+                    self._record_write(size)
+        finally:
+            if output is not None:
+                output.close()
+            if temp_path is not None and os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def _record_write(self, size):
+        """Adds the size of a new entry to the recorded size of the cache.
+
+        Args:
+            size: int.  Size of the new entry in bytes.
+        """
+        try:
+            handle = os.open(self._size_path, os.O_WRONLY | os.O_APPEND)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                markdown2social.get_logger().warning(
+                    'Cannot update cache size %s: %s', self._size_path, e)
+            return  # The cache has not been scanned yet, so trim() will.
+        try:
+            os.write(handle, '%d\n' % size)
+        except OSError as e:
+            markdown2social.get_logger().warning(
+                'Cannot update cache size %s: %s', self._size_path, e)
+        finally:
+            os.close(handle)
+
+    def _recorded_size(self):
+        """Reads the recorded size of the cache.
+
+        Returns:
+            int.  The size in bytes found by the last scan plus the sizes of the
+            entries written since, or None if the cache must be scanned because
+            there is no valid record or because it is time to rescan.
+        """
+        try:
+            with open(self._size_path) as input_file:
+                sizes = input_file.read().split()
+        except IOError:
+            return None
+        if not sizes or len(sizes) > _RESCAN_WRITES:
+            return None
+        try:
+            return sum(int(size) for size in sizes)
+        except ValueError:
+            return None
+
+    def trim(self):
+        """Removes the least recently used entries if the cache is too big.
+
+        The cache is only scanned if its recorded size exceeds the limit or
+        if it has not been scanned for a while.  Only one process trims the
+        cache at a time.  If another process is already doing it, this returns
+        immediately.
+        """
+        if not os.path.isdir(self._objects_dir):
+            return
+        size = self._recorded_size()
+        if size is not None and size <= self._max_size:
+            return
+
+        try:
+            lock = open(os.path.join(self._directory, 'lock'), 'a')
+        except IOError as e:
+            markdown2social.get_logger().warning('Cannot lock cache %s: %s',
+                                                 self._directory, e)
+            return
+        try:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                return  # Another process is trimming the cache.
+            self._trim_locked()
+        finally:
+            lock.close()
+
+    def _trim_locked(self):
+        """Implementation of trim() to be called with the lock held."""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self._objects_dir):
+            for filename in filenames:
+                if filename.startswith('.tmp'):
+                    continue  # Entry being written by another process.
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Removed by someone else in the meantime.
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self._max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+        temp_path = None
+        try:
+            handle, temp_path = tempfile.mkstemp(dir=self._directory,
+                                                 prefix='.tmp')
+            with os.fdopen(handle, 'w') as output:
+                output.write('%d\n' % total)
+            os.rename(temp_path, self._size_path)
+        except (IOError, OSError) as e:
+            markdown2social.get_logger().warning(
+                'Cannot record cache size %s: %s', self._size_path, e)
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.unlink(temp_path)
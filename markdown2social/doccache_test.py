@@ -0,0 +1,250 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import fcntl
+import os
+import shutil
+import tempfile
+import unittest
+
+import markdown2social
+from markdown2social import doccache
+from markdown2social import package
+
+
+class DefaultCacheDirTest(unittest.TestCase):
+    """Unit tests for the default_cache_dir function."""
+
+    def setUp(self):
+        self.old_xdg_cache_home = os.environ.pop('XDG_CACHE_HOME', None)
+
+    def tearDown(self):
+        if self.old_xdg_cache_home is None:
+            os.environ.pop('XDG_CACHE_HOME', None)
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old_xdg_cache_home
+
+    def test_xdg_cache_home(self):
+        os.environ['XDG_CACHE_HOME'] = '/some/dir'
+        self.assertEquals('/some/dir/markdown2social',
+                          doccache.default_cache_dir())
+
+    def test_home(self):
+        self.assertEquals(os.path.expanduser('~/.cache/markdown2social'),
+                          doccache.default_cache_dir())
+
+
+class WarningMonitorTest(unittest.TestCase):
+    """Unit tests for the WarningMonitor class."""
+
+    def test_warned(self):
+        with doccache.WarningMonitor() as monitor:
+            markdown2social.get_logger().info('Nothing to see')
+            self.assertFalse(monitor.warned)
+            markdown2social.get_logger().warning('Something is odd')
+        self.assertTrue(monitor.warned)
+
+    def test_only_while_active(self):
+        monitor = doccache.WarningMonitor()
+        with monitor:
+            pass
+        markdown2social.get_logger().warning('Something is odd')
+        self.assertFalse(monitor.warned)
+
+
+class DocumentCacheTest(unittest.TestCase):
+    """Unit tests for the DocumentCache class."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _entries(self):
+        """Returns the names of the entries in the cache."""
+        return sorted(filename for _, _, filenames
+                      in os.walk(os.path.join(self.cache_dir, 'objects'))
+                      for filename in filenames)
+
+    def test_key(self):
+        key = doccache.DocumentCache.key(u'text', [('a', 'b')])
+        self.assertEquals(key, doccache.DocumentCache.key(u'text',
+                                                          [('a', 'b')]))
+        self.assertNotEquals(key, doccache.DocumentCache.key(u'text2',
+                                                             [('a', 'b')]))
+        self.assertNotEquals(key, doccache.DocumentCache.key(u'text', None))
+        self.assertNotEquals(key, doccache.DocumentCache.key(
+            u'text', [('a', 'b')], output_format='plain'))
+        self.assertNotEquals(key, doccache.DocumentCache.key(
+            u'text', [('a', 'b')], pipeline='lean'))
+
+        old_version = package.VERSION
+        package.VERSION = old_version + '.1'
+        try:
+            self.assertNotEquals(
+                key, doccache.DocumentCache.key(u'text', [('a', 'b')]))
+        finally:
+            package.VERSION = old_version
+
+    def test_get_and_put(self):
+        cache = doccache.DocumentCache(self.cache_dir)
+        key = cache.key(u'text \u2014', None)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, u'converted \u2014')
+        self.assertEquals(u'converted \u2014', cache.get(key))
+        self.assertEquals(
+            u'converted \u2014',
+            doccache.DocumentCache(self.cache_dir).get(key))
+
+    def test_get__corrupted_entry(self):
+        cache = doccache.DocumentCache(self.cache_dir)
+        key = cache.key(u'text', None)
+        cache.put(key, u'converted \u2014')
+        with open(cache._path(key), 'rb+') as output:
+            output.truncate(len('converted ') + 1)
+        self.assertIsNone(cache.get(key))
+        self.assertEquals([], self._entries())
+
+    def test_put_failure_is_ignored(self):
+        with open(self.cache_dir, 'w') as output:
+            output.write('not a directory')
+        cache = doccache.DocumentCache(self.cache_dir)
+        key = cache.key(u'text', None)
+        cache.put(key, u'converted')
+        self.assertIsNone(cache.get(key))
+        cache.trim()
+
+    def test_put_fragments(self):
+        cache = doccache.DocumentCache(self.cache_dir)
+        key = cache.key(u'text', None)
+        fragments = cache.put_fragments(key, [u'one', u'\n\ntwo \u2014'])
+        self.assertEquals(u'one', next(fragments))
+        self.assertIsNone(cache.get(key))
+        self.assertEquals([u'\n\ntwo \u2014'], list(fragments))
+        self.assertEquals(u'one\n\ntwo \u2014', cache.get(key))
+        self.assertEquals([key[2:]], self._entries())
+
+    def test_put_fragments__abandoned(self):
+        cache = doccache.DocumentCache(self.cache_dir)
+        key = cache.key(u'text', None)
+        fragments = cache.put_fragments(key, [u'one', u'two'])
+        next(fragments)
+        fragments.close()
+        self.assertIsNone(cache.get(key))
+        self.assertEquals([], self._entries())
+
+    def test_put_fragments__failure_is_ignored(self):
+        with open(self.cache_dir, 'w') as output:
+            output.write('not a directory')
+        cache = doccache.DocumentCache(self.cache_dir)
+        key = cache.key(u'text', None)
+        self.assertEquals([u'one', u'two'],
+                          list(cache.put_fragments(key, [u'one', u'two'])))
+        self.assertIsNone(cache.get(key))
+
+    def test_put_fragments__not_cached_if_warned(self):
+        def fragments():
+            yield u'one'
+            markdown2social.get_logger().warning('Something is odd')
+            yield u'two'
+
+        cache = doccache.DocumentCache(self.cache_dir)
+        key = cache.key(u'text', None)
+        self.assertEquals([u'one', u'two'],
+                          list(cache.put_fragments(key, fragments())))
+        self.assertIsNone(cache.get(key))
+        self.assertEquals([], self._entries())
+
+    def test_trim_removes_least_recently_used(self):
+        cache = doccache.DocumentCache(self.cache_dir, max_size=25)
+        keys = [cache.key(u'text %d' % i, None) for i in xrange(4)]
+        for i, key in enumerate(keys):
+            cache.put(key, u'0123456789')
+            os.utime(cache._path(key), (1000 + i, 1000 + i))
+        cache.get(keys[0])  # Bumps the modification time.
+
+        cache.trim()
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNone(cache.get(keys[2]))
+        self.assertIsNotNone(cache.get(keys[3]))
+
+    def _put_stray_entry(self, size):
+        """Adds an old entry to the cache behind its back."""
+        subdir = os.path.join(self.cache_dir, 'objects', 'zz')
+        os.makedirs(subdir)
+        path = os.path.join(subdir, 'stray')
+        with open(path, 'w') as output:
+            output.write('x' * size)
+        os.utime(path, (1001, 1001))
+
+    def test_trim_scans_only_when_over_limit(self):
+        cache = doccache.DocumentCache(self.cache_dir, max_size=25)
+        first = cache.key(u'first', None)
+        cache.put(first, u'0123456789')
+        cache.trim()
+
+        # Entries the cache does not know about are only found by a scan.
+        self._put_stray_entry(100)
+        cache.trim()
+        self.assertEquals(2, len(self._entries()))
+
+        second = cache.key(u'second', None)
+        cache.put(second, u'0123456789')
+        cache.trim()
+        self.assertEquals(3, len(self._entries()))
+
+        os.utime(cache._path(second), (1000, 1000))
+        cache.put(cache.key(u'third', None), u'0123456789')
+        cache.trim()
+        self.assertEquals(2, len(self._entries()))
+        self.assertNotIn('stray', self._entries())
+        self.assertIsNotNone(cache.get(first))
+        self.assertIsNone(cache.get(second))
+
+    def test_trim_rescans_periodically(self):
+        old_rescan_writes = doccache._RESCAN_WRITES
+        doccache._RESCAN_WRITES = 2
+        try:
+            cache = doccache.DocumentCache(self.cache_dir, max_size=25)
+            cache.put(cache.key(u'first', None), u'0')
+            cache.trim()
+            self._put_stray_entry(100)
+            cache.put(cache.key(u'second', None), u'0')
+            cache.trim()
+            self.assertIn('stray', self._entries())
+            cache.put(cache.key(u'third', None), u'0')
+            cache.trim()
+            self.assertEquals(3, len(self._entries()))
+            self.assertNotIn('stray', self._entries())
+        finally:
+            doccache._RESCAN_WRITES = old_rescan_writes
+
+    def test_trim_skipped_while_locked(self):
+        cache = doccache.DocumentCache(self.cache_dir, max_size=0)
+        key = cache.key(u'text', None)
+        cache.put(key, u'converted')
+
+        with open(os.path.join(self.cache_dir, 'lock'), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            cache.trim()
+            self.assertEquals(1, len(self._entries()))
+        cache.trim()
+        self.assertEquals([], self._entries())
+
+
+if __name__ == '__main__':
+    unittest.main()
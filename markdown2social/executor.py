@@ -0,0 +1,569 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Non-blocking conversions for programs built around an event loop.
+
+A conversion is CPU-bound and would block the event loop of a service for as
+long as it runs.  ConversionExecutor moves conversions to a set of worker
+threads or processes and hands back Conversion objects, which complete in the
+background and invoke their callbacks from a worker thread.  To resume work
+in the event loop, the callbacks should hand the conversion back to the loop
+through its thread-safe scheduling primitive; for example, with Tornado:
+
+    conversion = executor.convert_async(metadata, content, timeout=5)
+    conversion.add_done_callback(
+        lambda conversion: io_loop.add_callback(reply, conversion))
+
+Worker threads are cheap but share the interpreter lock with the event loop,
+so they keep conversions off the loop without making them run in parallel,
+and a long regular expression replacement can delay the whole process,
+timeouts included.  Worker processes do not have these limitations and are
+the only ones whose running conversions can be interrupted, by timeouts or
+cancellation: a worker thread cannot be stopped, so a conversion that times
+out in a thread keeps the thread busy until it completes even though its
+result is discarded.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import Queue
+import threading
+import time
+
+import markdown2social
+from markdown2social import converter
+
+
+# float.  Interval in seconds at which a worker process is checked for
+# cancellation of the conversion it is running.
+_POLL_INTERVAL = 0.01
+
+
+class Error(Exception):
+    """Base class for exceptions raised by this module."""
+
+
+class BusyError(Error):
+    """Error when an executor has too many pending conversions."""
+
+
+class CancelledError(Error):
+    """Error when querying the result of a cancelled conversion."""
+
+
+class TimeoutError(Error):  # pylint: disable=redefined-builtin
+    """Error when a conversion does not complete in time."""
+
+
+class WorkerError(Error):
+    """Error when a worker process dies in the middle of a conversion."""
+
+
+class Conversion(object):
+    """A conversion that may not have completed yet."""
+
+    _PENDING = 'pending'
+    _RUNNING = 'running'
+    _FINISHED = 'finished'
+    _CANCELLED = 'cancelled'
+
+    def __init__(self, interruptible):
+        """Constructor.
+
+        Args:
+            interruptible: bool.  Whether the conversion can be cancelled once
+                it has started running.
+        """
+        self._interruptible = interruptible
+        self._condition = threading.Condition()
+        self._state = self._PENDING
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def set_running(self):
+        """Marks the conversion as running.  For use by the executor only.
+
+        Returns:
+            bool.  True if the conversion should run, or False if it already
+            completed, which happens if it was cancelled or timed out.
+        """
+        with self._condition:
+            if self._state != self._PENDING:
+                return False
+            self._state = self._RUNNING
+            return True
+
+    def _complete(self, state, result=None, exception=None):
+        """Completes the conversion and invokes its callbacks.
+
+        Args:
+            state: str.  The final state of the conversion.
+            result: unicode.  The converted document, if any.
+            exception: Exception.  The reason for the failure, if any.
+
+        Returns:
+            bool.  True if the conversion was completed by this call, or False
+            if it had already completed.
+        """
+        with self._condition:
+            if self._state in (self._FINISHED, self._CANCELLED):
+                return False
+            self._state = state
+            self._result = result
+            self._exception = exception
+            self._condition.notify_all()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._invoke(callback)
+        return True
+
+    def set_result(self, result):
+        """Completes the conversion successfully.  For use by the executor only.
+
+        Args:
+            result: unicode.  The converted document.
+        """
+        self._complete(self._FINISHED, result=result)
+
+    def set_exception(self, exception):
+        """Fails the conversion.  For use by the executor only.
+
+        Args:
+            exception: Exception.  The reason for the failure.
+        """
+        self._complete(self._FINISHED, exception=exception)
+
+    def _invoke(self, callback):
+        """Invokes a callback, logging any exception it raises."""
+        try:
+            callback(self)
+        except Exception:  # pylint: disable=broad-except
+            markdown2social.get_logger().exception(
+                'Callback of a conversion failed')
+
+    def cancel(self):
+        """Cancels the conversion.
+
+        Returns:
+            bool.  True if the conversion was cancelled, or False if it had
+            already finished or is running and cannot be interrupted.
+        """
+        with self._condition:
+            if self._state == self._CANCELLED:
+                return True
+            if self._state == self._FINISHED or (
+                    self._state == self._RUNNING and not self._interruptible):
+                return False
+        return self._complete(self._CANCELLED) or self.cancelled()
+
+    def cancelled(self):
+        """Returns whether the conversion was cancelled."""
+        with self._condition:
+            return self._state == self._CANCELLED
+
+    def running(self):
+        """Returns whether the conversion is running."""
+        with self._condition:
+            return self._state == self._RUNNING
+
+    def done(self):
+        """Returns whether the conversion completed or was cancelled."""
+        with self._condition:
+            return self._state in (self._FINISHED, self._CANCELLED)
+
+    def _wait(self, timeout):
+        """Waits for the conversion to complete.
+
+        Args:
+            timeout: float.  Maximum time to wait in seconds, or None to wait
+                forever.
+
+        Raises:
+            TimeoutError: If the conversion did not complete in time.
+            CancelledError: If the conversion was cancelled.
+        """
+        with self._condition:
+            if self._state not in (self._FINISHED, self._CANCELLED):
+                self._condition.wait(timeout)
+            if self._state == self._CANCELLED:
+                raise CancelledError('The conversion was cancelled')
+            if self._state != self._FINISHED:
+                raise TimeoutError('The conversion did not complete in time')
+
+    def result(self, timeout=None):
+        """Gets the converted document, waiting for it if necessary.
+
+        Args:
+            timeout: float.  Maximum time to wait in seconds, or None to wait
+                forever.
+
+        Returns:
+            unicode.  The converted document.
+
+        Raises:
+            TimeoutError: If the conversion did not complete in time or if it
+                exceeded its own deadline.
+            CancelledError: If the conversion was cancelled.
+            Exception: Any error raised by the conversion.
+        """
+        self._wait(timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Gets the error raised by the conversion, waiting for it if necessary.
+
+        Args:
+            timeout: float.  Maximum time to wait in seconds, or None to wait
+                forever.
+
+        Returns:
+            Exception.  The error raised by the conversion, or None if it
+            succeeded.
+
+        Raises:
+            TimeoutError: If the conversion did not complete in time.
+            CancelledError: If the conversion was cancelled.
+        """
+        self._wait(timeout)
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """Registers a function to call once the conversion completes.
+
+        The callback is invoked from the thread that completes the conversion,
+        or right away from the calling thread if the conversion has already
+        completed.
+
+        Args:
+            callback: callable.  Function that takes this conversion as its
+                only argument.
+        """
+        with self._condition:
+            if self._state not in (self._FINISHED, self._CANCELLED):
+                self._callbacks.append(callback)
+                return
+        self._invoke(callback)
+
+
+class _Watchdog(object):
+    """Fails the conversions that do not complete before their deadline."""
+
+    def __init__(self):
+        """Constructor."""
+        self._condition = threading.Condition()
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, deadline, conversion):
+        """Registers the deadline of a conversion.
+
+        Args:
+            deadline: float.  Time, as returned by time.time(), by which the
+                conversion must complete.
+            conversion: Conversion.  The conversion to fail if it misses the
+                deadline.
+        """
+        with self._condition:
+            heapq.heappush(self._deadlines,
+                           (deadline, next(self._sequence), conversion))
+            self._condition.notify()
+
+    def close(self):
+        """Stops the watchdog."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        """Main loop of the watchdog thread."""
+        while True:
+            expired = []
+            with self._condition:
+                while not self._closed and not expired:
+                    now = time.time()
+                    while self._deadlines and self._deadlines[0][0] <= now:
+                        expired.append(heapq.heappop(self._deadlines)[2])
+                    if expired:
+                        break
+                    if self._deadlines:
+                        self._condition.wait(self._deadlines[0][0] - now)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+            for conversion in expired:
+                conversion.set_exception(TimeoutError(
+                        'The conversion did not complete in time'))
+
+
+def _process_main(connection, replacements):
+    """Entry point of a worker process.
+
+    Args:
+        connection: multiprocessing.Connection.  Channel through which the
+            documents to convert are received and the results are sent.
+        replacements: collection(tuple(str, str)).  Replacements to configure
+            the converter with.
+    """
+    gplus_converter = converter.Converter(replacements=replacements)
+    while True:
+        try:
+            metadata, content = connection.recv()
+        except EOFError:
+            return
+        try:
+            connection.send((True, gplus_converter.convert(metadata, content)))
+        except Exception as e:  # pylint: disable=broad-except
+            try:
+                connection.send((False, e))
+            except Exception:  # pylint: disable=broad-except
+                # The exception cannot be pickled.
+                connection.send(
+                    (False, Error(markdown2social.error_message(e))))
+
+
+class _WorkerProcess(object):
+    """A process that runs conversions on behalf of a dispatcher thread."""
+
+    def __init__(self, replacements):
+        """Constructor.
+
+        Args:
+            replacements: collection(tuple(str, str)).  Replacements to
+                configure the converter of the process with.
+        """
+        self._connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_process_main, args=(child_connection, replacements))
+        self._process.daemon = True
+        self._process.start()
+        child_connection.close()
+
+    def convert(self, conversion, metadata, content):
+        """Runs a conversion in the process.
+
+        Args:
+            conversion: Conversion.  The conversion to complete.
+            metadata: dict(str, str).  The metadata of the document.
+            content: unicode.  The body of the document.
+
+        Returns:
+            bool.  True if the process can be reused, or False if it had to be
+            killed because the conversion was interrupted or if it died.
+        """
+        try:
+            self._connection.send((metadata, content))
+            while not self._connection.poll(_POLL_INTERVAL):
+                if conversion.done():
+                    return False  # Cancelled or timed out.
+            success, value = self._connection.recv()
+        except (EOFError, IOError, OSError) as e:
+            conversion.set_exception(WorkerError('Worker process died: %s' % e))
+            return False
+        if success:
+            conversion.set_result(value)
+        else:
+            conversion.set_exception(value)
+        return True
+
+    def kill(self):
+        """Terminates the process."""
+        self._process.terminate()
+        self._process.join()
+        self._connection.close()
+
+
+class ConversionExecutor(object):
+    """Runs conversions in the background."""
+
+    def __init__(self, replacements=None, workers=None, processes=False,
+                 max_pending=None):
+        """Constructor.
+
+        Args:
+            replacements: collection(tuple(str, str)).  List of pairs
+                representing a regular expression to match text and its
+                corresponding replacement.  The replacement can use
+                backreferences.
+            workers: int.  Maximum number of conversions to run concurrently.
+                Defaults to the number of CPUs.
+            processes: bool.  Whether to run the conversions in worker
+                processes instead of threads.  Processes allow conversions to
+                run in parallel and to be interrupted, at the cost of copying
+                every document and its result between processes.
+            max_pending: int.  Maximum number of conversions that can be
+                queued or running at any time, or None for no limit.
+        """
+        self._replacements = replacements
+        self._processes = processes
+        self._queue = Queue.Queue()
+        self._watchdog = _Watchdog()
+        if max_pending is None:
+            self._pending = None
+        else:
+            self._pending = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._active = set()
+
+        target = self._dispatch if processes else self._work
+        self._threads = []
+        for _ in xrange(workers or multiprocessing.cpu_count()):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, unused_type, unused_value, unused_traceback):
+        self.close()
+
+    def _work(self):
+        """Main loop of a worker thread."""
+        gplus_converter = converter.Converter(replacements=self._replacements)
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            conversion, metadata, content = job
+            if not conversion.set_running():
+                continue
+            try:
+                gplus = gplus_converter.convert(metadata, content)
+            except Exception as e:  # pylint: disable=broad-except
+                conversion.set_exception(e)
+            else:
+                conversion.set_result(gplus)
+
+    def _dispatch(self):
+        """Main loop of a thread that feeds a worker process."""
+        worker = None
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                conversion, metadata, content = job
+                if not conversion.set_running():
+                    continue
+                if worker is None:
+                    worker = _WorkerProcess(self._replacements)
+                if not worker.convert(conversion, metadata, content):
+                    worker.kill()
+                    worker = None
+        finally:
+            if worker is not None:
+                worker.kill()
+
+    def convert_async(self, metadata, content, timeout=None):
+        """Schedules the conversion of a document.
+
+        Args:
+            metadata: dict(str, str).  The metadata of the document.
+            content: unicode.  The body of the document.
+            timeout: float.  Maximum time in seconds for the conversion to
+                complete, counting from now, or None for no limit.
+
+        Returns:
+            Conversion.  The scheduled conversion.
+
+        Raises:
+            BusyError: If there are already max_pending conversions queued or
+                running.
+            Error: If the executor has been closed.
+        """
+        conversion = Conversion(self._processes)
+        with self._lock:
+            if self._closed:
+                raise Error('The executor is closed')
+            if self._pending is not None:
+                if not self._pending.acquire(False):
+                    raise BusyError('Too many pending conversions')
+                conversion.add_done_callback(
+                    lambda unused_conversion: self._pending.release())
+            self._active.add(conversion)
+            conversion.add_done_callback(self._active.discard)
+            self._queue.put((conversion, metadata, content))
+        if timeout is not None:
+            self._watchdog.add(time.time() + timeout, conversion)
+        return conversion
+
+    def convert_many_async(self, documents, timeout=None):
+        """Schedules the conversion of multiple documents.
+
+        Either all the documents are scheduled or none is: if one of them
+        cannot be scheduled, the conversions scheduled for the previous ones
+        are cancelled and no conversion is returned.  Only the conversions
+        that are still queued or run in worker processes are stopped, though;
+        the ones that already started in worker threads run to completion and
+        their results are discarded.
+
+        Args:
+            documents: iterable(tuple(dict(str, str), unicode)).  The metadata
+                and the body of each document.
+            timeout: float.  Maximum time in seconds for each conversion to
+                complete, counting from now, or None for no limit.
+
+        Returns:
+            list(Conversion).  The scheduled conversions, in the same order as
+            the documents.
+
+        Raises:
+            BusyError: If scheduling all the documents would exceed the
+                max_pending conversions.
+            Error: If the executor has been closed.
+        """
+        conversions = []
+        try:
+            for metadata, content in documents:
+                conversions.append(self.convert_async(metadata, content,
+                                                      timeout=timeout))
+        except Error:
+            for conversion in conversions:
+                conversion.cancel()
+            raise
+        return conversions
+
+    def close(self, wait=True):
+        """Shuts down the executor.
+
+        Args:
+            wait: bool.  Whether to wait for the pending conversions to
+                complete.  If False, the queued conversions are cancelled and
+                the running ones are interrupted if possible.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            active = list(self._active)
+            for _ in self._threads:
+                self._queue.put(None)
+        if not wait:
+            for conversion in active:
+                conversion.cancel()
+        for thread in self._threads:
+            thread.join()
+        self._watchdog.close()
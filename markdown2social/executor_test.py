@@ -0,0 +1,196 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+import time
+import unittest
+
+from markdown2social import executor
+
+
+# collection(tuple(str, str)).  Replacements that backtrack catastrophically
+# on long runs of the letter "a", which makes conversions arbitrarily slow.
+_SLOW_REPLACEMENTS = [('(a+)+b', 'x')]
+
+# unicode.  Document that takes a fraction of a second to convert with
+# _SLOW_REPLACEMENTS.
+_SLOW_DOCUMENT = u'a' * 22
+
+# unicode.  Document that takes minutes to convert with _SLOW_REPLACEMENTS.
+_ENDLESS_DOCUMENT = u'a' * 32
+
+
+class ConversionExecutorTest(unittest.TestCase):
+    """Unit tests for the ConversionExecutor class."""
+
+    # bool.  Whether the executor under test uses processes.
+    PROCESSES = False
+
+    def setUp(self):
+        self.executors = []
+
+    def tearDown(self):
+        for instance in self.executors:
+            instance.close(wait=False)
+
+    def _executor(self, **kwargs):
+        """Creates an executor that is closed at the end of the test."""
+        instance = executor.ConversionExecutor(
+            replacements=_SLOW_REPLACEMENTS, processes=self.PROCESSES,
+            **kwargs)
+        self.executors.append(instance)
+        return instance
+
+    def test_convert_async(self):
+        conversion = self._executor().convert_async({'title': 'T'}, u'Text')
+        self.assertEquals(u'*T*\n\nText\n', conversion.result(timeout=10))
+        self.assertTrue(conversion.done())
+        self.assertFalse(conversion.cancelled())
+        self.assertIsNone(conversion.exception())
+
+    def test_convert_many_async(self):
+        conversions = self._executor(workers=3).convert_many_async(
+            [({}, u'Post %d' % i) for i in xrange(10)])
+        self.assertEquals([u'Post %d\n' % i for i in xrange(10)],
+                          [conversion.result(timeout=10)
+                           for conversion in conversions])
+
+    def test_error(self):
+        conversion = self._executor().convert_async({}, None)
+        self.assertRaises(TypeError, conversion.result, timeout=10)
+        self.assertIsInstance(conversion.exception(), TypeError)
+
+    def test_callbacks(self):
+        called = threading.Event()
+        results = []
+
+        def callback(conversion):
+            results.append(conversion.result())
+            called.set()
+
+        conversion = self._executor().convert_async({}, u'Text')
+        conversion.add_done_callback(callback)
+        called.wait(10)
+        conversion.add_done_callback(callback)
+        self.assertEquals([u'Text\n', u'Text\n'], results)
+
+    def test_result_timeout(self):
+        conversion = self._executor(workers=1).convert_async(
+            {}, _SLOW_DOCUMENT)
+        self.assertRaises(executor.TimeoutError, conversion.result,
+                          timeout=0.01)
+        self.assertEquals(_SLOW_DOCUMENT + '\n', conversion.result(timeout=10))
+
+    def test_timeout_while_queued(self):
+        instance = self._executor(workers=1)
+        slow = instance.convert_async({}, _SLOW_DOCUMENT)
+        queued = instance.convert_async({}, u'Fast', timeout=0.05)
+        self.assertRaises(executor.TimeoutError, queued.result, timeout=10)
+        slow.result(timeout=10)
+
+    def test_cancel_pending(self):
+        instance = self._executor(workers=1)
+        slow = instance.convert_async({}, _SLOW_DOCUMENT)
+        queued = instance.convert_async({}, u'Fast')
+        self.assertTrue(queued.cancel())
+        self.assertTrue(queued.cancel())
+        self.assertTrue(queued.cancelled())
+        self.assertRaises(executor.CancelledError, queued.result)
+        slow.result(timeout=10)
+
+    def test_cancel_finished(self):
+        conversion = self._executor().convert_async({}, u'Text')
+        conversion.result(timeout=10)
+        self.assertFalse(conversion.cancel())
+
+    def test_max_pending(self):
+        instance = self._executor(workers=1, max_pending=2)
+        conversions = instance.convert_many_async(
+            [({}, _SLOW_DOCUMENT), ({}, u'Fast')])
+        self.assertRaises(executor.BusyError, instance.convert_async,
+                          {}, u'Rejected')
+        for conversion in conversions:
+            conversion.result(timeout=10)
+        self.assertEquals(u'Accepted\n', instance.convert_async(
+            {}, u'Accepted').result(timeout=10))
+
+    def test_max_pending__many_is_all_or_nothing(self):
+        instance = self._executor(workers=1, max_pending=2)
+        self.assertRaises(executor.BusyError, instance.convert_many_async,
+                          [({}, u'One'), ({}, u'Two'), ({}, u'Three')])
+        self.assertEquals(u'Accepted\n', instance.convert_async(
+            {}, u'Accepted').result(timeout=10))
+
+    def test_close(self):
+        instance = self._executor()
+        conversion = instance.convert_async({}, u'Text')
+        instance.close()
+        self.assertEquals(u'Text\n', conversion.result(timeout=0))
+        self.assertRaises(executor.Error, instance.convert_async, {}, u'Text')
+
+    def test_cancel_running(self):
+        conversion = self._executor().convert_async({}, _SLOW_DOCUMENT)
+        while not conversion.running():
+            time.sleep(0.001)
+        self.assertFalse(conversion.cancel())
+        conversion.result(timeout=10)
+
+
+class ProcessConversionExecutorTest(ConversionExecutorTest):
+    """Unit tests for the ConversionExecutor class when using processes."""
+
+    PROCESSES = True
+
+    def test_timeout_while_queued__does_not_wait_for_others(self):
+        instance = self._executor(workers=1)
+        slow = instance.convert_async({}, _SLOW_DOCUMENT)
+        start = time.time()
+        queued = instance.convert_async({}, u'Fast', timeout=0.05)
+        self.assertRaises(executor.TimeoutError, queued.result, timeout=10)
+        self.assertLess(time.time() - start, 0.2)
+        self.assertFalse(slow.done())
+        slow.result(timeout=10)
+
+    def test_timeout_while_running(self):
+        instance = self._executor(workers=1)
+        conversion = instance.convert_async({}, _ENDLESS_DOCUMENT, timeout=0.2)
+        self.assertRaises(executor.TimeoutError, conversion.result, timeout=10)
+        self.assertEquals(u'Next\n', instance.convert_async(
+            {}, u'Next').result(timeout=10))
+
+    def test_cancel_running(self):
+        instance = self._executor(workers=1)
+        conversion = instance.convert_async({}, _ENDLESS_DOCUMENT)
+        while not conversion.running():
+            time.sleep(0.001)
+        self.assertTrue(conversion.cancel())
+        self.assertRaises(executor.CancelledError, conversion.result)
+        self.assertEquals(u'Next\n', instance.convert_async(
+            {}, u'Next').result(timeout=10))
+
+    def test_close_without_waiting(self):
+        instance = self._executor(workers=1)
+        running = instance.convert_async({}, _ENDLESS_DOCUMENT)
+        queued = instance.convert_async({}, u'Queued')
+        while not running.running():
+            time.sleep(0.001)
+        start = time.time()
+        instance.close(wait=False)
+        self.assertLess(time.time() - start, 5)
+        self.assertTrue(running.cancelled())
+        self.assertTrue(queued.cancelled())
+
+
+if __name__ == '__main__':
+    unittest.main()
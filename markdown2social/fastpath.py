@@ -0,0 +1,373 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Fast parser for the subset of Markdown that the formatters handle.
+
+python-markdown runs every document through a long pipeline of preprocessors,
+block processors, inline patterns and tree processors, most of which deal with
+syntax that we never emit (HTML, references, images, block quotes...).  The
+parse() function in this module scans the document once and, if the document
+only uses paragraphs, ATX headings, tight lists, indented code blocks,
+emphasis, strong emphasis, inline code and inline links, builds the same
+element tree that python-markdown would have built.
+
+The subset is deliberately conservative: any construct that python-markdown
+could interpret in more than one way, or that needs context we do not track,
+makes parse() return None so that the caller falls back to python-markdown.
+The equivalence of both parsers is verified by a differential test.
+"""
+
+import re
+
+from markdown import util
+
+
+# int.  Number of spaces in an indentation level, as in python-markdown.
+_TAB_LENGTH = 4
+
+# str.  Indentation of an indentation level.
+_INDENT = ' ' * _TAB_LENGTH
+
+# re.RegexObject.  Matches lines consisting only of spaces, which
+# python-markdown empties before splitting the document into blocks.
+_BLANK_LINE_PATTERN = re.compile(r'(?<=\n) +\n')
+
+# re.RegexObject.  Same as _BLANK_LINE_PATTERN but also matches the first line,
+# for documents that follow a heading.
+_BLANK_FIRST_LINE_PATTERN = re.compile(r'(?:^|(?<=\n)) +\n')
+
+# re.RegexObject.  Matches a horizontal rule at the start of a line.  Same as
+# markdown.blockprocessors.HRProcessor.RE.
+_HR_PATTERN = re.compile(
+    r'[ ]{0,3}((-+[ ]{0,2}){3,}|(_+[ ]{0,2}){3,}|(\*+[ ]{0,2}){3,})[ ]*')
+
+# re.RegexObject.  Matches the underline of a Setext heading.
+_SETEXT_PATTERN = re.compile(r'[=-]+[ ]*$')
+
+# re.RegexObject.  Matches the marker of a list item at the start of a line.
+# The first group is the indentation, the second group is the marker and the
+# third group is the text of the item.
+_LIST_ITEM_PATTERN = re.compile(r'( *)(\d+\.|[*+-])[ ]+(.*)$')
+
+# frozenset(str).  Characters that start inline markup we may not be able to
+# handle, and therefore need a closer look when found in a text span.
+_SPECIAL_CHARS = frozenset('*_`[]!\\<&')
+
+# frozenset(str).  Characters that cannot appear in the URL of an inline link.
+_URL_EXCLUDED_CHARS = frozenset('()<>"\'`[]\\')
+
+
+def _is_hr(line):
+    """Checks if python-markdown would take a line as a horizontal rule.
+
+    Args:
+        line: unicode.  The line to check, without its list indentation.
+
+    Returns:
+        bool.  Whether the line is a horizontal rule.
+    """
+    match = _HR_PATTERN.match(line)
+    return match is not None and match.end() == len(line)
+
+
+def _is_block_start(text):
+    """Checks if a line could start a block other than a paragraph.
+
+    Args:
+        text: unicode.  A line of a paragraph or the text of a list item.
+
+    Returns:
+        bool.  Whether python-markdown could interpret the line as a heading,
+        a horizontal rule, a block quote or a list item.
+    """
+    return (text.startswith('#') or text.lstrip(' ').startswith('>') or
+            _is_hr(text) or _LIST_ITEM_PATTERN.match(text) is not None)
+
+
+def _check_span(text, start, end, allow_entities):
+    """Checks that a span of text has no markup at all.
+
+    Args:
+        text: unicode.  The text containing the span.
+        start: int.  Index of the first character of the span.
+        end: int.  Index past the last character of the span.
+        allow_entities: bool.  Whether ampersands are allowed.
+
+    Returns:
+        bool.  Whether the span is non-empty, has no surrounding whitespace,
+        fits in a single line and only contains characters that python-markdown
+        takes literally.
+    """
+    if start >= end or text[start].isspace() or text[end - 1].isspace():
+        return False
+    for i in xrange(start, end):
+        char = text[i]
+        if char == '\n':
+            return False
+        elif char in _SPECIAL_CHARS and not _is_literal(text, i,
+                                                        allow_entities):
+            return False
+    return True
+
+
+def _is_literal(text, i, allow_entities):
+    """Checks if a special character is taken literally by python-markdown.
+
+    Args:
+        text: unicode.  The text containing the character.
+        i: int.  Index of the character.
+        allow_entities: bool.  Whether ampersands are allowed.
+
+    Returns:
+        bool.  Whether the character is literal text.
+    """
+    char = text[i]
+    if char == '_':
+        # An underscore between two alphanumeric characters can neither open
+        # nor close emphasis.
+        return (0 < i < len(text) - 1 and text[i - 1].isalnum() and
+                text[i + 1].isalnum())
+    elif char == '!':
+        return text[i + 1:i + 2] != '['
+    elif char == '&':
+        return allow_entities
+    else:
+        return False
+
+
+def _parse_inline(parent, text, allow_entities):
+    """Parses the inline markup of a piece of text into an element.
+
+    Args:
+        parent: util.etree.Element.  The element to populate with the text and
+            the inline elements.
+        text: unicode.  The text to parse.
+        allow_entities: bool.  Whether ampersands are allowed.
+
+    Returns:
+        bool.  Whether the text is within the supported subset.  If false, the
+        parent has been left in an undefined state.
+    """
+    if '  \n' in text:
+        return False  # Line break.
+
+    last = None
+    plain_start = 0
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char not in _SPECIAL_CHARS or _is_literal(text, i, allow_entities):
+            i += 1
+            continue
+
+        if char == '`':
+            end = text.find('`', i + 1)
+            if (end == -1 or text[end + 1:end + 2] == '`' or
+                    '\n' in text[i + 1:end] or not text[i + 1:end].strip()):
+                return False
+            element = util.etree.Element('code')
+            element.text = util.AtomicString(text[i + 1:end].strip())
+            next_i = end + 1
+        elif char == '*':
+            if i > 0 and text[i - 1] == '*':
+                return False
+            if text[i + 1:i + 2] == '*':
+                tag, delimiter = 'strong', '**'
+            else:
+                tag, delimiter = 'em', '*'
+            start = i + len(delimiter)
+            end = text.find(delimiter, start)
+            next_i = end + len(delimiter)
+            if (end == -1 or '*' in text[start:end] or
+                    text[next_i:next_i + 1] == '*' or
+                    not _check_span(text, start, end, allow_entities)):
+                return False
+            element = util.etree.Element(tag)
+            element.text = text[start:end]
+        elif char == '[':
+            close = text.find(']', i + 1)
+            if (close == -1 or text[close + 1:close + 2] != '(' or
+                    not _check_span(text, i + 1, close, allow_entities)):
+                return False
+            end = text.find(')', close + 2)
+            url = text[close + 2:end]
+            if (end == -1 or not url or
+                    any(c.isspace() or c in _URL_EXCLUDED_CHARS for c in url)):
+                return False
+            element = util.etree.Element('a')
+            element.text = text[i + 1:close]
+            element.set('href', url)
+            next_i = end + 1
+        else:
+            return False
+
+        plain = text[plain_start:i]
+        if plain:
+            if last is None:
+                parent.text = plain
+            else:
+                last.tail = plain
+        parent.append(element)
+        last = element
+        plain_start = i = next_i
+
+    plain = text[plain_start:]
+    if plain:
+        if last is None:
+            parent.text = plain
+        else:
+            last.tail = plain
+    return True
+
+
+def _parse_list(parent, lines, allow_entities):
+    """Parses a block made of a tight list.
+
+    Args:
+        parent: util.etree.Element.  The element to append the list to.
+        lines: list(unicode).  The lines of the block.
+        allow_entities: bool.  Whether ampersands are allowed.
+
+    Returns:
+        bool.  Whether the list is within the supported subset.
+    """
+    items = []
+    previous_depth = -1
+    for line in lines:
+        match = _LIST_ITEM_PATTERN.match(line)
+        if match is None:
+            return False  # Lazy continuation line.
+        indentation, marker, text = match.groups()
+        depth, remainder = divmod(len(indentation), _TAB_LENGTH)
+        if remainder or depth > previous_depth + 1:
+            return False
+        # python-markdown parses each item and each group of nested lines
+        # as separate blocks once unindented, so check them as such.
+        if (not text.strip() or _is_block_start(text) or
+                _is_hr(line[len(indentation):])):
+            return False
+        items.append((depth, marker, text))
+        previous_depth = depth
+
+    stack = []
+    for depth, marker, text in items:
+        del stack[depth + 1:]
+        if depth == len(stack):
+            # The first item of a list.  Nested lists go within the last item
+            # of their parent list.
+            tag = 'ol' if marker[0].isdigit() else 'ul'
+            stack.append(util.etree.SubElement(
+                parent if depth == 0 else stack[-1][-1], tag))
+        item = util.etree.SubElement(stack[depth], 'li')
+        if not _parse_inline(item, text.lstrip(), allow_entities):
+            return False
+    return True
+
+
+def _parse_block(root, block, allow_entities):
+    """Parses a block of the document.
+
+    Args:
+        root: util.etree.Element.  The root of the document.
+        block: unicode.  The block to parse, without blank lines.
+        allow_entities: bool.  Whether ampersands are allowed.
+
+    Returns:
+        bool.  Whether the block is within the supported subset.
+    """
+    previous = root[-1].tag if len(root) else None
+    lines = block.split('\n')
+
+    if block.startswith(_INDENT):
+        # Consecutive code blocks are merged, and indented blocks following a
+        # list belong to the list.
+        if previous in ('pre', 'ol', 'ul'):
+            return False
+        if not all(line.startswith(_INDENT) for line in lines):
+            return False
+        pre = util.etree.SubElement(root, 'pre')
+        code = util.etree.SubElement(pre, 'code')
+        code.text = util.AtomicString(
+            '\n'.join(line[_TAB_LENGTH:] for line in lines).rstrip() + '\n')
+        return True
+
+    if '\\' in block or '<' in block:
+        return False  # Escapes and HTML.
+    first = lines[0]
+    if first.startswith(' '):
+        return False
+
+    if first.startswith('#'):
+        level = len(first) - len(first.lstrip('#'))
+        text = first[level:].strip()
+        if (len(lines) > 1 or level > 6 or first[level:level + 1] != ' ' or
+                not text or '#' in text):
+            return False
+        heading = util.etree.SubElement(root, 'h%d' % level)
+        return _parse_inline(heading, text, allow_entities)
+
+    if _LIST_ITEM_PATTERN.match(first):
+        # Lists following a list are merged into a loose list.
+        if previous in ('ol', 'ul'):
+            return False
+        return _parse_list(root, lines, allow_entities)
+
+    for i, line in enumerate(lines):
+        if (line.startswith('#') or line.lstrip(' ').startswith('>') or
+                _is_hr(line) or (i > 0 and _SETEXT_PATTERN.match(line))):
+            return False
+    paragraph = util.etree.SubElement(root, 'p')
+    return _parse_inline(paragraph, block.lstrip(), allow_entities)
+
+
+def parse(source, allow_entities=True, heading=None):
+    """Parses a Markdown document if it is within the supported subset.
+
+    Args:
+        source: unicode.  The Markdown document.  Must not be blank unless
+            there is a heading.
+        allow_entities: bool.  Whether to accept documents with ampersands in
+            them.  python-markdown hides HTML entities from the formatters, so
+            documents with entities only format the same on both parsers if
+            there are no replacements that could match them.
+        heading: unicode.  Markdown line to parse as if it preceded the
+            document, followed by a blank line, or None.
+
+    Returns:
+        util.etree.Element.  The root of the element tree of the document as
+        python-markdown would build it before running its tree processors, or
+        None if the document uses anything outside of the supported subset.
+    """
+    # Same normalization as markdown.preprocessors.NormalizeWhitespace.
+    source = source.replace(util.STX, '').replace(util.ETX, '')
+    source = source.replace('\r\n', '\n').replace('\r', '\n') + '\n\n'
+    source = source.expandtabs(_TAB_LENGTH)
+    root = util.etree.Element('div')
+    if heading is None:
+        source = _BLANK_LINE_PATTERN.sub('\n', source)
+    else:
+        # The heading must be a block on its own, which only holds if it is
+        # a single line that needs no normalization.
+        if (any(char in heading for char in '\n\r\t') or
+                util.STX in heading or util.ETX in heading or
+                not _parse_block(root, heading, allow_entities)):
+            return None
+        source = _BLANK_FIRST_LINE_PATTERN.sub('\n', source)
+
+    for block in source.split('\n\n'):
+        block = block.lstrip('\n')
+        if block and not _parse_block(root, block, allow_entities):
+            return None
+    return root
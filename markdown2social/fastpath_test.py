@@ -0,0 +1,260 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import codecs
+import frontmatter
+import logging
+import os
+import random
+import unittest
+import xml.etree.ElementTree as ET
+
+from markdown2social import converter
+from markdown2social import converter_test
+from markdown2social import fastpath
+
+
+class ParseTest(unittest.TestCase):
+    """Unit tests for the parse function."""
+
+    def _check_tree(self, expected, source, allow_entities=True):
+        """Checks that a document is parsed into the expected tree.
+
+        Args:
+            expected: str.  The serialized contents of the root element.
+            source: unicode.  The document to parse.
+            allow_entities: bool.  Value of the parameter of the same name.
+        """
+        root = fastpath.parse(source, allow_entities=allow_entities)
+        self.assertIsNotNone(root)
+        self.assertEquals('<div>%s</div>' % expected, ET.tostring(root))
+
+    def test_paragraphs(self):
+        self._check_tree('<p>First\nparagraph.</p><p>Second.</p>',
+                         u'First\nparagraph.\n\n\n   \nSecond.\n')
+
+    def test_headings(self):
+        self._check_tree('<h1>One</h1><h3>Three <em>em</em></h3>',
+                         u'# One\n\n### Three *em*\n')
+
+    def test_inline(self):
+        self._check_tree(
+            '<p>A <em>b</em> <strong>c d</strong> <code>e*f</code> '
+            '<a href="http://x/y_z">g</a> snake_case 2!</p>',
+            u'A *b* **c d** ` e*f ` [g](http://x/y_z) snake_case 2!')
+
+    def test_lists(self):
+        self._check_tree(
+            '<ul><li>One<ol><li>Two</li></ol></li><li><em>Three</em></li>'
+            '</ul>',
+            u'* One\n    1. Two\n- *Three*\n')
+
+    def test_code(self):
+        self._check_tree(
+            '<p>Code:</p><pre><code>if a &lt; b:\n    c()\n</code></pre>',
+            u'Code:\n\n    if a < b:\n        c()\n   \n')
+
+    def test_entities(self):
+        self._check_tree('<p>A &amp;amp; B</p>', u'A &amp; B')
+        self.assertIsNone(fastpath.parse(u'A &amp; B', allow_entities=False))
+
+    def test_unsupported(self):
+        for source in [
+                u'Line  \nbreak', u'Escaped \\*', u'<b>HTML</b>',
+                u'![image](http://x/)', u'[reference][1]', u'_emphasis_',
+                u'***both***', u'*open', u'`open', u'``double``',
+                u'[a](b c)', u'Title\n=====', u'> Quote', u'---',
+                u'#No space', u'####### Seven', u'# Closed #',
+                u'Text\n# Heading', u'* Item\nlazy', u'* Item\n\n* Loose',
+                u'* Item\n  * Misaligned', u'* Item\n        * Too deep',
+                u'* # Heading', u'* * Nested', u'* Item\n\n    Indented',
+                u'    Code\n\n    More code', u' Indented', u'    Code\nText']:
+            self.assertIsNone(fastpath.parse(source), msg=repr(source))
+
+
+class DifferentialTest(unittest.TestCase):
+    """Checks that the fast path converts documents as python-markdown does."""
+
+    # list(tuple(str, str)).  Replacements to configure converters with.
+    REPLACEMENTS = [('foo', 'bar'), (r'(\w+)@example', r'\1 at example'),
+                    ('amp', 'AMP')]
+
+    # list(unicode).  Fragments to build lines out of that use the syntax
+    # supported by the fast path.
+    FRAGMENTS = [
+        u'word', u'caf\xe9', u'foo', u'x@example', u'*em*', u'**strong**',
+        u'`code`', u'[link](http://x.com/a_b)', u'a_b', u'!', u'&amp;',
+        u'a&b', u'-', u'1.', u'#', u'(', u')', u'http://b.com',
+    ]
+
+    # list(unicode).  Fragments to build lines out of that the fast path must
+    # reject or handle with care.
+    NEAR_MISSES = [
+        u'``co`de``', u'_x', u'2*3', u'*', u'**', u'`', u'[', u']', u'![i](u)',
+        u'<b>', u'\\*', u'>', u'---', u'=', u'\t', u'  \n',
+        u'<http://a.com>',
+    ]
+
+    # int.  Number of random documents to check per configuration.
+    DOCUMENTS = 400
+
+    def setUp(self):
+        # Some documents trigger warnings, which are irrelevant here.
+        self.logger = logging.getLogger('fastpath_test.DifferentialTest')
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+
+        self.maxDiff = None
+
+    def _random_line(self, rng):
+        """Generates a line of text out of random fragments."""
+        fragments = []
+        for _ in xrange(rng.randint(1, 6)):
+            if rng.random() < 0.03:
+                fragments.append(rng.choice(self.NEAR_MISSES))
+            else:
+                fragments.append(rng.choice(self.FRAGMENTS))
+        return u' '.join(fragments)
+
+    def _random_block(self, rng):
+        """Generates a random block biased towards the supported subset."""
+        kind = rng.random()
+        if kind < 0.2:
+            return u'#' * rng.randint(1, 7) + u' ' + self._random_line(rng)
+        elif kind < 0.4:
+            lines = []
+            depth = 0
+            for _ in xrange(rng.randint(1, 5)):
+                depth = max(0, min(depth + rng.choice([-1, 0, 1]), 3))
+                if rng.random() < 0.1:
+                    indentation = 2 * depth + 1
+                else:
+                    indentation = 4 * depth
+                lines.append(u' ' * indentation +
+                             rng.choice([u'*', u'-', u'+', u'1.', u'2.']) +
+                             u' ' + self._random_line(rng))
+            return u'\n'.join(lines)
+        elif kind < 0.5:
+            return u'\n'.join(u'    ' + self._random_line(rng)
+                              for _ in xrange(rng.randint(1, 3)))
+        elif kind < 0.55:
+            return rng.choice([u'---', u'* * *', u'Title\n=====', u'> Quote',
+                               u'[1]: http://x.com/'])
+        else:
+            return u'\n'.join(self._random_line(rng)
+                              for _ in xrange(rng.randint(1, 3)))
+
+    def _random_document(self, rng):
+        """Generates a random document."""
+        separator = rng.choice([u'\n\n', u'\n\n', u'\n\n', u'\n',
+                                u'\n\n\n', u'\n  \n'])
+        return separator.join(self._random_block(rng)
+                              for _ in xrange(rng.randint(1, 5)))
+
+    def _golden_documents(self):
+        """Returns the documents of the golden data files."""
+        testdata_dir = os.path.join(os.path.dirname(__file__), 'testdata')
+        documents = []
+        for data_file in converter_test.GoldenDataTest.TESTDATA_FILES:
+            with codecs.open(os.path.join(testdata_dir, data_file), 'r',
+                             'utf-8') as input_file:
+                markdown = input_file.read().split(
+                    converter_test.GoldenDataTest.GPLUS_SEPARATOR)[0]
+            documents.append(frontmatter.parse(markdown.split(
+                converter_test.GoldenDataTest.MARKDOWN_SEPARATOR)[1]))
+        return documents
+
+    def _check_documents(self, documents, **kwargs):
+        """Checks that the fast path does not change the converted documents.
+
+        Args:
+            documents: list(tuple(dict, unicode)).  The documents to convert.
+            **kwargs: dict.  Keyword arguments to pass to the converters.
+        """
+        slow_converter = converter.Converter(logger=self.logger, **kwargs)
+        fast_converter = converter.Converter(logger=self.logger,
+                                             fast_path=True, **kwargs)
+        for metadata, content in documents:
+            self.assertEquals(slow_converter.convert(metadata, content),
+                              fast_converter.convert(metadata, content),
+                              msg=repr(content))
+
+    def _check_all_configurations(self, documents):
+        """Checks a set of documents with and without replacements."""
+        for output_format in converter.output_formats():
+            self._check_documents(documents, output_format=output_format)
+            self._check_documents(documents, output_format=output_format,
+                                  replacements=self.REPLACEMENTS)
+
+    def test_golden_data(self):
+        self._check_all_configurations(self._golden_documents())
+
+    def test_random_documents(self):
+        rng = random.Random(0)
+        documents = [({}, self._random_document(rng))
+                     for _ in xrange(self.DOCUMENTS)]
+        self.assertGreater(
+            sum(1 for _, content in documents
+                if fastpath.parse(content) is not None),
+            self.DOCUMENTS / 4, msg='Generator rarely hits the fast path')
+        self._check_all_configurations(documents)
+
+    def test_random_documents__with_titles(self):
+        rng = random.Random(1)
+        titles = [u'Title', u'*Emphasized* title', u'', u'  ', u'A & B',
+                  u'Tab\ttitle', u'Two\nlines', u'# Hash', u'Ends with #']
+        documents = [({'title': rng.choice(titles)},
+                      rng.choice([u'', u'\n', u'   \n', u'    \n']) +
+                      self._random_document(rng))
+                     for _ in xrange(self.DOCUMENTS / 4)]
+        self._check_all_configurations(documents)
+
+    def test_lean_pipeline(self):
+        rng = random.Random(2)
+        documents = [({}, self._random_document(rng))
+                     for _ in xrange(self.DOCUMENTS)]
+        supported = [(metadata, content) for metadata, content in documents
+                     if fastpath.parse(content, allow_entities=False)
+                     is not None]
+        for output_format in converter.output_formats():
+            for replacements in (None, self.REPLACEMENTS):
+                full_converter = converter.Converter(
+                    logger=self.logger, output_format=output_format,
+                    replacements=replacements)
+                lean_converter = converter.Converter(
+                    logger=self.logger, output_format=output_format,
+                    replacements=replacements, pipeline='lean')
+                for metadata, content in supported:
+                    self.assertEquals(
+                        full_converter.convert(metadata, content),
+                        lean_converter.convert(metadata, content),
+                        msg=repr(content))
+                self._check_documents(documents, output_format=output_format,
+                                      replacements=replacements,
+                                      pipeline='lean')
+
+    def test_convert_formats(self):
+        documents = self._golden_documents()
+        formats = converter.output_formats()
+        slow_converter = converter.Converter(logger=self.logger)
+        fast_converter = converter.Converter(logger=self.logger,
+                                             fast_path=True)
+        for metadata, content in documents:
+            self.assertEquals(
+                slow_converter.convert_formats(metadata, content, formats),
+                fast_converter.convert_formats(metadata, content, formats))
+
+
+if __name__ == '__main__':
+    unittest.main()
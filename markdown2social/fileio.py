@@ -0,0 +1,249 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Reading and writing of UTF-8 documents."""
+
+import codecs
+import errno
+import mmap
+import os
+import stat
+import sys
+import tempfile
+
+
+# int.  Size in bytes above which input files are mapped into memory instead
+# of being read into a temporary buffer before decoding them.
+MMAP_THRESHOLD = 1024 * 1024
+
+# int.  Number of bytes to read from, or characters to write to, a stream at
+# once.
+CHUNK_SIZE = 64 * 1024
+
+
+def _decode_mapped(input_file, size):
+    """Decodes a whole file by mapping it into memory.
+
+    Args:
+        input_file: file.  The open file to decode.
+        size: int.  Size of the file in bytes.  Must be positive.
+
+    Returns:
+        unicode.  The decoded contents of the file.
+    """
+    mapped = mmap.mmap(input_file.fileno(), size, access=mmap.ACCESS_READ)
+    try:
+        text, unused_consumed = codecs.utf_8_decode(mapped, 'strict', True)
+        return text
+    finally:
+        mapped.close()
+
+
+def read_file(path):
+    """Reads a UTF-8 file in bulk.
+
+    Args:
+        path: str.  Path to the file to read.
+
+    Returns:
+        unicode.  The decoded contents of the file.
+
+    Raises:
+        IOError: If the file cannot be read.
+        UnicodeDecodeError: If the file is not valid UTF-8.
+    """
+    with open(path, 'rb') as input_file:
+        size = os.fstat(input_file.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            try:
+                return _decode_mapped(input_file, size)
+            except (mmap.error, ValueError):
+                # Not all files can be mapped (e.g. special files that report a
+                # size); fall back to reading them.
+                input_file.seek(0)
+        return codecs.decode(input_file.read(), 'utf-8')
+
+
+def read_stream(stream):
+    """Reads a UTF-8 stream in chunks until EOF.
+
+    Args:
+        stream: file.  The stream to read from, such as stdin.
+
+    Returns:
+        unicode.  The decoded contents of the stream.
+
+    Raises:
+        IOError: If the stream cannot be read.
+        UnicodeDecodeError: If the stream is not valid UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parts = []
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        parts.append(decoder.decode(chunk))
+    parts.append(decoder.decode('', final=True))
+    return u''.join(parts)
+
+
+def read_inputs(paths):
+    """Reads and concatenates a collection of input files.
+
+    Args:
+        paths: list(str).  Paths to the files to read.  A path of "-" or an
+            empty list refer to stdin.
+
+    Returns:
+        unicode.  The decoded contents of all files, concatenated.
+
+    Raises:
+        IOError: If any of the files cannot be read.
+        UnicodeDecodeError: If any of the files is not valid UTF-8.
+    """
+    parts = []
+    for path in paths or ['-']:
+        if path == '-':
+            parts.append(read_stream(sys.stdin))
+        else:
+            parts.append(read_file(path))
+    return u''.join(parts)
+
+
+def write_stream(stream, text):
+    """Writes a text to a binary stream in UTF-8.
+
+    The text is encoded in chunks so that we never hold a full encoded copy of
+    a large document in memory.
+
+    Args:
+        stream: file.  The binary stream to write to, such as stdout.
+        text: unicode.  The text to write.
+
+    Raises:
+        IOError: If the stream cannot be written to.
+    """
+    start = 0
+    while start < len(text):
+        end = start + CHUNK_SIZE
+        if end < len(text) and u'\ud800' <= text[end - 1] <= u'\udbff':
+            # Do not split a surrogate pair on narrow Python builds.
+            end += 1
+        stream.write(codecs.encode(text[start:end], 'utf-8'))
+        start = end
+
+
+def write_fragments(stream, fragments):
+    """Writes a text generated in fragments to a binary stream in UTF-8.
+
+    Each fragment is written as soon as it is available, so the text is never
+    held in memory in full.
+
+    Args:
+        stream: file.  The binary stream to write to, such as stdout.
+        fragments: iterable(unicode).  Consecutive fragments of the text.
+
+    Raises:
+        IOError: If the stream cannot be written to.
+    """
+    for fragment in fragments:
+        write_stream(stream, fragment)
+
+
+def write_file(path, text):
+    """Writes a text to a file in UTF-8.
+
+    Args:
+        path: str.  Path to the file to create or overwrite.
+        text: unicode.  The text to write.
+
+    Raises:
+        IOError: If the file cannot be written to.
+    """
+    write_file_fragments(path, [text])
+
+
+def write_file_fragments(path, fragments):
+    """Writes a text generated in fragments to a file in UTF-8.
+
+    Args:
+        path: str.  Path to the file to create or overwrite.
+        fragments: iterable(unicode).  Consecutive fragments of the text.
+
+    Raises:
+        IOError: If the file cannot be written to.
+    """
+    with open(path, 'wb') as output:
+        write_fragments(output, fragments)
+
+
+def replace_file(path, text):
+    """Atomically replaces the contents of a file with a text in UTF-8.
+
+    Args:
+        path: str.  Path to the file to create or overwrite.
+        text: unicode.  The text to write.
+
+    Raises:
+        IOError: If the file cannot be written to.
+        OSError: If the file cannot be written to.
+    """
+    replace_file_fragments(path, [text])
+
+
+def replace_file_fragments(path, fragments):
+    """Atomically replaces the contents of a file with a text in UTF-8.
+
+    The text is written to a temporary file in the same directory, which is
+    then renamed over the target, so readers of the file only ever see its
+    old or its new contents.  If generating or writing the text fails, the
+    temporary file is deleted and the target is left untouched.  The new file
+    keeps the permissions of the file it replaces, or gets the default ones
+    for new files.  Symbolic links are followed, and targets that are not
+    regular files, such as devices and pipes, cannot be replaced and are
+    written to in place.
+
+    Args:
+        path: str.  Path to the file to create or overwrite.
+        fragments: iterable(unicode).  Consecutive fragments of the text.
+
+    Raises:
+        IOError: If the file cannot be written to.
+        OSError: If the file cannot be written to.
+    """
+    path = os.path.realpath(path)
+    try:
+        mode = os.stat(path).st_mode
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0666 & ~umask
+    else:
+        if not stat.S_ISREG(mode):
+            write_file_fragments(path, fragments)
+            return
+
+    directory, basename = os.path.split(path)
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + basename)
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            os.fchmod(output.fileno(), stat.S_IMODE(mode))
+            write_fragments(output, fragments)
+        os.rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
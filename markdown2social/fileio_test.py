@@ -0,0 +1,203 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import codecs
+import os
+import shutil
+import stat
+import StringIO
+import sys
+import tempfile
+import unittest
+
+from markdown2social import fileio
+
+
+# unicode.  Text with multi-byte UTF-8 sequences in it.
+_UTF8_TEXT = u'Caf\xe9 \u2014 na\xefve \U0001f600 text\n' * 50
+
+
+class FileIOTest(unittest.TestCase):
+    """Unit tests for the fileio module."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.old_mmap_threshold = fileio.MMAP_THRESHOLD
+        self.old_chunk_size = fileio.CHUNK_SIZE
+
+    def tearDown(self):
+        fileio.MMAP_THRESHOLD = self.old_mmap_threshold
+        fileio.CHUNK_SIZE = self.old_chunk_size
+        shutil.rmtree(self.tempdir)
+
+    def _write_utf8(self, name, text):
+        """Creates a UTF-8 file in the temporary directory.
+
+        Args:
+            name: str.  Basename of the file to create.
+            text: unicode.  Contents of the file.
+
+        Returns:
+            str.  Path to the created file.
+        """
+        path = os.path.join(self.tempdir, name)
+        with open(path, 'wb') as output:
+            output.write(codecs.encode(text, 'utf-8'))
+        return path
+
+    def test_read_file__small(self):
+        path = self._write_utf8('input', _UTF8_TEXT)
+        self.assertEquals(_UTF8_TEXT, fileio.read_file(path))
+
+    def test_read_file__mapped(self):
+        fileio.MMAP_THRESHOLD = 16
+        path = self._write_utf8('input', _UTF8_TEXT)
+        self.assertEquals(_UTF8_TEXT, fileio.read_file(path))
+
+    def test_read_file__empty(self):
+        fileio.MMAP_THRESHOLD = 0
+        path = self._write_utf8('input', u'')
+        self.assertEquals(u'', fileio.read_file(path))
+
+    def test_read_file__invalid_utf8(self):
+        fileio.MMAP_THRESHOLD = 1
+        path = os.path.join(self.tempdir, 'input')
+        with open(path, 'wb') as output:
+            output.write('abc\xff')
+        self.assertRaises(UnicodeDecodeError, fileio.read_file, path)
+
+    def test_read_file__missing(self):
+        self.assertRaises(IOError, fileio.read_file,
+                          os.path.join(self.tempdir, 'missing'))
+
+    def test_read_stream__chunks_split_characters(self):
+        fileio.CHUNK_SIZE = 3
+        stream = StringIO.StringIO(codecs.encode(_UTF8_TEXT, 'utf-8'))
+        self.assertEquals(_UTF8_TEXT, fileio.read_stream(stream))
+
+    def test_read_inputs__concatenates(self):
+        first = self._write_utf8('first', u'First \u2014\n')
+        second = self._write_utf8('second', u'Second\n')
+        real_stdin = sys.stdin
+        try:
+            sys.stdin = StringIO.StringIO('Stdin\n')
+            self.assertEquals(u'First \u2014\nStdin\nSecond\n',
+                              fileio.read_inputs([first, '-', second]))
+        finally:
+            sys.stdin = real_stdin
+
+    def test_read_inputs__default_to_stdin(self):
+        real_stdin = sys.stdin
+        try:
+            sys.stdin = StringIO.StringIO('Stdin\n')
+            self.assertEquals(u'Stdin\n', fileio.read_inputs([]))
+        finally:
+            sys.stdin = real_stdin
+
+    def test_write_stream(self):
+        fileio.CHUNK_SIZE = 5
+        stream = StringIO.StringIO()
+        fileio.write_stream(stream, _UTF8_TEXT)
+        self.assertEquals(codecs.encode(_UTF8_TEXT, 'utf-8'), stream.getvalue())
+
+    def test_write_file(self):
+        path = os.path.join(self.tempdir, 'output')
+        fileio.write_file(path, _UTF8_TEXT)
+        with open(path, 'rb') as input_file:
+            self.assertEquals(codecs.encode(_UTF8_TEXT, 'utf-8'),
+                              input_file.read())
+
+    def test_write_fragments(self):
+        stream = StringIO.StringIO()
+        fileio.write_fragments(stream, iter([u'', _UTF8_TEXT, u'\n']))
+        self.assertEquals(codecs.encode(_UTF8_TEXT + u'\n', 'utf-8'),
+                          stream.getvalue())
+
+    def test_write_file_fragments(self):
+        path = os.path.join(self.tempdir, 'output')
+        fileio.write_file_fragments(path, iter([_UTF8_TEXT, u'\n']))
+        with open(path, 'rb') as input_file:
+            self.assertEquals(codecs.encode(_UTF8_TEXT + u'\n', 'utf-8'),
+                              input_file.read())
+
+    def test_replace_file(self):
+        path = self._write_utf8('output', u'Old contents')
+        old_inode = os.stat(path).st_ino
+        fileio.replace_file(path, _UTF8_TEXT)
+        with open(path, 'rb') as input_file:
+            self.assertEquals(codecs.encode(_UTF8_TEXT, 'utf-8'),
+                              input_file.read())
+        self.assertNotEquals(old_inode, os.stat(path).st_ino)
+        self.assertEquals(['output'], os.listdir(self.tempdir))
+
+    def test_replace_file__keeps_mode(self):
+        path = self._write_utf8('output', u'Old contents')
+        os.chmod(path, 0600)
+        fileio.replace_file(path, u'New contents')
+        self.assertEquals(0600, stat.S_IMODE(os.stat(path).st_mode))
+
+    def test_replace_file__new_file_mode(self):
+        umask = os.umask(0022)
+        try:
+            path = os.path.join(self.tempdir, 'output')
+            fileio.replace_file(path, u'New contents')
+        finally:
+            os.umask(umask)
+        self.assertEquals(0644, stat.S_IMODE(os.stat(path).st_mode))
+
+    def test_replace_file__failure_keeps_old_contents(self):
+        path = self._write_utf8('output', u'Old contents')
+        # A list is not a valid text and makes encoding fail midway.
+        self.assertRaises(TypeError, fileio.replace_file, path, [u'Text'])
+        with open(path, 'rb') as input_file:
+            self.assertEquals('Old contents', input_file.read())
+        self.assertEquals(['output'], os.listdir(self.tempdir))
+
+    def test_replace_file_fragments(self):
+        path = self._write_utf8('output', u'Old contents')
+        fileio.replace_file_fragments(path, iter([_UTF8_TEXT, u'\n']))
+        with open(path, 'rb') as input_file:
+            self.assertEquals(codecs.encode(_UTF8_TEXT + u'\n', 'utf-8'),
+                              input_file.read())
+        self.assertEquals(['output'], os.listdir(self.tempdir))
+
+    def test_replace_file_fragments__failure_keeps_old_contents(self):
+        path = self._write_utf8('output', u'Old contents')
+
+        def fragments():
+            yield u'New contents'
+            raise ValueError('Conversion failed')
+
+        self.assertRaises(ValueError, fileio.replace_file_fragments, path,
+                          fragments())
+        with open(path, 'rb') as input_file:
+            self.assertEquals('Old contents', input_file.read())
+        self.assertEquals(['output'], os.listdir(self.tempdir))
+
+    def test_replace_file_fragments__follows_symlinks(self):
+        path = self._write_utf8('output', u'Old contents')
+        link = os.path.join(self.tempdir, 'link')
+        os.symlink(path, link)
+        fileio.replace_file_fragments(link, [u'New contents'])
+        self.assertTrue(os.path.islink(link))
+        with open(path, 'rb') as input_file:
+            self.assertEquals('New contents', input_file.read())
+
+    def test_replace_file_fragments__special_file(self):
+        fileio.replace_file_fragments(os.devnull, [u'Discarded'])
+        self.assertFalse(os.path.isfile(os.devnull))
+
+
+if __name__ == '__main__':
+    unittest.main()
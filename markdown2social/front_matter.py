@@ -0,0 +1,211 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Fast reader for the YAML Front Matter of documents.
+
+frontmatter.parse() makes several copies of the whole document while splitting
+it and always loads the full YAML block, even though the converter only looks
+at a couple of properties.  For posts with large Front Matter blocks, loading
+the YAML can cost more than converting the Markdown.
+
+The parse() function in this module returns the same results as
+frontmatter.parse() but locates the delimiters in place, copies the content
+only once, and, when asked for specific keys, only loads the top-level entries
+of the YAML mapping that define them.  Documents whose Front Matter does not
+look like a plain YAML block mapping are handed to frontmatter.parse() as is.
+"""
+
+import re
+
+import frontmatter
+import yaml
+
+
+# type.  Loader used for the YAML blocks: the C implementation if PyYAML was
+# built with libyaml, which is what frontmatter.parse() uses too.
+_SAFE_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# re.RegexObject.  Pattern to locate the line that closes a YAML block by its
+# preceding newline.
+_CLOSING_PATTERN = re.compile(r'\n-{3,}$', re.MULTILINE)
+
+# re.RegexObject.  Pattern to match the opening delimiter of a YAML block at
+# the start of a document, which may not be at the start of a line.
+_OPENING_PATTERN = re.compile(r'-{3,}$', re.MULTILINE)
+
+# re.RegexObject.  Pattern to locate the lines that may start a top-level entry
+# of a YAML block mapping: those that are not blank, indented, comments nor
+# items of a block sequence.  Lines are located by their preceding newline.
+_TOP_LEVEL_LINE_PATTERN = re.compile(
+    r'\n(?![ #\n]|-(?: |\n|\Z)|\Z)[^\n]*')
+
+# re.RegexObject.  Pattern to match the first line of a top-level entry of a
+# YAML block mapping with a plain key.
+_KEY_PATTERN = re.compile(r'([A-Za-z_][\w-]*)[ \t]*:(?:[ \t]|$)')
+
+# re.RegexObject.  Pattern to match the lines that may precede the first entry
+# of a YAML block mapping: blank lines and comments.
+_PREAMBLE_PATTERN = re.compile(
+    r'(?:[ \t]*(?:\#[^\n]*)?\n)*[ \t]*(?:\#[^\n]*)?\Z')
+
+# re.RegexObject.  Pattern to locate the lines with characters that can open
+# a quoted scalar or a flow collection and whose value could continue on the
+# following lines even if those are not indented, in which case they would
+# look like keys.  Lines are located by their preceding newline.  Plain and
+# block scalars, quoted scalars closed on the same line and simple flow
+# sequences cannot continue that way.
+_UNSAFE_LINE_PATTERN = re.compile(r"""
+    \n
+    (?!
+      [ ]* (?: -(?:[ ]+|$) )*                     # Indentation and items.
+      (?: [A-Za-z_][\w-]* [ \t]* : (?:[ \t]+|$) )?  # Plain key.
+      (?: $
+        | \#
+        | [|>]
+        | (?: [^\s"'\[\]{},:&*!?%@`\#|>-] | [-?:](?=\S) )
+          (?! .* [-?:,] [ \t]+ [&!"'\[{] )        # Nested flow node.
+        | (?: "(?:[^"\\\n]|\\.)*"
+            | '(?:[^'\n]|'')*'
+            | \[[^\[\]{}"'\#\n]*\]
+          ) [ \t]* (?:\#.*)? $
+      )
+    )
+    [^\n]* ["'\[{]
+    """, re.MULTILINE | re.VERBOSE)
+
+# unicode.  Characters that start Front Matter in formats other than YAML.
+_OTHER_FORMAT_CHARS = u'{}+'
+
+# unicode.  Characters other than the newline that YAML considers to break
+# lines.  Blocks containing them are not split into entries by us.
+_OTHER_LINE_BREAKS = u'\r\x85\u2028\u2029'
+
+
+def _select_entries(block, keys):
+    """Extracts the top-level entries that define some keys from a YAML block.
+
+    Args:
+        block: unicode.  The YAML block.  Must start with a newline, as blocks
+            do when they follow their opening delimiter.
+        keys: collection(str).  The keys to extract.
+
+    Returns:
+        unicode.  A YAML block mapping with only the entries for the given keys,
+        in their original order.  None if the block is not a block mapping
+        with plain keys, if we cannot tell for sure where its entries start
+        or if all the entries are selected, in which case the block must be
+        loaded in full.
+    """
+    starts = []
+    selected = []
+    for match in _TOP_LEVEL_LINE_PATTERN.finditer(block):
+        key = _KEY_PATTERN.match(match.group(0), 1)
+        if key is None:
+            return None
+        starts.append(match.start() + 1)
+        selected.append(key.group(1) in keys)
+    if all(selected) or any(char in block for char in _OTHER_LINE_BREAKS):
+        return None
+    if not _PREAMBLE_PATTERN.match(block[:starts[0] if starts else None]):
+        return None
+    if not any(selected):
+        return u''
+
+    # Only the lines up to the end of the last selected entry can hide or
+    # extend the selected entries.
+    starts.append(len(block))
+    last = max(i for i in xrange(len(selected)) if selected[i])
+    if _UNSAFE_LINE_PATTERN.search(block, 0, starts[last + 1]):
+        return None
+
+    selected = u''.join(block[starts[i]:starts[i + 1]]
+                        for i in xrange(len(selected)) if selected[i])
+    if u'*' in selected:
+        # Aliases may refer to anchors defined in other entries.
+        return None
+    return selected
+
+
+def _load_block(block, keys):
+    """Loads a YAML block.
+
+    Args:
+        block: unicode.  The YAML block.
+        keys: collection(str).  If not None, the only keys to load.
+
+    Returns:
+        dict.  The loaded properties.
+
+    Raises:
+        yaml.YAMLError: If the block is invalid.  Errors in entries other than
+            the ones for the requested keys may go unnoticed.
+    """
+    if keys is not None:
+        selected = _select_entries(block, keys)
+        if selected is not None:
+            if not selected.strip():
+                return {}
+            block = selected
+
+    metadata = yaml.load(block, Loader=_SAFE_LOADER)
+    if not isinstance(metadata, dict):
+        return {}
+    return metadata
+
+
+def parse(text, keys=None):
+    """Splits a document into its Front Matter and its content.
+
+    Args:
+        text: unicode.  The document, optionally starting with Front Matter.
+            Byte strings are decoded as UTF-8.
+        keys: collection(str).  If not None, the only properties that the
+            caller needs; other properties may be missing from the result.
+
+    Returns:
+        tuple(dict, unicode).  The properties in the Front Matter, if any, and
+        the content of the document stripped of surrounding whitespace, just
+        like frontmatter.parse().
+
+    Raises:
+        yaml.YAMLError: If the Front Matter is invalid.
+    """
+    if isinstance(text, str):
+        text = text.decode('utf-8')
+    if u'\r' in text:
+        text = text.replace(u'\r\n', u'\n')
+
+    start = 0
+    end = len(text)
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+
+    if start < end and text[start] in _OTHER_FORMAT_CHARS:
+        return frontmatter.parse(text)
+
+    opening = _OPENING_PATTERN.match(text, start, end)
+    if opening is None:
+        return {}, text[start:end]
+    closing = _CLOSING_PATTERN.search(text, opening.end(), end)
+    if closing is None:
+        return {}, text[start:end]
+
+    metadata = _load_block(text[opening.end():closing.start() + 1], keys)
+
+    start = closing.end()
+    while start < end and text[start].isspace():
+        start += 1
+    return metadata, text[start:end]
@@ -0,0 +1,159 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import random
+import unittest
+
+import frontmatter
+import yaml
+
+from markdown2social import front_matter
+
+
+class ParseTest(unittest.TestCase):
+    """Unit tests for the parse function."""
+
+    def test_no_front_matter(self):
+        self.assertEquals(({}, u'Some text'),
+                          front_matter.parse(u'\n  Some text\n\n'))
+        self.assertEquals(({}, u''), front_matter.parse(u''))
+        self.assertEquals(({}, u'---\nNot closed'),
+                          front_matter.parse(u'---\nNot closed\n'))
+
+    def test_yaml(self):
+        self.assertEquals(
+            ({'title': 'The title', 'tags': ['a', 'b']}, u'Content\n\nMore'),
+            front_matter.parse(u'---\ntitle: The title\ntags: [a, b]\n---\n'
+                               u'\nContent\n\nMore\n'))
+
+    def test_byte_string(self):
+        self.assertEquals(({'title': u'Caf\xe9'}, u'Text'),
+                          front_matter.parse('---\r\ntitle: Caf\xc3\xa9\r\n'
+                                             '---\r\nText\r\n'))
+
+    def test_not_a_mapping(self):
+        self.assertEquals(({}, u'Text'),
+                          front_matter.parse(u'---\n- a\n---\nText'))
+
+    def test_other_formats(self):
+        self.assertEquals(({'title': 'JSON'}, u'Text'),
+                          front_matter.parse(u'{\n"title": "JSON"\n}\nText'))
+
+    def test_keys(self):
+        metadata, content = front_matter.parse(
+            u'---\ntitle: One\ntags:\n- a\n- b\nbroken: a: b\n---\nText',
+            keys=['title'])
+        self.assertEquals({'title': 'One'}, metadata)
+        self.assertEquals(u'Text', content)
+
+    def test_keys__missing(self):
+        self.assertEquals(
+            ({}, u'Text'),
+            front_matter.parse(u'---\ndate: 2016-01-22\n---\nText',
+                               keys=['title']))
+
+    def test_keys__load_everything_when_unsure(self):
+        for block in [u'desc: "a\ntitle: b"', u'tags: [a,\ntitle: b]',
+                      u'desc:\n  "foo\ntitle: x"', u'a: &x 1\ntitle: *x',
+                      u'"title": x', u'<<: {title: x}',
+                      u'desc:\n  two words: [a,\ntitle: b]']:
+            document = u'---\n%s\n---\nText' % block
+            self.assertEquals(frontmatter.parse(document),
+                              front_matter.parse(document, keys=['title']),
+                              msg=repr(block))
+
+    def test_invalid_yaml(self):
+        self.assertRaises(yaml.YAMLError, front_matter.parse,
+                          u'---\ntitle: [\n---\nText')
+        self.assertRaises(yaml.YAMLError, front_matter.parse,
+                          u'---\ntitle: [\n---\nText', keys=['title'])
+
+
+class DifferentialTest(unittest.TestCase):
+    """Checks that parse matches frontmatter.parse."""
+
+    # list(unicode).  Lines to build YAML blocks out of that form simple
+    # block mappings.
+    LINES = [
+        u'title: The title', u'title: "Quoted: title"', u"title: 'It''s'",
+        u'title: |', u'title: >-', u'title:', u'title: [a, b]',
+        u'title : spaced', u'title: x # comment', u'tags:', u'- tag',
+        u'  - nested', u'  key: value', u'  text', u'date: 2016-01-22',
+        u'layout: post', u'excerpt: "Quoted"', u'# comment', u'  # comment',
+        u'', u'  ',
+    ]
+
+    # list(unicode).  Lines to build YAML blocks out of that make it hard to
+    # tell where the entries of the mapping start.
+    NEAR_MISSES = [
+        u'title: &anchor x', u'title: !!str 1', u'desc: "open',
+        u"desc: 'open", u'desc: [open,', u'desc: {open: 1,', u'closed"',
+        u"closed'", u'closed]', u'closed}', u'  "indented open',
+        u'ref: *anchor', u'<<: {title: merged}', u'? complex', u'\tbad',
+        u'not a key', u'-5: x', u'...', u'caf\xe9: x', u'  two words: [open',
+        u'-\t"open', u'  - a: {open', u"desc: It's open: 'x",
+    ]
+
+    # list(unicode).  Variants of the content following the Front Matter.
+    CONTENTS = [u'', u'Text', u'\n\nText\n---\nMore\n', u'  Text  \n']
+
+    # int.  Number of random documents to check.
+    DOCUMENTS = 3000
+
+    def _random_document(self, rng):
+        """Generates a random document with Front Matter."""
+        lines = []
+        for _ in xrange(rng.randint(0, 6)):
+            if rng.random() < 0.1:
+                lines.append(rng.choice(self.NEAR_MISSES))
+            else:
+                lines.append(rng.choice(self.LINES))
+        block = u'\n'.join(lines)
+        return rng.choice([u'', u'\n', u' ']) + u'---\n%s\n---%s' % (
+            block, rng.choice(self.CONTENTS))
+
+    def _parse_or_error(self, function, *args, **kwargs):
+        """Calls a parse function and returns its result or its error type."""
+        try:
+            return function(*args, **kwargs)
+        except yaml.YAMLError:
+            return yaml.YAMLError
+
+    def test_random_documents(self):
+        rng = random.Random(0)
+        partial = 0
+        for _ in xrange(self.DOCUMENTS):
+            document = self._random_document(rng)
+            expected = self._parse_or_error(frontmatter.parse, document)
+            self.assertEquals(
+                expected,
+                self._parse_or_error(front_matter.parse, document),
+                msg=repr(document))
+
+            if expected is yaml.YAMLError:
+                continue
+            metadata, content = front_matter.parse(document, keys=['title'])
+            self.assertEquals(expected[1], content, msg=repr(document))
+            self.assertEquals('title' in expected[0], 'title' in metadata,
+                              msg=repr(document))
+            for key, value in metadata.iteritems():
+                self.assertEquals(expected[0][key], value, msg=repr(document))
+            if len(metadata) != len(expected[0]):
+                partial += 1
+        self.assertGreater(partial, self.DOCUMENTS / 20,
+                           msg='Generator rarely skips any keys')
+
+
+if __name__ == '__main__':
+    unittest.main()
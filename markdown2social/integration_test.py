@@ -16,12 +16,22 @@
 
 import codecs
 import os
+import pstats
+import shutil
+import signal
 import StringIO
+import subprocess
 import sys
 import tempfile
+import threading
+import time
 import unittest
 
+import markdown2social
 from markdown2social import __main__
+from markdown2social import server
+from markdown2social.benchmarks import large_input_bench
+from markdown2social.benchmarks import startup_bench
 
 
 class MainTest(unittest.TestCase):
@@ -41,15 +51,26 @@ class MainTest(unittest.TestCase):
         self.old_home = os.environ['HOME']
         os.environ['HOME'] = self.fake_home
 
+        self.old_socket = os.environ.pop('MARKDOWN2SOCIAL_SOCKET', None)
+        self.old_xdg_cache_home = os.environ.pop('XDG_CACHE_HOME', None)
+        self.cache_dir = os.path.join(self.fake_home, '.cache',
+                                      'markdown2social')
+
     def tearDown(self):
-        if os.path.exists(self.fake_config_file):
-            os.unlink(self.fake_config_file)
-        if os.path.exists(self.fake_config_subdir):
-            os.rmdir(self.fake_config_subdir)
-        os.rmdir(self.fake_home)
+        shutil.rmtree(self.fake_home)
 
         os.environ['HOME'] = self.old_home
 
+        if self.old_xdg_cache_home is None:
+            os.environ.pop('XDG_CACHE_HOME', None)
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old_xdg_cache_home
+
+        if self.old_socket is None:
+            os.environ.pop('MARKDOWN2SOCIAL_SOCKET', None)
+        else:
+            os.environ['MARKDOWN2SOCIAL_SOCKET'] = self.old_socket
+
     def _run(self, args=None, stdin=None, stdout=None, stderr=None,
              expected_exit_code=0):
         """Runs the main method with stream redirection.
@@ -151,7 +172,8 @@ class MainTest(unittest.TestCase):
             self.assertEquals('', stdout.getvalue())
             self.assertEquals('', stderr.getvalue())
 
-            self.assertEquals(self.TEST_OUTPUT, output_file.read())
+            with open(output_file.name) as output:
+                self.assertEquals(self.TEST_OUTPUT, output.read())
 
     def test_explicit_input_and_output(self):
         with tempfile.NamedTemporaryFile() as input_file:
@@ -165,7 +187,8 @@ class MainTest(unittest.TestCase):
                 self.assertEquals('', stdout.getvalue())
                 self.assertEquals('', stderr.getvalue())
 
-                self.assertEquals(self.TEST_OUTPUT, output_file.read())
+                with open(output_file.name) as output:
+                    self.assertEquals(self.TEST_OUTPUT, output.read())
 
     def test_explicit_input_and_output__utf8(self):
         with tempfile.NamedTemporaryFile() as input_file:
@@ -175,8 +198,21 @@ class MainTest(unittest.TestCase):
             with tempfile.NamedTemporaryFile() as output_file:
                 unused_stdout, unused_stderr = self._run(
                     args=['-o', output_file.name, input_file.name])
-                self.assertEquals(self.TEST_UTF8,
-                                  codecs.decode(output_file.read(), 'utf-8'))
+                with open(output_file.name) as output:
+                    self.assertEquals(self.TEST_UTF8,
+                                      codecs.decode(output.read(), 'utf-8'))
+
+    def test_explicit_output__error_keeps_old_contents(self):
+        output_path = os.path.join(self.fake_home, 'output')
+        with open(output_path, 'w') as output:
+            output.write('Old contents\n')
+        self.assertRaises(
+            ValueError, self._run, args=['--no_cache', '-o', output_path],
+            stdin=StringIO.StringIO('Hello\n\nBad &#99999999; entity\n'))
+        with open(output_path) as input_file:
+            self.assertEquals('Old contents\n', input_file.read())
+        self.assertEquals([], [name for name in os.listdir(self.fake_home)
+                               if name.startswith('.output')])
 
     def test_config_file__replacements(self):
         with open(self.fake_config_file, 'w') as output:
@@ -211,6 +247,753 @@ class MainTest(unittest.TestCase):
         self.assertRegexpMatches(stderr.getvalue(),
                                  r'error.*Failed to load.*markdown2social.conf')
 
+    def test_config_file__bad_does_not_consume_input(self):
+        with open(self.fake_config_file, 'w') as output:
+            output.write('[]invalid')
+
+        stdin = StringIO.StringIO(self.TEST_INPUT)
+        self._run(stdin=stdin, expected_exit_code=1)
+        self.assertEquals(0, stdin.tell())
+
+    def test_batch(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            inputs = []
+            for name in ['first', 'second']:
+                path = os.path.join(tempdir, name + '.md')
+                with open(path, 'w') as output:
+                    output.write('# %s\n\nAnd a paragraph!\n' % name)
+                inputs.append(path)
+            output_dir = os.path.join(tempdir, 'out')
+
+            stdout, stderr = self._run(
+                args=['--batch', '--output_dir=%s' % output_dir, '--jobs=2']
+                + inputs)
+            self.assertEquals('', stdout.getvalue())
+            self.assertEquals('', stderr.getvalue())
+
+            for name in ['first', 'second']:
+                with open(os.path.join(output_dir, name + '.gplus')) as f:
+                    self.assertEquals('*%s*\n\nAnd a paragraph!\n' % name,
+                                      f.read())
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_batch__bad_file(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            good = os.path.join(tempdir, 'good.md')
+            with open(good, 'w') as output:
+                output.write(self.TEST_INPUT)
+
+            stdout, stderr = self._run(
+                args=['--batch', '--output_dir=%s' % tempdir, '-j1',
+                      'does-not-exist.md', good],
+                expected_exit_code=1)
+            self.assertEquals('', stdout.getvalue())
+            self.assertRegexpMatches(
+                stderr.getvalue(),
+                r'error: Failed to convert does-not-exist.md')
+
+            with open(os.path.join(tempdir, 'good.gplus')) as f:
+                self.assertEquals(self.TEST_OUTPUT, f.read())
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_batch__no_inputs(self):
+        self.assertRaises(SystemExit, self._run, args=['--batch'])
+
+    def test_output_dir_without_batch(self):
+        self.assertRaises(SystemExit, self._run, args=['--output_dir=foo'])
+
+    def test_socket(self):
+        tempdir = tempfile.mkdtemp()
+        socket_path = os.path.join(tempdir, 'socket')
+        config_path = os.path.join(tempdir, 'config')
+        try:
+            with open(config_path, 'w') as output:
+                output.write('[replacements]\n')
+                output.write('1 = paragraph -> server\n')
+
+            daemon = server.Server(socket_path, config_path)
+            thread = threading.Thread(target=daemon.serve_forever,
+                                      kwargs={'poll_interval': 0.05})
+            thread.start()
+            try:
+                stdout, stderr = self._run(
+                    args=['--socket=%s' % socket_path],
+                    stdin=StringIO.StringIO(self.TEST_INPUT))
+                self.assertEquals(self.TEST_OUTPUT.replace('paragraph',
+                                                           'server'),
+                                  stdout.getvalue())
+                self.assertEquals('', stderr.getvalue())
+            finally:
+                daemon.shutdown()
+                daemon.server_close()
+                thread.join()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_socket__with_config_file(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--socket=/tmp/socket',
+                                '--config_file=%s' % self.fake_config_file])
+
+    def test_socket__environment_ignored_with_config_file(self):
+        tempdir = tempfile.mkdtemp()
+        socket_path = os.path.join(tempdir, 'socket')
+        server_config_path = os.path.join(tempdir, 'server.conf')
+        try:
+            with open(server_config_path, 'w') as output:
+                output.write('[replacements]\n')
+                output.write('1 = paragraph -> server\n')
+            with open(self.fake_config_file, 'w') as output:
+                output.write('[replacements]\n')
+                output.write('1 = paragraph -> local\n')
+
+            daemon = server.Server(socket_path, server_config_path)
+            thread = threading.Thread(target=daemon.serve_forever,
+                                      kwargs={'poll_interval': 0.05})
+            thread.start()
+            try:
+                os.environ['MARKDOWN2SOCIAL_SOCKET'] = socket_path
+                stdout, _ = self._run(stdin=StringIO.StringIO(self.TEST_INPUT))
+                self.assertEquals(self.TEST_OUTPUT.replace('paragraph',
+                                                           'server'),
+                                  stdout.getvalue())
+                stdout, _ = self._run(
+                    args=['--no_cache',
+                          '--config_file=%s' % self.fake_config_file],
+                    stdin=StringIO.StringIO(self.TEST_INPUT))
+                self.assertEquals(self.TEST_OUTPUT.replace('paragraph',
+                                                           'local'),
+                                  stdout.getvalue())
+            finally:
+                daemon.shutdown()
+                daemon.server_close()
+                thread.join()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_socket__no_server(self):
+        stdout, stderr = self._run(args=['--socket=/non-existent/socket'],
+                                   stdin=StringIO.StringIO(self.TEST_INPUT),
+                                   expected_exit_code=1)
+        self.assertEquals('', stdout.getvalue())
+        self.assertRegexpMatches(stderr.getvalue(),
+                                 r'error: Cannot contact server at '
+                                 r'/non-existent/socket')
+
+    def test_socket__environment_falls_back_to_local(self):
+        os.environ['MARKDOWN2SOCIAL_SOCKET'] = '/non-existent/socket'
+        stdout, stderr = self._run(stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+        self.assertEquals('', stderr.getvalue())
+
+    def test_profile(self):
+        profile_path = os.path.join(self.fake_home, 'profile')
+        try:
+            stdout, stderr = self._run(
+                args=['--profile=%s' % profile_path],
+                stdin=StringIO.StringIO(self.TEST_INPUT))
+            self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+            self.assertRegexpMatches(stderr.getvalue(), r'inline parsing')
+            self.assertLess(0, pstats.Stats(profile_path).total_calls)
+        finally:
+            if os.path.exists(profile_path):
+                os.unlink(profile_path)
+
+    def test_profile__ignores_environment_socket(self):
+        os.environ['MARKDOWN2SOCIAL_SOCKET'] = '/non-existent/socket'
+        profile_path = os.path.join(self.fake_home, 'profile')
+        try:
+            stdout, _ = self._run(args=['--profile=%s' % profile_path],
+                                  stdin=StringIO.StringIO(self.TEST_INPUT))
+            self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+        finally:
+            if os.path.exists(profile_path):
+                os.unlink(profile_path)
+
+    def test_profile__unwritable(self):
+        stdout, stderr = self._run(args=['--profile=/non-existent/profile'],
+                                   stdin=StringIO.StringIO(self.TEST_INPUT),
+                                   expected_exit_code=1)
+        self.assertEquals('', stdout.getvalue())
+        self.assertRegexpMatches(stderr.getvalue(),
+                                 r'error: Cannot write profile')
+
+    def test_profile__with_batch(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--profile=foo', '--batch', 'input.md'])
+
+    def test_stats(self):
+        stdout, stderr = self._run(args=['--stats'],
+                                   stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+        self.assertRegexpMatches(stderr.getvalue(), r'time.parse: [0-9.]+ ms')
+        self.assertIn('elements.h1: 1\n', stderr.getvalue())
+        self.assertIn('elements.p: 1\n', stderr.getvalue())
+
+    def test_stats__with_socket(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--stats', '--socket=/tmp/socket'])
+
+    def test_rule_stats(self):
+        with open(self.fake_config_file, 'w') as output:
+            output.write('[replacements]\n')
+            output.write('1 = unused -> x\n')
+            output.write('2 = f(o+) -> b\\1\n')
+
+        stdout, stderr = self._run(args=['--rule_stats'],
+                                   stdin=StringIO.StringIO('a foo foo\n'))
+        self.assertEquals('a boo boo\n', stdout.getvalue())
+        lines = stderr.getvalue().splitlines()
+        self.assertRegexpMatches(lines[0], r'time \(ms\) +matches +nodes')
+        rows = [line.split(None, 3) for line in lines[1:]]
+        self.assertEquals([float(row[0]) for row in rows],
+                          sorted([float(row[0]) for row in rows], reverse=True))
+        self.assertEquals(sorted([['2', '1: f(o+) -> b\\1'],
+                                  ['0', '0: unused -> x']]),
+                          sorted([[row[1], row[3]] for row in rows]))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_rule_stats__with_batch(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--rule_stats', '--batch', 'input.md'])
+
+    def test_block_cache(self):
+        cache_path = os.path.join(self.fake_home, 'cache')
+        try:
+            for _ in xrange(2):
+                stdout, stderr = self._run(
+                    args=['--block_cache=%s' % cache_path],
+                    stdin=StringIO.StringIO(self.TEST_INPUT))
+                self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+                self.assertEquals('', stderr.getvalue())
+                self.assertTrue(os.path.exists(cache_path))
+        finally:
+            if os.path.exists(cache_path):
+                os.unlink(cache_path)
+
+    def test_block_cache__with_stats(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--block_cache=foo', '--stats'])
+
+    def test_formats__single(self):
+        stdout, stderr = self._run(args=['--formats=plain'],
+                                   stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals('This is my post\n\nAnd a paragraph!\n',
+                          stdout.getvalue())
+        self.assertEquals('', stderr.getvalue())
+
+    def test_formats__many(self):
+        output_base = os.path.join(self.fake_home, 'post')
+        for _ in xrange(2):
+            stdout, stderr = self._run(
+                args=['--formats=gplus,plain', '-o', output_base],
+                stdin=StringIO.StringIO(self.TEST_INPUT))
+            self.assertEquals('', stdout.getvalue())
+            self.assertEquals('', stderr.getvalue())
+            with open(output_base + '.gplus') as input_file:
+                self.assertEquals(self.TEST_OUTPUT, input_file.read())
+            with open(output_base + '.plain') as input_file:
+                self.assertEquals('This is my post\n\nAnd a paragraph!\n',
+                                  input_file.read())
+        self.assertEquals(2, self._cached_entries(self.cache_dir))
+
+    def test_formats__ignores_environment_socket(self):
+        os.environ['MARKDOWN2SOCIAL_SOCKET'] = '/non-existent/socket'
+        stdout, _ = self._run(args=['--formats=plain'],
+                              stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals('This is my post\n\nAnd a paragraph!\n',
+                          stdout.getvalue())
+
+    def test_formats__unknown(self):
+        self.assertRaises(SystemExit, self._run, args=['--formats=gplus,foo'])
+
+    def test_formats__many_without_output_file(self):
+        self.assertRaises(SystemExit, self._run, args=['--formats=gplus,plain'])
+
+    def test_formats__with_batch(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--formats=plain', '--batch', 'input.md'])
+
+    def test_formats__match_converter(self):
+        from markdown2social import converter
+
+        self.assertEquals(list(__main__._OUTPUT_FORMATS),
+                          list(converter.output_formats()))
+        self.assertEquals(__main__._DEFAULT_FORMAT,
+                          converter.output_formats()[0])
+
+    def test_exclusive_options__known(self):
+        parser_defaults = {}
+
+        def record_parser(parser, options):
+            parser_defaults.update(parser.defaults)
+
+        real_check = __main__._check_exclusive_options
+        __main__._check_exclusive_options = record_parser
+        try:
+            self._run(args=['--no_cache'])
+        finally:
+            __main__._check_exclusive_options = real_check
+        for name, others in __main__._EXCLUSIVE_OPTIONS:
+            for option in (name,) + others:
+                self.assertIn(option, parser_defaults)
+
+    def test_exclusive_options__error(self):
+        stderr = StringIO.StringIO()
+        real_stderr = sys.stderr
+        try:
+            sys.stderr = stderr
+            self.assertRaises(SystemExit, __main__.main,
+                              ['--watch', '--stats', 'in.md:out.gplus'])
+        finally:
+            sys.stderr = real_stderr
+        self.assertIn('--watch cannot be used with --stats',
+                      stderr.getvalue())
+
+    def test_fast_path(self):
+        stdout, stderr = self._run(args=['--fast_path', '--no_cache'],
+                                   stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+        self.assertEquals('', stderr.getvalue())
+
+    def test_fast_path__with_batch(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--fast_path', '--batch', 'input.md'])
+
+    def test_pipeline(self):
+        for pipeline in ('full', 'lean'):
+            stdout, stderr = self._run(
+                args=['--pipeline=%s' % pipeline, '--no_cache'],
+                stdin=StringIO.StringIO(self.TEST_INPUT))
+            self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+            self.assertEquals('', stderr.getvalue())
+
+    def test_pipeline__unknown(self):
+        self.assertRaises(SystemExit, self._run, args=['--pipeline=foo'])
+
+    def test_pipeline__with_batch(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--pipeline=lean', '--batch', 'input.md'])
+
+    def test_pipeline__match_converter(self):
+        from markdown2social import converter
+
+        self.assertEquals(list(__main__._PIPELINES),
+                          list(converter.pipelines()))
+        self.assertEquals(__main__._DEFAULT_PIPELINE,
+                          converter.pipelines()[0])
+
+    def _cached_entries(self, cache_dir):
+        """Counts the entries in a cache of converted documents.
+
+        Args:
+            cache_dir: str.  The directory of the cache.
+
+        Returns:
+            int.  The number of entries in the cache.
+        """
+        return sum(len(filenames) for _, _, filenames
+                   in os.walk(os.path.join(cache_dir, 'objects')))
+
+    def test_cache(self):
+        for _ in xrange(2):
+            stdout, stderr = self._run(
+                stdin=StringIO.StringIO(self.TEST_INPUT))
+            self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+            self.assertEquals('', stderr.getvalue())
+        self.assertEquals(1, self._cached_entries(self.cache_dir))
+
+    def test_cache__serves_cached_output(self):
+        self._run(stdin=StringIO.StringIO(self.TEST_INPUT))
+        objects_dir = os.path.join(self.cache_dir, 'objects')
+        for dirpath, _, filenames in os.walk(objects_dir):
+            for filename in filenames:
+                with open(os.path.join(dirpath, filename), 'w') as output:
+                    output.write('From the cache\n')
+        stdout, _ = self._run(stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals('From the cache\n', stdout.getvalue())
+
+    def test_cache__keyed_on_config(self):
+        self._run(stdin=StringIO.StringIO(self.TEST_INPUT))
+        with open(self.fake_config_file, 'w') as output:
+            output.write('[replacements]\n')
+            output.write('1 = paragraph -> replaced\n')
+        stdout, _ = self._run(stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(self.TEST_OUTPUT.replace('paragraph', 'replaced'),
+                          stdout.getvalue())
+        self.assertEquals(2, self._cached_entries(self.cache_dir))
+
+    def test_cache__keyed_on_pipeline(self):
+        # Block quotes are only parsed by the full pipeline, which warns that
+        # it cannot format them; warnings keep documents out of the cache.
+        stdout, _ = self._run(stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+        stdout, _ = self._run(args=['--pipeline=lean'],
+                              stdin=StringIO.StringIO('> Quote\n'))
+        self.assertEquals('> Quote\n', stdout.getvalue())
+        stdout, _ = self._run(args=['--pipeline=lean'],
+                              stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+        self.assertEquals(3, self._cached_entries(self.cache_dir))
+
+    def _run_program(self, args, stdin):
+        """Runs the program in a child process so that its log is captured.
+
+        Args:
+            args: list(str).  Arguments to pass to the program.
+            stdin: str.  Contents to feed as stdin.
+
+        Returns:
+            (str, str).  The stdout and stderr of the program.
+        """
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'markdown2social'] + args,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate(stdin)
+        self.assertEquals(0, process.returncode)
+        return stdout, stderr
+
+    def test_cache__keeps_warnings(self):
+        for _ in xrange(2):
+            stdout, stderr = self._run_program([], 'Some &bogus; entity\n')
+            self.assertEquals('Some &bogus; entity\n', stdout)
+            self.assertIn('Ignoring unknown entity: bogus', stderr)
+        self.assertEquals(0, self._cached_entries(self.cache_dir))
+
+    def test_cache__keeps_warnings_with_formats(self):
+        output_file = os.path.join(self.fake_home, 'post')
+        for _ in xrange(2):
+            _, stderr = self._run_program(
+                ['--formats=gplus,plain', '--output_file=%s' % output_file],
+                'Some &bogus; entity\n')
+            self.assertIn('Ignoring unknown entity: bogus', stderr)
+        self.assertEquals(0, self._cached_entries(self.cache_dir))
+
+    def test_cache__keeps_warnings_in_batch(self):
+        input_path = os.path.join(self.fake_home, 'post.md')
+        with open(input_path, 'w') as output:
+            output.write('Some &bogus; entity\n')
+        for _ in xrange(2):
+            _, stderr = self._run_program(
+                ['--batch', '--jobs=1',
+                 '--output_dir=%s' % self.fake_home, input_path], '')
+            self.assertIn('Ignoring unknown entity: bogus', stderr)
+        self.assertEquals(0, self._cached_entries(self.cache_dir))
+
+    def test_cache__xdg_cache_home(self):
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self.fake_home, 'xdg')
+        self._run(stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(1, self._cached_entries(
+            os.path.join(self.fake_home, 'xdg', 'markdown2social')))
+
+    def test_cache__cache_dir(self):
+        cache_dir = os.path.join(self.fake_home, 'other')
+        self._run(args=['--cache_dir=%s' % cache_dir],
+                  stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(1, self._cached_entries(cache_dir))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_cache__no_cache(self):
+        stdout, _ = self._run(args=['--no_cache'],
+                              stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertEquals(self.TEST_OUTPUT, stdout.getvalue())
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_cache__not_used_for_stats(self):
+        self._run(args=['--stats'], stdin=StringIO.StringIO(self.TEST_INPUT))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_cache__batch(self):
+        input_dir = os.path.join(self.fake_home, 'input')
+        output_dir = os.path.join(self.fake_home, 'output')
+        os.mkdir(input_dir)
+        inputs = []
+        for i in xrange(3):
+            inputs.append(os.path.join(input_dir, 'post%d.md' % i))
+            with open(inputs[-1], 'w') as output:
+                output.write('Post %d\n' % i)
+        for _ in xrange(2):
+            self._run(args=['--batch', '--jobs=2',
+                            '--output_dir=%s' % output_dir] + inputs)
+        self.assertEquals(3, self._cached_entries(self.cache_dir))
+        with open(os.path.join(output_dir, 'post1.gplus')) as input_file:
+            self.assertEquals('Post 1\n', input_file.read())
+
+    def test_cache__with_no_cache(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--cache_dir=foo', '--no_cache'])
+
+    def test_tree(self):
+        source_dir = os.path.join(self.fake_home, 'site')
+        output_dir = os.path.join(self.fake_home, 'out')
+        os.makedirs(os.path.join(source_dir, '_posts'))
+        with open(os.path.join(source_dir, '_posts', 'post.md'), 'w') as f:
+            f.write(self.TEST_INPUT)
+
+        args = ['--tree=%s' % source_dir, '--output_dir=%s' % output_dir]
+        stdout, stderr = self._run(args=args)
+        self.assertEquals('', stdout.getvalue())
+        self.assertEquals('', stderr.getvalue())
+        with open(os.path.join(output_dir, '_posts', 'post.gplus')) as f:
+            self.assertEquals(self.TEST_OUTPUT, f.read())
+
+        os.unlink(os.path.join(source_dir, '_posts', 'post.md'))
+        self._run(args=args)
+        self.assertFalse(os.path.exists(os.path.join(output_dir, '_posts')))
+
+    def test_tree__bad_file(self):
+        source_dir = os.path.join(self.fake_home, 'site')
+        os.mkdir(source_dir)
+        with open(os.path.join(source_dir, 'bad.md'), 'wb') as f:
+            f.write('\xff')
+        _, stderr = self._run(
+            args=['--tree=%s' % source_dir,
+                  '--output_dir=%s' % os.path.join(self.fake_home, 'out')],
+            expected_exit_code=1)
+        self.assertIn('Failed to convert bad.md', stderr.getvalue())
+
+    def test_tree__missing_source(self):
+        _, stderr = self._run(
+            args=['--tree=%s' % os.path.join(self.fake_home, 'missing'),
+                  '--output_dir=%s' % os.path.join(self.fake_home, 'out')],
+            expected_exit_code=1)
+        self.assertIn('missing is not a directory', stderr.getvalue())
+
+    def test_tree__without_output_dir(self):
+        self.assertRaises(SystemExit, self._run, args=['--tree=site'])
+
+    def test_tree__with_inputs(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--tree=site', '--output_dir=out', 'a.md'])
+
+    def test_serve__with_inputs(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--serve=/tmp/socket', 'input.md'])
+
+    def _wait_for_contents(self, path, contents, timeout=10):
+        """Waits for a file to have the given contents.
+
+        Args:
+            path: str.  Path to the file to check.
+            contents: str.  The expected contents of the file.
+            timeout: float.  Maximum time to wait in seconds.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if os.path.exists(path):
+                with open(path) as input_file:
+                    if input_file.read() == contents:
+                        return
+            time.sleep(0.01)
+        self.fail('%s did not get the expected contents' % path)
+
+    def test_watch(self):
+        input1 = os.path.join(self.fake_home, 'input1.md')
+        input2 = os.path.join(self.fake_home, 'input2.md')
+        output1 = os.path.join(self.fake_home, 'output1.gplus')
+        output2 = os.path.join(self.fake_home, 'output2.gplus')
+        with open(input1, 'w') as output:
+            output.write(self.TEST_INPUT)
+        with open(input2, 'w') as output:
+            output.write('Second\n')
+
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'markdown2social', '--watch',
+             '%s:%s' % (input1, output1), '%s:%s' % (input2, output2)],
+            stderr=subprocess.PIPE)
+        try:
+            self._wait_for_contents(output1, self.TEST_OUTPUT)
+            self._wait_for_contents(output2, 'Second\n')
+            inode2 = os.stat(output2).st_ino
+
+            with open(input1, 'w') as output:
+                output.write('Updated *post*\n')
+            self._wait_for_contents(output1, 'Updated _post_\n')
+            self.assertEquals(inode2, os.stat(output2).st_ino)
+        finally:
+            process.send_signal(signal.SIGINT)
+            _, stderr = process.communicate()
+        self.assertEquals(0, process.returncode)
+        self.assertIn('Converted %s' % input1, stderr)
+
+    def test_watch__no_pairs(self):
+        self.assertRaises(SystemExit, self._run, args=['--watch'])
+
+    def test_watch__bad_pair(self):
+        self.assertRaises(SystemExit, self._run, args=['--watch', 'input.md'])
+
+    def test_watch__with_batch(self):
+        self.assertRaises(SystemExit, self._run,
+                          args=['--watch', '--batch', 'in.md:out.gplus'])
+
+
+class LoggerTest(unittest.TestCase):
+    """Tests for the global logger of the package."""
+
+    def test_get_logger(self):
+        self.assertIs(markdown2social.get_logger(),
+                      markdown2social.get_logger())
+
+    def test_legacy_alias(self):
+        logger = markdown2social.get_logger()
+        self.assertEquals(logger.name, markdown2social.LOGGER.name)
+        self.assertEquals(logger.getEffectiveLevel(),
+                          markdown2social.LOGGER.getEffectiveLevel())
+
+        old_propagate = logger.propagate
+        try:
+            markdown2social.LOGGER.propagate = not old_propagate
+            self.assertEquals(not old_propagate, logger.propagate)
+        finally:
+            logger.propagate = old_propagate
+
+
+class ErrorMessageTest(unittest.TestCase):
+    """Tests for the error_message function."""
+
+    def test_ascii(self):
+        self.assertEquals(
+            'Bad input', markdown2social.error_message(ValueError('Bad input')))
+
+    def test_non_ascii_unicode(self):
+        self.assertEquals(
+            'Bad caf\xc3\xa9',
+            markdown2social.error_message(ValueError(u'Bad caf\xe9')))
+
+    def test_non_ascii_bytes(self):
+        self.assertEquals(
+            'Bad caf\xc3\xa9',
+            markdown2social.error_message(ValueError('Bad caf\xc3\xa9')))
+
+    def test_empty(self):
+        self.assertEquals('KeyboardInterrupt',
+                          markdown2social.error_message(KeyboardInterrupt()))
+
+
+class StartupTest(unittest.TestCase):
+    """Tests for the startup cost of the main program."""
+
+    # list(str).  Modules that are expensive to load and that must not be
+    # imported unless a conversion happens locally.
+    HEAVY_MODULES = ['frontmatter', 'markdown', 'yaml']
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.old_xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        if self.old_xdg_cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old_xdg_cache_home
+        shutil.rmtree(self.tempdir)
+
+    def _measure(self, args):
+        """Runs the program and checks that it did not load heavy modules.
+
+        The time spent in imports is not checked because it depends on the
+        load of the machine; see startup_bench for that.
+
+        Args:
+            args: list(str).  Arguments to pass to the program.
+
+        Returns:
+            dict.  The results of the run, as returned by
+            startup_bench.measure().
+        """
+        results = startup_bench.measure(args, stdin=MainTest.TEST_INPUT)
+        for module in self.HEAVY_MODULES:
+            self.assertNotIn(module, results['modules'])
+        return results
+
+    def test_version(self):
+        self.assertEquals(0, self._measure(['--version'])['exit_code'])
+
+    def test_help(self):
+        self.assertEquals(0, self._measure(['--help'])['exit_code'])
+
+    def test_usage_error(self):
+        self.assertEquals(2, self._measure(['--jobs=2'])['exit_code'])
+
+    def test_bad_config(self):
+        config_path = os.path.join(self.tempdir, 'config')
+        with open(config_path, 'w') as output:
+            output.write('This is not a configuration file\n')
+        results = self._measure(['--config_file=%s' % config_path])
+        self.assertEquals(1, results['exit_code'])
+
+    def test_socket(self):
+        socket_path = os.path.join(self.tempdir, 'socket')
+        daemon = server.Server(socket_path, '/dev/null')
+        thread = threading.Thread(target=daemon.serve_forever,
+                                  kwargs={'poll_interval': 0.05})
+        thread.start()
+        try:
+            results = self._measure(['--socket=%s' % socket_path])
+            self.assertEquals(0, results['exit_code'])
+        finally:
+            daemon.shutdown()
+            daemon.server_close()
+            thread.join()
+
+    def test_local_conversion_loads_heavy_modules(self):
+        results = startup_bench.measure(['--config_file=/dev/null'],
+                                        stdin=MainTest.TEST_INPUT)
+        self.assertEquals(0, results['exit_code'])
+        for module in self.HEAVY_MODULES:
+            self.assertIn(module, results['modules'])
+
+    def test_cached_conversion(self):
+        results = startup_bench.measure(['--config_file=/dev/null'],
+                                        stdin=MainTest.TEST_INPUT)
+        self.assertEquals(0, results['exit_code'])
+        self._measure(['--config_file=/dev/null'])
+
+
+class MemoryTest(unittest.TestCase):
+    """Checks the peak memory used by the conversion of large documents."""
+
+    # int.  Size in bytes of the document to convert.
+    INPUT_SIZE = 256 * 1024
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.tempdir, 'input.md')
+        large_input_bench.write_document(self.input_path, self.INPUT_SIZE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _check_growth(self, max_ratio, args=None):
+        """Converts the document and checks how much memory it took.
+
+        Args:
+            max_ratio: float.  Maximum growth of the peak resident set size of
+                the program, as a multiple of the size of the input.
+            args: list(str).  Additional arguments to pass to the program.
+        """
+        results = large_input_bench.measure(self.input_path, args=args)
+        self.assertEquals(0, results['exit_code'])
+        growth = results['peak_rss'] - results['initial_rss']
+        self.assertLess(float(growth) / self.INPUT_SIZE, max_ratio)
+
+    def test_streaming(self):
+        # The parsed document dominates: python-markdown builds a tree with
+        # many small objects and stashes every entity.  Keeping a few copies
+        # of the input or of the output in memory on top of it exceeds this.
+        self._check_growth(25)
+
+    def test_whole_document(self):
+        # --stats converts the whole document at once, so the output is kept
+        # in memory while being postprocessed.
+        self._check_growth(28, args=['--stats'])
+
 
 if __name__ == '__main__':
     unittest.main()
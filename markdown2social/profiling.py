@@ -0,0 +1,141 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Profiling of conversions broken down by stage."""
+
+import cProfile
+import inspect
+import pstats
+
+import markdown.blockparser
+import markdown.postprocessors
+import markdown.preprocessors
+import markdown.treeprocessors
+
+from markdown2social import converter
+from markdown2social import front_matter
+
+
+def _processor_functions(module, base_class):
+    """Gets the run() methods of all the processors defined in a module.
+
+    Args:
+        module: module.  The python-markdown module defining the processors.
+        base_class: type.  The base class of the processors.
+
+    Returns:
+        list(function).  The run() methods.
+    """
+    functions = []
+    for _, value in inspect.getmembers(module, inspect.isclass):
+        if issubclass(value, base_class) and 'run' in value.__dict__:
+            functions.append(value.__dict__['run'])
+    return functions
+
+
+# list(tuple(str, list(function))).  Stages of a conversion, in the order in
+# which they run, and the functions that implement each of them.  The stages
+# must not call each other except for the replacements, which are applied
+# from within the formatting stage and are accounted for separately.
+_STAGES = [
+    ('front matter', [front_matter.parse]),
+    ('parser setup', [converter.Converter.__init__]),
+    ('preprocessing', _processor_functions(
+        markdown.preprocessors, markdown.preprocessors.Preprocessor)),
+    ('block parsing', [markdown.blockparser.BlockParser.parseDocument]),
+    ('inline parsing', _processor_functions(
+        markdown.treeprocessors, markdown.treeprocessors.Treeprocessor)),
+    ('formatting', [converter._Markdown._format_document]),
+    ('replacements', [converter._apply_replacements]),
+    ('postprocessing', _processor_functions(
+        markdown.postprocessors, markdown.postprocessors.Postprocessor)),
+    ('entities', [converter._replace_entities]),
+]
+
+
+def _label(function):
+    """Computes the key under which pstats records a function.
+
+    Args:
+        function: function or instancemethod.  The function to look up.
+
+    Returns:
+        tuple(str, int, str).  The file name, the line number and the name of
+        the function.
+    """
+    code = getattr(function, '__func__', function).__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def summarize(stats):
+    """Breaks down the profile of a conversion by stage.
+
+    Args:
+        stats: pstats.Stats.  The profile of the conversion.
+
+    Returns:
+        list(tuple(str, float)).  The stages and the seconds spent in each of
+        them, in the order in which they run.  The last stage, "other",
+        accounts for any time not attributable to the known stages.
+    """
+    times = {}
+    for name, functions in _STAGES:
+        times[name] = 0.0
+        for function in functions:
+            entry = stats.stats.get(_label(function))
+            if entry is not None:
+                times[name] += entry[3]  # Cumulative time.
+    times['formatting'] = max(0.0, times['formatting'] - times['replacements'])
+
+    summary = [(name, times[name]) for name, _ in _STAGES]
+    other = max(0.0, stats.total_tt - sum(times.values()))
+    return summary + [('other', other)]
+
+
+def write_summary(output, summary):
+    """Writes the breakdown of a conversion in human-readable form.
+
+    Args:
+        output: file.  Stream to write the breakdown to.
+        summary: list(tuple(str, float)).  The result of summarize().
+    """
+    total = sum(seconds for _, seconds in summary)
+    output.write('%-16s %10s %7s\n' % ('stage', 'time (ms)', '%'))
+    for name, seconds in summary:
+        output.write('%-16s %10.2f %7.1f\n' % (
+            name, seconds * 1e3, seconds * 100.0 / total if total else 0.0))
+    output.write('%-16s %10.2f %7.1f\n' % ('total', total * 1e3, 100.0))
+
+
+def profile(stats_path, output, func, *args, **kwargs):
+    """Runs a function under the profiler.
+
+    Args:
+        stats_path: str.  Path to the file to write the pstats dump to.
+        output: file.  Stream to write the breakdown of the run by stage to.
+        func: callable.  The function to profile.
+        *args: list.  Positional arguments to pass to func.
+        **kwargs: dict.  Keyword arguments to pass to func.
+
+    Returns:
+        object.  The return value of func.
+
+    Raises:
+        IOError: If the pstats dump cannot be written.
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    profiler.dump_stats(stats_path)
+    write_summary(output, summarize(pstats.Stats(profiler)))
+    return result
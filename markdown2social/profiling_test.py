@@ -0,0 +1,85 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import cProfile
+import os
+import pstats
+import StringIO
+import tempfile
+import unittest
+
+from markdown2social import converter
+from markdown2social import profiling
+
+
+class SummarizeTest(unittest.TestCase):
+    """Unit tests for the summarize function."""
+
+    def _profile_conversion(self, content, replacements=None):
+        """Profiles the conversion of a document.
+
+        Args:
+            content: unicode.  The document to convert.
+            replacements: list(tuple(str, str)).  Replacements to apply.
+
+        Returns:
+            dict(str, float).  The result of summarize() as a dictionary.
+        """
+        profiler = cProfile.Profile()
+        profiler.runcall(converter.convert, {}, content,
+                         replacements=replacements)
+        summary = profiling.summarize(pstats.Stats(profiler))
+        self.assertEquals('other', summary[-1][0])
+        return dict(summary)
+
+    def test_all_stages(self):
+        content = u'Some *text* &mdash; with [a link](http://example.com/)\n'
+        times = self._profile_conversion(content * 200,
+                                         replacements=[('text', 'words')])
+        for stage in ['parser setup', 'preprocessing', 'block parsing',
+                      'inline parsing', 'formatting', 'replacements',
+                      'postprocessing', 'entities']:
+            self.assertLess(0, times[stage], msg=stage)
+
+    def test_no_front_matter(self):
+        times = self._profile_conversion(u'Text\n')
+        self.assertEquals(0, times['front matter'])
+
+
+class ProfileTest(unittest.TestCase):
+    """Unit tests for the profile function."""
+
+    def test_writes_stats_and_summary(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        output = StringIO.StringIO()
+        try:
+            result = profiling.profile(path, output, converter.convert, {},
+                                       u'Some *text*')
+            stats = pstats.Stats(path)
+        finally:
+            os.unlink(path)
+        self.assertEquals(u'Some _text_\n', result)
+        self.assertLess(0, stats.total_calls)
+        self.assertRegexpMatches(output.getvalue(), r'block parsing +[0-9.]+')
+        self.assertRegexpMatches(output.getvalue(), r'total +[0-9.]+ +100\.0')
+
+    def test_unwritable_stats(self):
+        self.assertRaises(IOError, profiling.profile,
+                          '/non-existent/profile', StringIO.StringIO(),
+                          converter.convert, {}, u'Text')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,508 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Engine to apply the replacements defined in the configuration file.
+
+Replacements are applied in the order in which they are defined, one after
+the other, to every piece of text in the document.  Applying each rule as its
+own regular expression substitution makes the cost proportional to the number
+of rules, which is wasteful when most of them are plain strings.  This module
+merges consecutive literal rules into a single pass whenever doing so cannot
+change the result of applying them in sequence.
+
+A ReplacementSet can optionally be instrumented to record how often each rule
+matches and how much time it takes, which helps in finding rules that never
+fire or that dominate the cost of the replacements.
+"""
+
+import collections
+import hashlib
+import re
+import time
+
+
+class Error(Exception):
+    """Base class for exceptions raised by this module."""
+
+
+class InvalidRuleError(Error):
+    """Error when a replacement rule cannot be compiled.
+
+    Attributes:
+        index: int.  Position of the offending rule in the input collection.
+    """
+
+    def __init__(self, index, message):
+        """Constructor.
+
+        Args:
+            index: int.  Position of the offending rule in the input collection.
+            message: str.  Description of the problem.
+        """
+        Error.__init__(self, message)
+        self.index = index
+
+
+# frozenset(str).  Characters that have a special meaning in a regular
+# expression.  A pattern without any of these matches itself literally.
+_REGEX_SPECIAL_CHARS = frozenset('\\.^$*+?{}[]|()')
+
+
+class RuleStats(object):
+    """Measurements of a single replacement rule.
+
+    Attributes:
+        index: int.  Position of the rule in the set.
+        regex: str.  The regular expression of the rule.
+        subst: str.  The substitution of the rule.
+        matches: int.  Number of substitutions made by the rule.
+        nodes: int.  Number of pieces of text the rule was tried on.
+        time: float.  Wall time in seconds spent applying the rule.  Literal
+            rules that share a pass split the time of the pass evenly, as
+            there is no way to tell their costs apart.
+    """
+
+    def __init__(self, index, regex, subst):
+        """Constructor for a rule that has not been applied yet.
+
+        Args:
+            index: int.  Position of the rule in the set.
+            regex: str.  The regular expression of the rule.
+            subst: str.  The substitution of the rule.
+        """
+        self.index = index
+        self.regex = regex
+        self.subst = subst
+        self.matches = 0
+        self.nodes = 0
+        self.time = 0.0
+
+
+def _is_literal(regex, subst):
+    """Checks if a replacement rule can be applied as a plain string swap.
+
+    Args:
+        regex: str.  The regular expression of the rule.
+        subst: str.  The substitution of the rule.
+
+    Returns:
+        bool.  True if the regular expression matches itself only and the
+        substitution contains no backreferences nor escape sequences.
+    """
+    return (regex and '\\' not in subst and
+            not any(char in _REGEX_SPECIAL_CHARS for char in regex))
+
+
+def _prefixes(text):
+    """Returns all the non-empty prefixes of a string, including itself."""
+    return [text[:i] for i in xrange(1, len(text) + 1)]
+
+
+def _suffixes(text):
+    """Returns all the non-empty suffixes of a string, including itself."""
+    return [text[i:] for i in xrange(len(text))]
+
+
+def _trie_regex(node):
+    """Converts a trie of strings to a regular expression that matches them.
+
+    Args:
+        node: dict(str, dict).  A trie node as built by _LiteralPass.  The
+            empty key marks the end of a string.
+
+    Returns:
+        str.  A regular expression matching any string in the trie.  When more
+        than one string matches at a given position, the longest one wins.
+    """
+    alternatives = [re.escape(char) + _trie_regex(child)
+                    for char, child in sorted(node.iteritems()) if char]
+    if not alternatives:
+        return ''
+    terminal = '' in node
+    if len(alternatives) == 1 and not terminal:
+        return alternatives[0]
+    return '(?:%s)%s' % ('|'.join(alternatives), '?' if terminal else '')
+
+
+class _RegexPass(object):
+    """Applies a single regular expression rule."""
+
+    def __init__(self, regex, subst, index):
+        """Constructor.
+
+        Args:
+            regex: str.  The regular expression to match.
+            subst: str.  The substitution for the matches.
+            index: int.  Position of the rule in the set.
+
+        Raises:
+            re.error: If the regular expression is invalid.
+        """
+        self._pattern = re.compile(regex)
+        self._subst = subst
+        self._index = index
+
+    def apply(self, text):
+        """Applies the rule to a piece of text.
+
+        Args:
+            text: str.  The text to process.
+
+        Returns:
+            str.  The text with the rule applied.
+        """
+        return self._pattern.sub(self._subst, text)
+
+    def subn(self, text):
+        """Applies the rule to a piece of text and counts the matches.
+
+        Args:
+            text: str.  The text to process.
+
+        Returns:
+            tuple(str, int).  The text with the rule applied and the number of
+            substitutions made.
+        """
+        return self._pattern.subn(self._subst, text)
+
+    def subn_instrumented(self, text, rule_stats):
+        """Applies the rule to a piece of text and records its measurements.
+
+        Args:
+            text: str.  The text to process.
+            rule_stats: list(RuleStats).  The measurements of all the rules in
+                the set, indexed by rule position.
+
+        Returns:
+            tuple(str, int).  The text with the rule applied and the number of
+            substitutions made.
+        """
+        start = time.time()
+        text, count = self._pattern.subn(self._subst, text)
+        stats = rule_stats[self._index]
+        stats.time += time.time() - start
+        stats.nodes += 1
+        stats.matches += count
+        return text, count
+
+
+class _LiteralPass(object):
+    """Applies a group of literal rules in a single pass over the text.
+
+    Applying a group of literal rules at once yields the same result as
+    applying them one after the other as long as 1) no rule can match text
+    that overlaps a match of an earlier rule unless both start at the same
+    position and the earlier one is the longest, and 2) no rule can match text
+    that overlaps the substitution of an earlier rule.  can_add() verifies
+    these conditions for every rule before it joins the group.
+    """
+
+    def __init__(self):
+        """Constructor for an empty group."""
+        self._table = {}
+        self._trie = {}
+        self._pattern = None
+
+        # Position in the set of the rule that owns each pattern, and of all
+        # the rules in the group, to attribute measurements to them.
+        self._owners = {}
+        self._indexes = []
+
+        # Indexes of the patterns and substitutions of the rules in the group
+        # to quickly check for overlaps.
+        self._patterns_prefixes = set()
+        self._substs = set()
+        self._substs_prefixes = set()
+        self._substs_suffixes = set()
+        self._substs_bigrams = {}
+        self._substs_chars = set()
+        self._has_empty_subst = False
+
+    def _overlaps_subst(self, regex):
+        """Checks if a pattern can match text overlapping a substitution.
+
+        Args:
+            regex: str.  The literal pattern to check.
+
+        Returns:
+            bool.  True if there is any alignment of the pattern and any
+            substitution in the group in which they share at least one
+            character.
+        """
+        if self._has_empty_subst and len(regex) > 1:
+            # Removing text can bring together two fragments that form a match
+            # of the pattern.
+            return True
+
+        prefixes = _prefixes(regex)
+        suffixes = _suffixes(regex)
+        if any(suffix in self._substs_prefixes for suffix in suffixes):
+            return True
+        if any(prefix in self._substs_suffixes for prefix in prefixes):
+            return True
+        if any(suffix[:i] in self._substs
+               for suffix in suffixes for i in xrange(1, len(suffix) + 1)):
+            return True
+
+        if len(regex) == 1:
+            return regex in self._substs_chars
+        return any(regex in subst
+                   for subst in self._substs_bigrams.get(regex[:2], ()))
+
+    def can_add(self, regex, subst):
+        """Checks if a literal rule can join the group.
+
+        Args:
+            regex: str.  The pattern of the rule, which must be literal.
+            subst: str.  The substitution of the rule.
+
+        Returns:
+            bool.  True if applying the rule as part of this group yields the
+            same results as applying it after all the rules in the group.
+        """
+        del subst  # The substitution of the new rule is irrelevant.
+
+        if regex in self._table:
+            # The earlier rule consumes all matches so this one is a no-op,
+            # just like it would be when applied separately.
+            return not self._overlaps_subst(regex)
+
+        # An earlier pattern matching at the same position as this one would
+        # win when applied first, but the longest one wins in a single pass.
+        if any(prefix in self._table for prefix in _prefixes(regex)[:-1]):
+            return False
+
+        # A match of this pattern starting before a match of an earlier pattern
+        # would win in a single pass but not when applied in sequence.
+        for i in xrange(1, len(regex)):
+            if regex[i:] in self._patterns_prefixes:
+                return False
+            for j in xrange(i + 1, len(regex)):
+                if regex[i:j] in self._table:
+                    return False
+
+        return not self._overlaps_subst(regex)
+
+    def add(self, regex, subst, index):
+        """Adds a literal rule to the group.
+
+        The caller must have checked that the rule can be added with can_add.
+
+        Args:
+            regex: str.  The pattern of the rule, which must be literal.
+            subst: str.  The substitution of the rule.
+            index: int.  Position of the rule in the set.
+        """
+        self._pattern = None
+        self._indexes.append(index)
+
+        if regex not in self._table:
+            self._table[regex] = subst
+            self._owners[regex] = index
+            node = self._trie
+            for char in regex:
+                node = node.setdefault(char, {})
+            node[''] = True
+            self._patterns_prefixes.update(_prefixes(regex))
+
+        if not subst:
+            self._has_empty_subst = True
+        self._substs.add(subst)
+        self._substs_prefixes.update(_prefixes(subst)[:-1])
+        self._substs_suffixes.update(_suffixes(subst)[1:])
+        for i in xrange(len(subst) - 1):
+            self._substs_bigrams.setdefault(subst[i:i + 2], set()).add(subst)
+        self._substs_chars.update(subst)
+
+    def _lookup(self, match):
+        """Returns the substitution for a match of the combined pattern."""
+        return self._table[match.group(0)]
+
+    def _compiled_pattern(self):
+        """Returns the combined pattern of the group, compiling it if needed."""
+        if self._pattern is None:
+            self._pattern = re.compile(_trie_regex(self._trie))
+        return self._pattern
+
+    def apply(self, text):
+        """Applies all rules in the group to a piece of text.
+
+        Args:
+            text: str.  The text to process.
+
+        Returns:
+            str.  The text with the rules applied.
+        """
+        return self._compiled_pattern().sub(self._lookup, text)
+
+    def subn(self, text):
+        """Applies all rules in the group to a piece of text and counts them.
+
+        Args:
+            text: str.  The text to process.
+
+        Returns:
+            tuple(str, int).  The text with the rules applied and the number of
+            substitutions made.
+        """
+        return self._compiled_pattern().subn(self._lookup, text)
+
+    def subn_instrumented(self, text, rule_stats):
+        """Applies all rules in the group and records their measurements.
+
+        Args:
+            text: str.  The text to process.
+            rule_stats: list(RuleStats).  The measurements of all the rules in
+                the set, indexed by rule position.
+
+        Returns:
+            tuple(str, int).  The text with the rules applied and the number of
+            substitutions made.
+        """
+        matches = collections.Counter()
+
+        def lookup(match):
+            """Returns the substitution for a match and counts it."""
+            matches[match.group(0)] += 1
+            return self._table[match.group(0)]
+
+        start = time.time()
+        text, count = self._compiled_pattern().subn(lookup, text)
+        share = (time.time() - start) / len(self._indexes)
+        for index in self._indexes:
+            rule_stats[index].time += share
+            rule_stats[index].nodes += 1
+        for regex, regex_matches in matches.iteritems():
+            rule_stats[self._owners[regex]].matches += regex_matches
+        return text, count
+
+
+class ReplacementSet(object):
+    """Ordered collection of replacement rules ready to be applied.
+
+    This behaves as an immutable sequence of the (regex, subst) pairs it was
+    constructed from, so it compares equal to a list of such pairs.
+
+    Attributes:
+        rule_stats: list(RuleStats).  Measurements of each rule, in the order
+            of the rules, accumulated over all the calls to apply and subn.
+            None unless the set is instrumented.  Instrumented sets must not
+            be used from more than one thread at a time.
+    """
+
+    def __init__(self, replacements=None, instrument=False):
+        """Constructor.
+
+        Args:
+            replacements: collection(tuple(str, str)).  List of pairs
+                representing a regular expression to match text and its
+                corresponding replacement.  The replacement can use
+                backreferences.
+            instrument: bool.  Whether to record the measurements of each rule
+                in rule_stats.  This slows down the replacements.
+
+        Raises:
+            InvalidRuleError: If any of the regular expressions is invalid.
+        """
+        self._rules = tuple(tuple(rule) for rule in replacements or ())
+        self.rule_stats = None
+        if instrument:
+            self.rule_stats = [RuleStats(index, regex, subst)
+                               for index, (regex, subst)
+                               in enumerate(self._rules)]
+
+        self._passes = []
+        for index, (regex, subst) in enumerate(self._rules):
+            if _is_literal(regex, subst):
+                last = self._passes[-1] if self._passes else None
+                if not (isinstance(last, _LiteralPass) and
+                        last.can_add(regex, subst)):
+                    last = _LiteralPass()
+                    self._passes.append(last)
+                last.add(regex, subst, index)
+            else:
+                try:
+                    self._passes.append(_RegexPass(regex, subst, index))
+                except re.error as e:
+                    raise InvalidRuleError(
+                        index, 'Invalid regular expression %s: %s' % (regex, e))
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __iter__(self):
+        return iter(self._rules)
+
+    def __getitem__(self, index):
+        return self._rules[index]
+
+    def __eq__(self, other):
+        try:
+            return self._rules == tuple(tuple(rule) for rule in other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'ReplacementSet(%r)' % (list(self._rules),)
+
+    def fingerprint(self):
+        """Computes a digest that identifies the rules in the set.
+
+        Returns:
+            str.  A hexadecimal digest that is the same for any two sets with
+            the same rules in the same order.
+        """
+        return hashlib.sha1(repr(self._rules)).hexdigest()
+
+    def apply(self, text):
+        """Applies all replacements to a piece of text.
+
+        Args:
+            text: str.  The text to process.
+
+        Returns:
+            str.  The text with all replacements applied in order.
+        """
+        if self.rule_stats is not None:
+            return self.subn(text)[0]
+
+        for replacement_pass in self._passes:
+            text = replacement_pass.apply(text)
+        return text
+
+    def subn(self, text):
+        """Applies all replacements to a piece of text and counts them.
+
+        Args:
+            text: str.  The text to process.
+
+        Returns:
+            tuple(str, int).  The text with all replacements applied in order
+            and the total number of substitutions made.
+        """
+        total = 0
+        for replacement_pass in self._passes:
+            if self.rule_stats is None:
+                text, count = replacement_pass.subn(text)
+            else:
+                text, count = replacement_pass.subn_instrumented(
+                    text, self.rule_stats)
+            total += count
+        return text, total
@@ -0,0 +1,175 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import random
+import re
+import unittest
+
+from markdown2social import replacement
+
+
+def _apply_sequentially(replacements, text):
+    """Reference implementation: applies each rule on its own, in order."""
+    for regex, subst in replacements:
+        text = re.sub(regex, subst, text)
+    return text
+
+
+def _subn_sequentially(replacements, text):
+    """Reference implementation of subn: counts the matches of each rule."""
+    total = 0
+    for regex, subst in replacements:
+        text, count = re.subn(regex, subst, text)
+        total += count
+    return text, total
+
+
+class ReplacementSetTest(unittest.TestCase):
+    """Unit tests for the ReplacementSet class."""
+
+    def test_sequence_interface(self):
+        rules = [('a', 'b'), (r'c(d)', r'\1')]
+        replacements = replacement.ReplacementSet(rules)
+        self.assertEquals(2, len(replacements))
+        self.assertEquals(('c(d)', r'\1'), replacements[1])
+        self.assertEquals(rules, list(replacements))
+        self.assertEquals(rules, replacements)
+        self.assertEquals(replacements, rules)
+        self.assertNotEquals([('a', 'b')], replacements)
+        self.assertNotEquals(None, replacements)
+
+    def test_empty(self):
+        replacements = replacement.ReplacementSet()
+        self.assertFalse(replacements)
+        self.assertEquals('foo', replacements.apply('foo'))
+
+    def test_regex_rules_keep_order(self):
+        replacements = replacement.ReplacementSet([
+            (r'(\A|\s)(magic/[0-9_-]+)', r'\1http://\2'),
+            (r'http://magic', r'https://magic'),
+            (r'^anchored', r'replaced'),
+        ])
+        self.assertEquals('https://magic/12 replaced',
+                          replacements.apply('magic/12 replaced'))
+        self.assertEquals('replaced anchored',
+                          replacements.apply('anchored anchored'))
+
+    def test_literal_rules_share_a_pass(self):
+        replacements = replacement.ReplacementSet(
+            [('product%02d' % i, 'Product %d!' % i) for i in xrange(100)])
+        self.assertEquals(1, len(replacements._passes))
+        self.assertEquals('Use Product 12! and Product 7!.',
+                          replacements.apply('Use product12 and product07.'))
+
+    def test_literal_prefix_of_later_rule_splits_pass(self):
+        replacements = replacement.ReplacementSet([('foo', 'A'),
+                                                   ('foobar', 'B')])
+        self.assertEquals(2, len(replacements._passes))
+        self.assertEquals('Abar', replacements.apply('foobar'))
+
+    def test_chained_literal_rules(self):
+        replacements = replacement.ReplacementSet([('foo', 'bar'),
+                                                   ('bar', 'baz')])
+        self.assertEquals('baz baz', replacements.apply('foo bar'))
+
+    def test_overlapping_literal_rules(self):
+        rules = [('oob', 'X'), ('foo', 'Y'), ('fo', 'Z'), ('f', '')]
+        replacements = replacement.ReplacementSet(rules)
+        for text in ['foob', 'foo', 'fofoob', 'ffoo']:
+            self.assertEquals(_apply_sequentially(rules, text),
+                              replacements.apply(text))
+
+    def test_fingerprint(self):
+        rules = [('a', 'b'), (r'c(d)', r'\1')]
+        fingerprint = replacement.ReplacementSet(rules).fingerprint()
+        self.assertEquals(fingerprint,
+                          replacement.ReplacementSet(rules).fingerprint())
+        self.assertNotEquals(
+            fingerprint,
+            replacement.ReplacementSet(rules[::-1]).fingerprint())
+        self.assertNotEquals(fingerprint,
+                             replacement.ReplacementSet().fingerprint())
+
+    def test_subn(self):
+        replacements = replacement.ReplacementSet([
+            ('foo', 'bar'), ('baz', 'qux'), (r'b(a)r', r'B\1R')])
+        self.assertEquals(('BaR qux BaR', 4),
+                          replacements.subn('foo baz bar'))
+        self.assertEquals(('nothing', 0), replacements.subn('nothing'))
+
+    def test_not_instrumented(self):
+        replacements = replacement.ReplacementSet([('a', 'b')])
+        replacements.apply('a')
+        self.assertIsNone(replacements.rule_stats)
+
+    def test_rule_stats(self):
+        replacements = replacement.ReplacementSet(
+            [('foo', 'bar'), ('baz', 'qux'), ('foo', 'zzz'),
+             (r'b(a)r', r'B\1R'), ('unused', 'x')], instrument=True)
+        self.assertEquals('BaR qux BaR', replacements.apply('foo baz bar'))
+        self.assertEquals(('BaR', 2), replacements.subn('foo'))
+
+        self.assertEquals([(0, 'foo', 'bar'), (1, 'baz', 'qux'),
+                           (2, 'foo', 'zzz'), (3, r'b(a)r', r'B\1R'),
+                           (4, 'unused', 'x')],
+                          [(rule.index, rule.regex, rule.subst)
+                           for rule in replacements.rule_stats])
+        self.assertEquals([2, 1, 0, 3, 0],
+                          [rule.matches for rule in replacements.rule_stats])
+        self.assertEquals([2] * 5,
+                          [rule.nodes for rule in replacements.rule_stats])
+        for rule in replacements.rule_stats:
+            self.assertLessEqual(0.0, rule.time)
+
+    def test_invalid_regex(self):
+        try:
+            replacement.ReplacementSet([('a', 'b'), ('(', 'c')])
+            self.fail('InvalidRuleError not raised')
+        except replacement.InvalidRuleError as e:
+            self.assertEquals(1, e.index)
+
+    def test_matches_sequential_application(self):
+        rng = random.Random(1234)
+        alphabet = 'abc'
+        for _ in xrange(2000):
+            rules = []
+            for _ in xrange(rng.randint(1, 6)):
+                regex = ''.join(rng.choice(alphabet)
+                                for _ in xrange(rng.randint(1, 3)))
+                subst = ''.join(rng.choice(alphabet + 'XY')
+                                for _ in xrange(rng.randint(0, 3)))
+                rules.append((regex, subst))
+            text = ''.join(rng.choice(alphabet) for _ in xrange(12))
+
+            replacements = replacement.ReplacementSet(rules)
+            self.assertEquals(_apply_sequentially(rules, text),
+                              replacements.apply(text),
+                              msg='rules=%r text=%r' % (rules, text))
+            self.assertEquals(_subn_sequentially(rules, text),
+                              replacements.subn(text),
+                              msg='rules=%r text=%r' % (rules, text))
+
+            instrumented = replacement.ReplacementSet(rules, instrument=True)
+            self.assertEquals(_subn_sequentially(rules, text),
+                              instrumented.subn(text),
+                              msg='rules=%r text=%r' % (rules, text))
+            self.assertEquals(
+                [re.subn(regex, subst, _apply_sequentially(rules[:i], text))[1]
+                 for i, (regex, subst) in enumerate(rules)],
+                [rule.matches for rule in instrumented.rule_stats],
+                msg='rules=%r text=%r' % (rules, text))
+
+
+if __name__ == '__main__':
+    unittest.main()
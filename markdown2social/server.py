@@ -0,0 +1,208 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Resident conversion daemon.
+
+The daemon listens on a Unix domain socket and keeps warm converters around so
+that clients do not pay the cost of loading the libraries and the
+configuration for every document.  See the client module for the protocol.
+"""
+
+import Queue
+import SocketServer
+import codecs
+import errno
+import os
+import socket
+import threading
+
+import markdown2social
+from markdown2social import client
+from markdown2social import config
+from markdown2social import converter
+from markdown2social import front_matter
+
+
+class Error(Exception):
+    """Base class for exceptions raised by this module."""
+
+
+class _ConverterPool(object):
+    """Pool of warm converters that tracks changes to the configuration file.
+
+    Converters are not shared by concurrent requests: each request checks one
+    out of the pool and returns it when done.  The configuration file is
+    reloaded when its modification time changes, and converters built for an
+    older configuration are discarded as they are returned.
+    """
+
+    def __init__(self, config_path):
+        """Constructor.
+
+        Args:
+            config_path: str.  Path to the configuration file.
+
+        Raises:
+            config.Error: If the initial configuration cannot be loaded.
+        """
+        self._config_path = config_path
+        self._lock = threading.Lock()
+        self._idle = Queue.LifoQueue()
+        self._generation = 0
+        self._mtime = self._stat_config()
+        self._replacements = config.load_config(config_path).replacements
+
+    def _stat_config(self):
+        """Returns the modification time of the configuration file or None."""
+        try:
+            return os.stat(self._config_path).st_mtime
+        except OSError:
+            return None
+
+    def _refresh(self):
+        """Reloads the configuration file if it has changed.
+
+        Returns:
+            tuple(int, replacement.ReplacementSet).  The current configuration
+            generation and the replacements to use.
+        """
+        mtime = self._stat_config()
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    replacements = config.load_config(
+                        self._config_path).replacements
+                except config.Error as e:
+                    markdown2social.get_logger().warning(
+                        'Failed to reload %s; keeping previous configuration: '
+                        '%s', self._config_path, e)
+                else:
+                    self._replacements = replacements
+                    self._generation += 1
+                self._mtime = mtime
+            return self._generation, self._replacements
+
+    def acquire(self):
+        """Checks out a converter for the current configuration.
+
+        Returns:
+            tuple(int, converter.Converter).  The configuration generation of
+            the converter and the converter itself.  Must be given back to
+            release() once done.
+        """
+        generation, replacements = self._refresh()
+        while True:
+            try:
+                idle_generation, idle_converter = self._idle.get_nowait()
+            except Queue.Empty:
+                break
+            if idle_generation == generation:
+                return idle_generation, idle_converter
+        return generation, converter.Converter(replacements=replacements)
+
+    def release(self, generation, released_converter):
+        """Returns a converter obtained via acquire() to the pool."""
+        if generation == self._generation:
+            self._idle.put((generation, released_converter))
+
+
+class _RequestHandler(SocketServer.BaseRequestHandler):
+    """Handles a single conversion request."""
+
+    def handle(self):
+        """Reads a document, converts it and sends the result back."""
+        try:
+            raw_input = codecs.decode(client.recv_payload(self.request),
+                                      'utf-8')
+        except (client.Error, socket.error, UnicodeDecodeError) as e:
+            markdown2social.get_logger().warning('Dropping bad request: %s',
+                                                 e)
+            return
+
+        generation, gplus_converter = self.server.converters.acquire()
+        try:
+            metadata, content = front_matter.parse(
+                raw_input, keys=converter.METADATA_KEYS)
+            status = client.STATUS_OK
+            payload = gplus_converter.convert(metadata, content)
+        except Exception as e:  # pylint: disable=broad-except
+            # A bad document must not bring the daemon down.
+            status = client.STATUS_ERROR
+            payload = markdown2social.error_message(e).decode('utf-8',
+                                                             'replace')
+        finally:
+            self.server.converters.release(generation, gplus_converter)
+
+        try:
+            self.request.sendall(status)
+            client.send_payload(self.request, codecs.encode(payload, 'utf-8'))
+        except socket.error as e:
+            markdown2social.get_logger().warning(
+                'Failed to send response: %s', e)
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Conversion daemon listening on a Unix domain socket."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, config_path):
+        """Constructor.
+
+        Args:
+            socket_path: str.  Path to the socket to listen on.  A stale socket
+                left behind by a previous instance is removed.
+            config_path: str.  Path to the configuration file.
+
+        Raises:
+            config.Error: If the configuration cannot be loaded.
+            Error: If another server is already listening on the socket.
+            socket.error: If the socket cannot be created.
+        """
+        self.converters = _ConverterPool(config_path)
+        _remove_stale_socket(socket_path)
+        SocketServer.UnixStreamServer.__init__(self, socket_path,
+                                               _RequestHandler)
+
+    def server_close(self):
+        """Stops listening and removes the socket."""
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def _remove_stale_socket(socket_path):
+    """Removes a socket left behind by a server that is no longer running.
+
+    Args:
+        socket_path: str.  Path to the socket.
+
+    Raises:
+        Error: If a server is still listening on the socket.
+    """
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except socket.error as e:
+        if e.errno not in (errno.ECONNREFUSED, errno.ENOTSOCK):
+            raise
+        os.unlink(socket_path)
+    else:
+        raise Error('Another server is already listening on %s' % socket_path)
+    finally:
+        probe.close()
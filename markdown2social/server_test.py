@@ -0,0 +1,155 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from markdown2social import client
+from markdown2social import server
+
+
+class ServerTest(unittest.TestCase):
+    """Tests for the conversion server and its client."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tempdir, 'socket')
+        self.config_path = os.path.join(self.tempdir, 'config')
+        self._write_config('foo -> bar')
+        self.daemon = None
+
+    def tearDown(self):
+        if self.daemon is not None:
+            self.daemon.shutdown()
+            self.daemon.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def _write_config(self, rule, mtime=None):
+        """Writes the configuration file.
+
+        Args:
+            rule: str.  The single replacement rule to put in the file.
+            mtime: int.  Modification time to give to the file, if any.
+        """
+        with open(self.config_path, 'w') as output:
+            output.write('[replacements]\n1 = %s\n' % rule)
+        if mtime is not None:
+            os.utime(self.config_path, (mtime, mtime))
+
+    def _start(self):
+        """Starts the server in a background thread."""
+        self.daemon = server.Server(self.socket_path, self.config_path)
+        thread = threading.Thread(target=self.daemon.serve_forever,
+                                  kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+
+    def test_convert(self):
+        self._start()
+        self.assertEquals(
+            u'*Title*\n\na bar \u2014\n',
+            client.convert_remote(self.socket_path,
+                                  u'---\ntitle: Title\n---\na foo &mdash;\n'))
+
+    def test_concurrent_requests(self):
+        self._start()
+        results = {}
+
+        def convert(i):
+            results[i] = client.convert_remote(self.socket_path,
+                                               u'foo %d\n\n* item\n' % i)
+
+        threads = [threading.Thread(target=convert, args=(i,))
+                   for i in xrange(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(dict((i, u'bar %d\n\n*#* item\n' % i)
+                               for i in xrange(20)), results)
+
+    def test_config_reload(self):
+        self._write_config('foo -> bar', mtime=1000)
+        self._start()
+        self.assertEquals(u'bar\n',
+                          client.convert_remote(self.socket_path, u'foo'))
+
+        self._write_config('foo -> baz', mtime=2000)
+        self.assertEquals(u'baz\n',
+                          client.convert_remote(self.socket_path, u'foo'))
+
+    def test_config_reload__bad_config_keeps_previous(self):
+        self._write_config('foo -> bar', mtime=1000)
+        self._start()
+
+        self._write_config('invalid', mtime=2000)
+        self.assertEquals(u'bar\n',
+                          client.convert_remote(self.socket_path, u'foo'))
+
+    def test_conversion_error(self):
+        self._start()
+        self.assertRaises(client.ConversionError, client.convert_remote,
+                          self.socket_path, u'---\ntitle: [unclosed\n---\n')
+        self.assertEquals(u'bar\n',
+                          client.convert_remote(self.socket_path, u'foo'))
+
+    def test_conversion_error__non_ascii_message(self):
+        def parse(unused_raw_input, keys=None):
+            raise ValueError('Bad caf\xc3\xa9')
+
+        real_parse = server.front_matter.parse
+        server.front_matter.parse = parse
+        try:
+            self._start()
+            try:
+                client.convert_remote(self.socket_path, u'foo')
+            except client.ConversionError as e:
+                self.assertEquals(u'Bad caf\xe9', e.args[0])
+            else:
+                self.fail('The conversion did not fail')
+        finally:
+            server.front_matter.parse = real_parse
+
+    def test_no_server(self):
+        self.assertRaises(socket.error, client.convert_remote,
+                          self.socket_path, u'foo')
+
+    def test_stale_socket_is_replaced(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+
+        self._start()
+        self.assertEquals(u'bar\n',
+                          client.convert_remote(self.socket_path, u'foo'))
+
+    def test_socket_in_use(self):
+        self._start()
+        self.assertRaises(server.Error, server.Server, self.socket_path,
+                          self.config_path)
+
+    def test_server_close_removes_socket(self):
+        daemon = server.Server(self.socket_path, self.config_path)
+        self.assertTrue(os.path.exists(self.socket_path))
+        daemon.server_close()
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
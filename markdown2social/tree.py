@@ -0,0 +1,307 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Incremental conversion of a tree of documents.
+
+The source tree is mirrored into the output directory, with every Markdown
+document converted into a file with the same relative path and the extension
+replaced by batch.OUTPUT_EXTENSION.  A manifest stored in the output directory
+records the modification time, the size and the hash of every source file as
+of its last successful conversion, along with the version of the program and
+the configuration used, so that a rebuild only converts the documents that
+changed and removes the outputs of the documents that disappeared.
+"""
+
+import collections
+import errno
+import hashlib
+import json
+import os
+import tempfile
+
+import markdown2social
+from markdown2social import batch
+from markdown2social import package
+from markdown2social import replacement
+
+
+# str.  Name of the manifest file in the output directory.
+MANIFEST_NAME = '.markdown2social-manifest.json'
+
+# tuple(str).  Extensions of the files in the source tree to convert.
+INPUT_EXTENSIONS = ('.markdown', '.md', '.mdown', '.mkd', '.mkdn')
+
+
+class Error(Exception):
+    """Base class for exceptions raised by this module."""
+
+
+# Outcome of a build.
+#
+# converted: list(str).  Relative paths of the documents that were converted.
+# unchanged: list(str).  Relative paths of the documents that were skipped
+#     because they did not change since the previous build.
+# removed: list(str).  Relative paths of the outputs that were deleted because
+#     their documents disappeared.
+# failures: list(tuple(str, str)).  Relative paths of the documents that could
+#     not be converted along with the reason for the failure.
+BuildResult = collections.namedtuple(
+    'BuildResult', ['converted', 'unchanged', 'removed', 'failures'])
+
+
+def _find_sources(source_dir, output_dir):
+    """Finds the documents to convert in a tree.
+
+    Hidden files and directories are ignored, as is the output directory if
+    it lives within the source tree.
+
+    Args:
+        source_dir: str.  Root of the tree to scan.
+        output_dir: str.  Directory where the outputs are written to.
+
+    Returns:
+        list(str).  Paths to the documents, relative to source_dir, in sorted
+        order.
+    """
+    output_dir = os.path.realpath(output_dir)
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames[:] = [
+            name for name in dirnames if not name.startswith('.') and
+            os.path.realpath(os.path.join(dirpath, name)) != output_dir]
+        for name in filenames:
+            if (not name.startswith('.') and
+                    os.path.splitext(name)[1].lower() in INPUT_EXTENSIONS):
+                sources.append(os.path.relpath(os.path.join(dirpath, name),
+                                               source_dir))
+    return sorted(sources)
+
+
+def _output_relpath(relpath):
+    """Computes the relative path of the output of a document.
+
+    Args:
+        relpath: str.  Path to the document relative to the source tree.
+
+    Returns:
+        str.  Path to the output relative to the output directory.
+    """
+    return os.path.splitext(relpath)[0] + batch.OUTPUT_EXTENSION
+
+
+def _hash_file(path):
+    """Computes the SHA-1 of the contents of a file.
+
+    Args:
+        path: str.  Path to the file.
+
+    Returns:
+        str.  The hex digest of the file.
+
+    Raises:
+        IOError: If the file cannot be read.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as input_file:
+        while True:
+            chunk = input_file.read(64 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_manifest(path, config_hash):
+    """Loads the manifest of a previous build.
+
+    Args:
+        path: str.  Path to the manifest file.
+        config_hash: str.  Fingerprint of the configuration of this build.
+
+    Returns:
+        tuple(dict(str, dict), bool).  The entries of the manifest keyed by
+        the relative path of their documents, and whether the entries can be
+        trusted to skip conversions, which is only the case if the previous
+        build used the same version of the program and configuration.
+    """
+    try:
+        with open(path, 'rb') as input_file:
+            manifest = json.load(input_file)
+        files = manifest['files']
+        if not isinstance(files, dict):
+            raise TypeError('files is not a dictionary')
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            markdown2social.get_logger().warning(
+                'Cannot read manifest %s: %s', path, e)
+        return {}, False
+    except (ValueError, KeyError, TypeError) as e:
+        markdown2social.get_logger().warning(
+            'Ignoring corrupted manifest %s: %s', path, e)
+        return {}, False
+    valid = (manifest.get('version') == package.VERSION and
+             manifest.get('config') == config_hash)
+    return files, valid
+
+
+def _save_manifest(path, config_hash, files):
+    """Atomically writes the manifest of a build.
+
+    Args:
+        path: str.  Path to the manifest file.
+        config_hash: str.  Fingerprint of the configuration of this build.
+        files: dict(str, dict).  The entries of the manifest.
+
+    Raises:
+        IOError: If the manifest cannot be written.
+        OSError: If the manifest cannot be written.
+    """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                         prefix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            json.dump({'version': package.VERSION, 'config': config_hash,
+                       'files': files}, output, indent=1, sort_keys=True)
+        os.rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def _remove_output(output_dir, relpath):
+    """Removes an output file and any directories left empty by it.
+
+    Args:
+        output_dir: str.  Root of the output tree, which is never removed.
+        relpath: str.  Path to the output file relative to output_dir.
+    """
+    try:
+        os.unlink(os.path.join(output_dir, relpath))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    subdir = os.path.dirname(relpath)
+    while subdir:
+        try:
+            os.rmdir(os.path.join(output_dir, subdir))
+        except OSError:
+            break  # Not empty.
+        subdir = os.path.dirname(subdir)
+
+
+def build(source_dir, output_dir, replacements=None, jobs=1, cache_dir=None):
+    """Brings the conversion of a tree of documents up to date.
+
+    Args:
+        source_dir: str.  Root of the tree of Markdown documents.
+        output_dir: str.  Directory in which to mirror the source tree.
+            Created if it does not exist.
+        replacements: collection(tuple(str, str)).  List of pairs representing
+            a regular expression to match text and its corresponding
+            replacement.  The replacement can use backreferences.
+        jobs: int.  Number of worker processes to use to convert the
+            documents that changed.
+        cache_dir: str.  Directory of the cache of converted documents to
+            use, or None to convert every changed file.
+
+    Returns:
+        BuildResult.  What the build did.
+
+    Raises:
+        Error: If the source tree does not exist.
+        IOError: If the output tree or the manifest cannot be written.
+        OSError: If the output tree or the manifest cannot be written.
+    """
+    if not os.path.isdir(source_dir):
+        raise Error('%s is not a directory' % source_dir)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    if not isinstance(replacements, replacement.ReplacementSet):
+        replacements = replacement.ReplacementSet(replacements)
+    config_hash = replacements.fingerprint()
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    old_files, valid = _load_manifest(manifest_path, config_hash)
+    new_files = {}
+
+    unchanged = []
+    failures = []
+    work = []
+    sources = {}
+    for relpath in _find_sources(source_dir, output_dir):
+        output_relpath = _output_relpath(relpath)
+        if output_relpath in sources:
+            new_files[relpath] = {}
+            failures.append((relpath, 'Both %s and %s would be written to %s' %
+                             (sources[output_relpath], relpath,
+                              output_relpath)))
+            continue
+        sources[output_relpath] = relpath
+
+        input_path = os.path.join(source_dir, relpath)
+        output_path = os.path.join(output_dir, output_relpath)
+        try:
+            stat = os.stat(input_path)
+            entry = {'mtime': stat.st_mtime, 'size': stat.st_size}
+            old_entry = old_files.get(relpath) if valid else None
+            if old_entry is not None and os.path.exists(output_path):
+                if (old_entry.get('mtime') == entry['mtime'] and
+                        old_entry.get('size') == entry['size']):
+                    new_files[relpath] = old_entry
+                    unchanged.append(relpath)
+                    continue
+                entry['sha1'] = _hash_file(input_path)
+                if old_entry.get('sha1') == entry['sha1']:
+                    new_files[relpath] = entry  # Touched but not modified.
+                    unchanged.append(relpath)
+                    continue
+            else:
+                entry['sha1'] = _hash_file(input_path)
+        except (IOError, OSError) as e:
+            new_files[relpath] = {}  # Remember the output, if any, for later.
+            failures.append((relpath, markdown2social.error_message(e)))
+            continue
+
+        if not os.path.isdir(os.path.dirname(output_path)):
+            os.makedirs(os.path.dirname(output_path))
+        work.append((relpath, entry, (input_path, output_path)))
+
+    results = batch.convert_pairs([pair for _, _, pair in work],
+                                  replacements=replacements, jobs=jobs,
+                                  cache_dir=cache_dir)
+    converted = []
+    for (relpath, entry, _), error in zip(work, results):
+        if error is None:
+            new_files[relpath] = entry
+            converted.append(relpath)
+        else:
+            # An empty entry never matches the source, so the document is
+            # retried by the next build, and still allows its output to be
+            # removed if the document is deleted.
+            new_files[relpath] = {}
+            failures.append((relpath, error))
+
+    removed = []
+    for relpath in sorted(set(old_files) - set(new_files)):
+        if _output_relpath(relpath) in sources:
+            continue  # The output now belongs to another document.
+        _remove_output(output_dir, _output_relpath(relpath))
+        removed.append(relpath)
+
+    if work or removed or new_files != old_files or not valid:
+        _save_manifest(manifest_path, config_hash, new_files)
+
+    return BuildResult(converted=converted, unchanged=unchanged,
+                       removed=removed, failures=sorted(failures))
@@ -0,0 +1,253 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from markdown2social import package
+from markdown2social import tree
+
+
+class BuildTest(unittest.TestCase):
+    """Unit tests for the build function."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.tempdir, 'source')
+        self.output_dir = os.path.join(self.tempdir, 'output')
+        os.mkdir(self.source_dir)
+        self.old_version = package.VERSION
+
+    def tearDown(self):
+        package.VERSION = self.old_version
+        shutil.rmtree(self.tempdir)
+
+    def _write_source(self, relpath, contents):
+        """Creates or overwrites a document in the source tree.
+
+        Args:
+            relpath: str.  Path to the document relative to the source tree.
+            contents: str.  Contents of the document.
+        """
+        path = os.path.join(self.source_dir, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as output:
+            output.write(contents)
+
+    def _read_output(self, relpath):
+        """Reads a file from the output tree.
+
+        Args:
+            relpath: str.  Path to the file relative to the output tree.
+
+        Returns:
+            str.  Contents of the file.
+        """
+        with open(os.path.join(self.output_dir, relpath)) as input_file:
+            return input_file.read()
+
+    def _build(self, replacements=None, jobs=1):
+        """Builds the source tree into the output tree."""
+        return tree.build(self.source_dir, self.output_dir,
+                          replacements=replacements, jobs=jobs)
+
+    def _populate(self):
+        """Writes a few documents into the source tree."""
+        self._write_source('index.md', '# Index\n')
+        self._write_source('_posts/2015-01-01-first.md', 'First post\n')
+        self._write_source('_posts/2015-02-01-second.markdown',
+                           '---\ntitle: Second\n---\nSecond post\n')
+
+    def test_initial_build(self):
+        self._populate()
+        self._write_source('notes.txt', 'Not a document\n')
+        result = self._build()
+        self.assertEquals(['_posts/2015-01-01-first.md',
+                           '_posts/2015-02-01-second.markdown', 'index.md'],
+                          result.converted)
+        self.assertEquals(([], [], []), (result.unchanged, result.removed,
+                                         result.failures))
+
+        self.assertEquals('*Index*\n', self._read_output('index.gplus'))
+        self.assertEquals('First post\n',
+                          self._read_output('_posts/2015-01-01-first.gplus'))
+        self.assertEquals('*Second*\n\nSecond post\n',
+                          self._read_output('_posts/2015-02-01-second.gplus'))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.output_dir, 'notes.gplus')))
+
+        with open(os.path.join(self.output_dir, tree.MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        self.assertEquals(package.VERSION, manifest['version'])
+        self.assertEquals(sorted(result.converted),
+                          sorted(manifest['files'].keys()))
+
+    def test_parallel(self):
+        for i in xrange(6):
+            self._write_source('post%d.md' % i, 'Post %d\n' % i)
+        result = self._build(jobs=3)
+        self.assertEquals(6, len(result.converted))
+        for i in xrange(6):
+            self.assertEquals('Post %d\n' % i,
+                              self._read_output('post%d.gplus' % i))
+
+    def test_noop_build(self):
+        self._populate()
+        self._build()
+        manifest_path = os.path.join(self.output_dir, tree.MANIFEST_NAME)
+        before = os.stat(manifest_path)
+
+        result = self._build()
+        self.assertEquals([], result.converted)
+        self.assertEquals(3, len(result.unchanged))
+        self.assertEquals(before.st_ino, os.stat(manifest_path).st_ino)
+
+    def test_modified_document(self):
+        self._populate()
+        self._build()
+        index_stat = os.stat(os.path.join(self.output_dir, 'index.gplus'))
+
+        self._write_source('_posts/2015-01-01-first.md', 'Edited post\n')
+        result = self._build()
+        self.assertEquals(['_posts/2015-01-01-first.md'], result.converted)
+        self.assertEquals('Edited post\n',
+                          self._read_output('_posts/2015-01-01-first.gplus'))
+        self.assertEquals(
+            index_stat.st_mtime,
+            os.stat(os.path.join(self.output_dir, 'index.gplus')).st_mtime)
+
+    def test_touched_document(self):
+        self._populate()
+        self._build()
+
+        path = os.path.join(self.source_dir, 'index.md')
+        os.utime(path, (1000000000, 1000000000))
+        result = self._build()
+        self.assertEquals([], result.converted)
+        self.assertIn('index.md', result.unchanged)
+
+        with open(os.path.join(self.output_dir, tree.MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        self.assertEquals(1000000000, manifest['files']['index.md']['mtime'])
+
+    def test_removed_document(self):
+        self._populate()
+        self._build()
+
+        os.unlink(os.path.join(self.source_dir, '_posts/2015-01-01-first.md'))
+        os.unlink(os.path.join(self.source_dir,
+                               '_posts/2015-02-01-second.markdown'))
+        result = self._build()
+        self.assertEquals(['_posts/2015-01-01-first.md',
+                           '_posts/2015-02-01-second.markdown'],
+                          result.removed)
+        self.assertEquals([tree.MANIFEST_NAME, 'index.gplus'],
+                          sorted(os.listdir(self.output_dir)))
+
+    def test_deleted_output(self):
+        self._populate()
+        self._build()
+
+        os.unlink(os.path.join(self.output_dir, 'index.gplus'))
+        result = self._build()
+        self.assertEquals(['index.md'], result.converted)
+        self.assertEquals('*Index*\n', self._read_output('index.gplus'))
+
+    def test_config_change(self):
+        self._populate()
+        self._build()
+
+        result = self._build(replacements=[('post', 'entry')])
+        self.assertEquals(3, len(result.converted))
+        self.assertEquals('First entry\n',
+                          self._read_output('_posts/2015-01-01-first.gplus'))
+
+    def test_version_change(self):
+        self._populate()
+        self._build()
+
+        package.VERSION = 'new'
+        result = self._build()
+        self.assertEquals(3, len(result.converted))
+
+    def test_corrupted_manifest(self):
+        self._populate()
+        self._build()
+
+        with open(os.path.join(self.output_dir, tree.MANIFEST_NAME), 'w') as f:
+            f.write('{not json')
+        result = self._build()
+        self.assertEquals(3, len(result.converted))
+
+    def test_failure_is_retried(self):
+        self._write_source('good.md', 'Good\n')
+        self._write_source('bad.md', 'Bad \xff\n')
+        result = self._build()
+        self.assertEquals(['good.md'], result.converted)
+        self.assertEquals(['bad.md'],
+                          [relpath for relpath, _ in result.failures])
+
+        result = self._build()
+        self.assertEquals(['bad.md'],
+                          [relpath for relpath, _ in result.failures])
+
+        self._write_source('bad.md', 'Fixed\n')
+        result = self._build()
+        self.assertEquals(['bad.md'], result.converted)
+        self.assertEquals('Fixed\n', self._read_output('bad.gplus'))
+
+    def test_failed_document_removed(self):
+        self._write_source('post.md', 'Post\n')
+        self._build()
+        self._write_source('post.md', 'Broken \xff\n')
+        self.assertEquals(1, len(self._build().failures))
+
+        os.unlink(os.path.join(self.source_dir, 'post.md'))
+        result = self._build()
+        self.assertEquals(['post.md'], result.removed)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.output_dir, 'post.gplus')))
+
+    def test_duplicate_output(self):
+        self._write_source('post.markdown', 'First\n')
+        self._write_source('post.md', 'Second\n')
+        result = self._build()
+        self.assertEquals(['post.markdown'], result.converted)
+        self.assertEquals(['post.md'],
+                          [relpath for relpath, _ in result.failures])
+        self.assertEquals('First\n', self._read_output('post.gplus'))
+
+    def test_ignores_hidden_and_output_dirs(self):
+        self.output_dir = os.path.join(self.source_dir, '_site')
+        self._write_source('post.md', 'Post\n')
+        self._write_source('.git/README.md', 'Hidden\n')
+        self._build()
+
+        self._write_source('_site/copy.md', 'Inside the output\n')
+        result = self._build()
+        self.assertEquals([], result.converted)
+        self.assertEquals(['post.md'], result.unchanged)
+
+    def test_missing_source_dir(self):
+        self.assertRaises(tree.Error, tree.build,
+                          os.path.join(self.tempdir, 'missing'),
+                          self.output_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
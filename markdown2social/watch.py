@@ -0,0 +1,349 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Reconversion of documents as they change on disk.
+
+The watcher monitors the directories that contain the input files rather than
+the files themselves because most editors save a document by writing a new
+file and renaming it over the old one, which would orphan a watch placed on
+the original file.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+import markdown2social
+from markdown2social import converter
+from markdown2social import fileio
+from markdown2social import front_matter
+
+
+# int.  Flags for inotify_init1() and inotify_add_watch() from sys/inotify.h.
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+
+# int.  Flags of inotify events from sys/inotify.h that report on the state
+# of the watches rather than on changes to files.
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+
+# str.  Format of the fixed-size header of an inotify event.
+_EVENT_HEADER_FORMAT = 'iIII'
+
+# int.  Size of the fixed-size header of an inotify event.
+_EVENT_HEADER_SIZE = struct.calcsize(_EVENT_HEADER_FORMAT)
+
+# float.  Default quiet period in seconds to wait for after a change before
+# reconverting, so that a burst of writes to a file triggers one conversion.
+DEFAULT_DEBOUNCE = 0.005
+
+# float.  Default interval in seconds between checks of the inputs when
+# inotify is not available.
+DEFAULT_POLL_INTERVAL = 0.25
+
+
+class Error(Exception):
+    """Base class for exceptions raised by this module."""
+
+
+class _InotifyMonitor(object):
+    """Waits for changes to files using the Linux inotify interface.
+
+    If the kernel drops events because its queue overflowed, the monitor
+    reports that any of the files may have changed.  If a watched directory
+    goes away, for example because it was deleted or unmounted, the monitor
+    falls back to polling since it can no longer tell when the files change.
+    """
+
+    def __init__(self, paths, poll_interval=DEFAULT_POLL_INTERVAL):
+        """Constructor.
+
+        Args:
+            paths: list(str).  Paths to the files to monitor.
+            poll_interval: float.  Time in seconds between checks of the files
+                once the monitor falls back to polling.
+
+        Raises:
+            Error: If inotify is not available.
+        """
+        libc_name = ctypes.util.find_library('c')
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+            inotify_init1 = libc.inotify_init1
+            self._add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise Error('inotify is not available: %s' % e)
+
+        self._fd = inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise Error('inotify_init1 failed: %s' %
+                        os.strerror(ctypes.get_errno()))
+
+        self._poll_interval = poll_interval
+
+        # _PollingMonitor.  Monitor to use instead of inotify once a watch is
+        # lost, or None while all the watches are active.
+        self._fallback = None
+
+        # Names of the monitored files in each watched directory, keyed by
+        # the watch descriptor of the directory.
+        self._names = {}
+        # Paths to the watched directories, keyed by their watch descriptor.
+        self._directories = {}
+        try:
+            directories = {}
+            for path in paths:
+                directory, name = os.path.split(os.path.abspath(path))
+                directories.setdefault(directory, set()).add(name)
+            for directory, names in directories.iteritems():
+                descriptor = self._add_watch(
+                    self._fd, directory,
+                    _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE |
+                    _IN_DELETE)
+                if descriptor < 0:
+                    raise Error('Cannot watch %s: %s' % (
+                        directory, os.strerror(ctypes.get_errno())))
+                self._names[descriptor] = names
+                self._directories[descriptor] = directory
+        except:
+            os.close(self._fd)
+            raise
+
+    def close(self):
+        """Releases the resources held by the monitor."""
+        os.close(self._fd)
+
+    def wait(self, timeout):
+        """Waits for any of the monitored files to change.
+
+        Args:
+            timeout: float.  Maximum time to wait in seconds.
+
+        Returns:
+            bool.  True if any of the files may have changed.
+        """
+        if self._fallback is not None:
+            return self._fallback.wait(timeout)
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            try:
+                readable, _, _ = select.select([self._fd], [], [], remaining)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if readable and self._read_events():
+                return True
+
+    def _read_events(self):
+        """Reads all pending events.
+
+        Returns:
+            bool.  True if any event refers to a monitored file, or if events
+            may have been lost.
+        """
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return relevant
+                raise
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, _, length = struct.unpack_from(
+                    _EVENT_HEADER_FORMAT, data, offset)
+                offset += _EVENT_HEADER_SIZE
+                name = data[offset:offset + length].rstrip('\0')
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    relevant = True
+                elif mask & _IN_IGNORED and descriptor in self._names:
+                    del self._names[descriptor]
+                    self._lose_watch(self._directories.pop(descriptor))
+                    relevant = True
+                elif name in self._names.get(descriptor, ()):
+                    relevant = True
+
+    def _lose_watch(self, directory):
+        """Falls back to polling after the kernel removed a watch.
+
+        Args:
+            directory: str.  Path to the directory that is no longer watched.
+        """
+        if self._fallback is None:
+            markdown2social.get_logger().warning(
+                'Stopped watching %s; falling back to polling', directory)
+            self._fallback = _PollingMonitor(self._poll_interval)
+
+
+class _PollingMonitor(object):
+    """Waits for changes to files by periodically checking them."""
+
+    def __init__(self, interval):
+        """Constructor.
+
+        Args:
+            interval: float.  Time in seconds between checks.
+        """
+        self._interval = interval
+
+    def close(self):
+        """Releases the resources held by the monitor."""
+
+    def wait(self, timeout):
+        """Waits for any of the monitored files to change.
+
+        Args:
+            timeout: float.  Maximum time to wait in seconds.
+
+        Returns:
+            bool.  True if any of the files may have changed, which is always
+            the case once the polling interval elapses.
+        """
+        if timeout < self._interval:
+            time.sleep(timeout)
+            return False
+        time.sleep(self._interval)
+        return True
+
+
+def _signature(path):
+    """Computes a value that changes whenever a file is modified.
+
+    Args:
+        path: str.  Path to the file.
+
+    Returns:
+        tuple.  The signature of the file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+class Watcher(object):
+    """Keeps a set of output files up to date with their inputs."""
+
+    def __init__(self, pairs, replacements=None, use_inotify=True,
+                 debounce=DEFAULT_DEBOUNCE,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        """Constructor.
+
+        Args:
+            pairs: list(tuple(str, str)).  Paths to the input files and to the
+                output files to keep up to date.
+            replacements: collection(tuple(str, str)).  List of pairs
+                representing a regular expression to match text and its
+                corresponding replacement.  The replacement can use
+                backreferences.
+            use_inotify: bool.  Whether to try to use inotify.  If False, or
+                if inotify is not available, the inputs are polled.
+            debounce: float.  Quiet period in seconds to wait for after a
+                change before reconverting.
+            poll_interval: float.  Time in seconds between checks of the
+                inputs when polling.
+        """
+        self._pairs = list(pairs)
+        self._converter = converter.Converter(replacements=replacements)
+        self._debounce = debounce
+        self._signatures = {}
+
+        self._monitor = None
+        if use_inotify:
+            try:
+                self._monitor = _InotifyMonitor(
+                    [input_path for input_path, _ in self._pairs],
+                    poll_interval=poll_interval)
+            except Error as e:
+                markdown2social.get_logger().info(
+                    'Falling back to polling: %s', e)
+        if self._monitor is None:
+            self._monitor = _PollingMonitor(poll_interval)
+
+    def close(self):
+        """Releases the resources held by the watcher."""
+        self._monitor.close()
+
+    def _convert(self, input_path, output_path):
+        """Converts a single file.
+
+        Args:
+            input_path: str.  Path to the input file.
+            output_path: str.  Path to the output file.
+
+        Returns:
+            str.  An error message describing why the conversion failed, or
+            None if it succeeded.
+        """
+        try:
+            metadata, content = front_matter.parse(
+                fileio.read_file(input_path), keys=converter.METADATA_KEYS)
+            gplus = self._converter.convert(metadata, content)
+            fileio.replace_file(output_path, gplus)
+        except Exception as e:  # pylint: disable=broad-except
+            # A document that is temporarily broken while being edited must
+            # not stop the watcher.
+            return markdown2social.error_message(e)
+        return None
+
+    def update(self):
+        """Reconverts the inputs that changed since the last update.
+
+        Returns:
+            list(tuple(str, str)).  The input files that were converted along
+            with an error message if their conversion failed or None.
+        """
+        results = []
+        for input_path, output_path in self._pairs:
+            signature = _signature(input_path)
+            if signature is None or signature == self._signatures.get(
+                    input_path):
+                continue
+            self._signatures[input_path] = signature
+            results.append((input_path,
+                            self._convert(input_path, output_path)))
+        return results
+
+    def wait(self, timeout):
+        """Waits for the inputs to change and reconverts them.
+
+        Args:
+            timeout: float.  Maximum time to wait for a change in seconds.
+
+        Returns:
+            list(tuple(str, str)).  The result of update(), which is empty if
+            nothing changed.
+        """
+        if not self._monitor.wait(timeout):
+            return []
+        while self._monitor.wait(self._debounce):
+            pass  # Wait for the burst of changes to settle.
+        return self.update()
@@ -0,0 +1,171 @@
+# Copyright 2015 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy
+# of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import fcntl
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+
+from markdown2social import watch
+
+
+class WatcherTest(unittest.TestCase):
+    """Unit tests for the Watcher class."""
+
+    # bool.  Whether the watcher under test uses inotify.
+    USE_INOTIFY = True
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.pairs = []
+        for name in ('first', 'second'):
+            input_path = os.path.join(self.tempdir, name + '.md')
+            with open(input_path, 'w') as output:
+                output.write('# %s\n' % name)
+            self.pairs.append(
+                (input_path, os.path.join(self.tempdir, name + '.gplus')))
+        self.watcher = watch.Watcher(self.pairs, replacements=[('s', 'S')],
+                                     use_inotify=self.USE_INOTIFY,
+                                     poll_interval=0.05)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.tempdir)
+
+    def _read(self, path):
+        """Reads the contents of a file."""
+        with open(path) as input_file:
+            return input_file.read()
+
+    def _wait(self):
+        """Waits for the watcher to reconvert any file.
+
+        Returns:
+            list(tuple(str, str)).  The result of the first non-empty wait.
+        """
+        for _ in xrange(50):
+            results = self.watcher.wait(0.1)
+            if results:
+                return results
+        self.fail('No changes detected')
+
+    def test_update__initial(self):
+        self.assertEquals([(input_path, None) for input_path, _ in self.pairs],
+                          self.watcher.update())
+        self.assertEquals('*firSt*\n', self._read(self.pairs[0][1]))
+        self.assertEquals('*Second*\n', self._read(self.pairs[1][1]))
+        self.assertEquals([], self.watcher.update())
+
+    def test_wait__only_changed_file(self):
+        self.watcher.update()
+        first_inode = os.stat(self.pairs[0][1]).st_ino
+
+        time.sleep(0.01)  # Ensure the modification time changes.
+        with open(self.pairs[1][0], 'w') as output:
+            output.write('Some *text*\n')
+        self.assertEquals([(self.pairs[1][0], None)], self._wait())
+        self.assertEquals('Some _text_\n', self._read(self.pairs[1][1]))
+        self.assertEquals(first_inode, os.stat(self.pairs[0][1]).st_ino)
+
+    def test_wait__rename_over_input(self):
+        self.watcher.update()
+
+        temp_path = os.path.join(self.tempdir, '.first.md.swp')
+        with open(temp_path, 'w') as output:
+            output.write('Saved by an editor\n')
+        os.rename(temp_path, self.pairs[0][0])
+        self.assertEquals([(self.pairs[0][0], None)], self._wait())
+        self.assertEquals('Saved by an editor\n', self._read(self.pairs[0][1]))
+
+    def test_wait__debounces_bursts(self):
+        self.watcher.update()
+
+        with open(self.pairs[0][0], 'w') as output:
+            for i in xrange(10):
+                output.write('Line %d\n' % i)
+                output.flush()
+        self.assertEquals([(self.pairs[0][0], None)], self._wait())
+        self.assertEquals(' '.join('Line %d' % i for i in xrange(10)) + '\n',
+                          self._read(self.pairs[0][1]))
+
+    def test_wait__timeout(self):
+        self.watcher.update()
+        self.assertEquals([], self.watcher.wait(0.1))
+
+    def test_wait__conversion_error(self):
+        self.watcher.update()
+
+        with open(self.pairs[0][0], 'wb') as output:
+            output.write('Invalid \xff UTF-8\n')
+        results = self._wait()
+        self.assertEquals(1, len(results))
+        self.assertEquals(self.pairs[0][0], results[0][0])
+        self.assertIsNotNone(results[0][1])
+        self.assertEquals('*firSt*\n', self._read(self.pairs[0][1]))
+
+    def test_missing_input(self):
+        os.unlink(self.pairs[0][0])
+        self.assertEquals([(self.pairs[1][0], None)], self.watcher.update())
+        self.assertFalse(os.path.exists(self.pairs[0][1]))
+
+
+class InotifyMonitorTest(unittest.TestCase):
+    """Unit tests for the handling of lost events by _InotifyMonitor."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.subdir = os.path.join(self.tempdir, 'subdir')
+        os.mkdir(self.subdir)
+        self.monitor = watch._InotifyMonitor(
+            [os.path.join(self.subdir, 'input.md')], poll_interval=0.05)
+
+    def tearDown(self):
+        self.monitor.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_unrelated_file(self):
+        with open(os.path.join(self.subdir, 'other.md'), 'w') as output:
+            output.write('Other\n')
+        self.assertFalse(self.monitor.wait(0.1))
+
+    def test_queue_overflow(self):
+        read_fd, write_fd = os.pipe()
+        os.close(self.monitor._fd)
+        self.monitor._fd = read_fd
+        fcntl.fcntl(read_fd, fcntl.F_SETFL, os.O_NONBLOCK)
+        try:
+            os.write(write_fd, struct.pack(watch._EVENT_HEADER_FORMAT, -1,
+                                           watch._IN_Q_OVERFLOW, 0, 0))
+            self.assertTrue(self.monitor.wait(0.1))
+        finally:
+            os.close(write_fd)
+
+    def test_watched_directory_removed(self):
+        shutil.rmtree(self.subdir)
+        self.assertTrue(self.monitor.wait(1))
+        # Polling reports possible changes once the interval elapses.
+        self.assertTrue(self.monitor.wait(0.1))
+
+
+class PollingWatcherTest(WatcherTest):
+    """Unit tests for the Watcher class when polling for changes."""
+
+    USE_INOTIFY = False
+
+
+if __name__ == '__main__':
+    unittest.main()
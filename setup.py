@@ -92,7 +92,7 @@ setup(
     keywords='markdown converter googleplus social',
     license='Apache',
 
-    packages=['markdown2social'],
+    packages=['markdown2social', 'markdown2social.benchmarks'],
     scripts=['scripts/markdown2social'],
 
     requires=read_requirements('requirements.txt'),